@@ -1,303 +1,67 @@
-from flask import Flask, render_template, request, jsonify
-import requests
+from flask import Flask, render_template, request, jsonify, Response
 import json
-from config import Config, AMAP_KEY, DEEPSEEK_API_KEY
-from openai import OpenAI
-from datetime import datetime
-import weather
-import re
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import threading
+from config import Config
+import orchestrator
+import http_client
+import metrics
+import response_cache
+import compression
+import prewarm
+import jobs
+import bulk
+import startup
+from log_config import setup_logging
+from planner import TripPlanner
+
+setup_logging(Config.LOG_LEVEL)
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
-# 初始化DeepSeek客户端
-client = OpenAI(
-    api_key=DEEPSEEK_API_KEY,
-    base_url="https://api.deepseek.com"
-)
+_planner = None
+_planner_lock = threading.Lock()
 
-class TripPlanner:
-    """旅游规划器类，负责处理天气、行程生成和路线规划等功能"""
-    
-    def __init__(self):
-        """初始化旅游规划器"""
-        self.amap_key = AMAP_KEY
-        # 创建带有重试机制的session
-        self.session = requests.Session()
-        retry_strategy = Retry(
-            total=3,  # 最大重试次数
-            backoff_factor=1,  # 重试间隔
-            status_forcelist=[500, 502, 503, 504]  # 需要重试的HTTP状态码
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        self.session.mount("http://", adapter)
-        self.session.mount("https://", adapter)
-        # 禁用SSL验证，解决SSL连接问题
-        self.session.verify = False
-
-    def get_weather_forecast(self, location):
-        """
-        获取指定城市的天气信息
-        
-        参数:
-            location (str): 城市名称
-            
-        返回:
-            str: 天气信息，如果获取失败则返回None
-        """
-        try:
-            weather_data = weather.get_weather(location)
-            return weather_data
-        except Exception as e:
-            print(f"获取天气信息失败: {str(e)}")
-            return None
-
-    def generate_itinerary(self, location, interests, dietary_preferences):
-        """
-        使用DeepSeek生成个性化行程
-        
-        参数:
-            location (str): 城市名称
-            interests (str): 用户兴趣
-            dietary_preferences (str): 饮食偏好
-            
-        返回:
-            str: 生成的行程，如果生成失败则返回None
-        """
-        try:
-            # 构建提示词
-            prompt = f"""
-            基于以下信息，生成一个完美的一日游行程：
-            地点：{location}
-            兴趣：{interests}
-            饮食偏好：{dietary_preferences}
-            
-            请按照以下格式生成行程：
-
-            ### 完美一日游行程规划
-
-            # 上午行程
-            [景点1]
-            - 游览时间：[具体时间]
-            - 简介：[景点介绍]
-            - 交通建议：[如何到达]
-
-            [景点2]
-            - 游览时间：[具体时间]
-            - 简介：[景点介绍]
-            - 交通建议：[如何到达]
-
-            # 午餐
-            [餐厅1]
-            - 用餐时间：[具体时间]
-            - 推荐菜品：[特色菜品]
-            - 交通建议：[如何到达]
-
-            # 下午行程
-            [景点3]
-            - 游览时间：[具体时间]
-            - 简介：[景点介绍]
-            - 交通建议：[如何到达]
-
-            [景点4]
-            - 游览时间：[具体时间]
-            - 简介：[景点介绍]
-            - 交通建议：[如何到达]
-
-            # 晚餐
-            [餐厅2]
-            - 用餐时间：[具体时间]
-            - 推荐菜品：[特色菜品]
-            - 交通建议：[如何到达]
-
-            # 晚间行程（可选）
-            [景点5]
-            - 游览时间：[具体时间]
-            - 简介：[景点介绍]
-            - 交通建议：[如何到达]
-
-            # 交通总建议
-            - 提供该城市的整体交通建议
-            - 包括公共交通、打车、步行等建议
-            - 可以推荐交通APP或实用工具
-
-            注意事项：
-            1. 请确保每个景点和餐厅都用【】标注，这样我可以提取它们进行路线规划
-            2. 时间安排要合理，考虑交通时间
-            3. 景点之间要相对集中，减少不必要的奔波
-            4. 交通建议要具体且实用
-            5. 推荐当地特色美食和必去景点
-            """
-            
-            # 调用DeepSeek API生成行程
-            response = client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": "你是一个专业的旅游规划师，擅长规划合理且有趣的行程。"},
-                    {"role": "user", "content": prompt}
-                ],
-                stream=False
-            )
-            
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"生成行程失败: {str(e)}")
-            return None
+def get_planner():
+    """获取进程内共享的旅游规划器，首次使用时创建，预热与线上请求共用同一个规划器"""
+    global _planner
+    if _planner is None:
+        with _planner_lock:
+            if _planner is None:
+                _planner = TripPlanner()
+                prewarm.get_prewarmer(_planner)
+    return _planner
 
-    def extract_locations(self, itinerary):
-        """
-        从行程文本中提取地点名称
-        
-        参数:
-            itinerary (str): 行程文本
-            
-        返回:
-            list: 提取的地点名称列表
-        """
-        if not itinerary:
-            return []
-        
-        # 使用正则表达式提取【】中的地点，排除重复
-        locations = list(set(re.findall(r'【(.*?)】', itinerary)))
-        
-        # 过滤掉空字符串和太短的地点名称
-        locations = [loc for loc in locations if loc and len(loc) > 1]
-        
-        print(f"提取的地点: {locations}")  # 调试信息
-        return locations
+def start_background():
+    """启动预热调度和异步规划任务的工作线程"""
+    planner = get_planner()
+    prewarm.start_scheduler()
+    jobs.start_workers(planner)
 
-    def get_route_planning(self, locations):
-        """
-        使用高德地图API规划路线
-        
-        参数:
-            locations (list): 地点名称列表
-            
-        返回:
-            dict: 路线规划结果，包含错误信息或路线详情
-        """
-        try:
-            # 检查地点数量
-            if not locations or len(locations) < 2:
-                return {"error": "需要至少两个地点才能规划路线"}
-            
-            coordinates = []  # 存储地点坐标
-            failed_locations = []  # 存储获取失败的地点
-            
-            # 高德地图地理编码API地址
-            geocode_url = "https://restapi.amap.com/v3/geocode/geo"
-            
-            # 遍历地点列表，获取每个地点的坐标
-            for location in locations:
-                # 构建搜索参数
-                params = {
-                    'key': self.amap_key,
-                    'address': f"苏州市{location}",
-                    'city': '苏州',
-                    'extensions': 'all'  # 获取更详细的信息
-                }
-                
-                print(f"正在搜索地点: {location}")  # 调试信息
-                
-                try:
-                    # 发送地理编码请求
-                    response = self.session.get(geocode_url, params=params, timeout=10)
-                    result = response.json()
-                    
-                    if result['status'] == '1' and result['geocodes']:
-                        # 获取最匹配的结果
-                        best_match = result['geocodes'][0]
-                        location_coord = best_match['location']
-                        coordinates.append(location_coord)
-                        print(f"成功获取坐标: {location} -> {location_coord}")
-                        print(f"地点详情: {best_match['formatted_address']}")  # 打印详细地址
-                    else:
-                        # 尝试不带"苏州市"前缀重新搜索
-                        params['address'] = location
-                        response = self.session.get(geocode_url, params=params, timeout=10)
-                        result = response.json()
-                        
-                        if result['status'] == '1' and result['geocodes']:
-                            best_match = result['geocodes'][0]
-                            location_coord = best_match['location']
-                            coordinates.append(location_coord)
-                            print(f"成功获取坐标(第二次尝试): {location} -> {location_coord}")
-                            print(f"地点详情: {best_match['formatted_address']}")
-                        else:
-                            failed_locations.append(location)
-                            print(f"无法获取地点坐标: {location}, API响应: {result}")
-                except Exception as e:
-                    print(f"获取地点坐标时发生错误: {str(e)}")
-                    failed_locations.append(location)
-            
-            # 检查是否有获取失败的地点
-            if failed_locations:
-                return {
-                    "error": f"无法获取以下地点的坐标: {', '.join(failed_locations)}",
-                    "locations": locations
-                }
-            
-            # 检查是否获取到足够的坐标
-            if len(coordinates) < 2:
-                return {
-                    "error": "无法获取足够的地点坐标来规划路线",
-                    "locations": locations
-                }
-            
-            # 调用高德地图API规划路线
-            route_url = "https://restapi.amap.com/v3/direction/driving"
-            params = {
-                'key': self.amap_key,
-                'origin': coordinates[0],  # 起点坐标
-                'destination': coordinates[-1],  # 终点坐标
-                'waypoints': '|'.join(coordinates[1:-1]) if len(coordinates) > 2 else '',  # 途经点坐标
-                'extensions': 'all'  # 获取详细信息
-            }
-            
-            print(f"路线规划参数: {params}")
-            
-            try:
-                # 发送路线规划请求
-                response = self.session.get(route_url, params=params, timeout=10)
-                route_data = response.json()
-                
-                # 添加地点名称到路线数据中
-                if route_data['status'] == '1':
-                    route_data['locations'] = locations
-                    # 添加起点和终点名称到路线步骤中
-                    if 'route' in route_data and 'paths' in route_data['route']:
-                        for path in route_data['route']['paths']:
-                            if 'steps' in path:
-                                for i, step in enumerate(path['steps']):
-                                    # 为每个步骤添加起点和终点名称
-                                    if i < len(locations) - 1:
-                                        step['start_location'] = locations[i]
-                                        step['end_location'] = locations[i + 1]
-                                    else:
-                                        step['start_location'] = locations[-2]
-                                        step['end_location'] = locations[-1]
-                
-                return route_data
-            except Exception as e:
-                print(f"路线规划请求失败: {str(e)}")
-                return {
-                    "error": f"路线规划请求失败: {str(e)}",
-                    "locations": locations
-                }
-                
-        except Exception as e:
-            print(f"路线规划失败: {str(e)}")
-            return {
-                "error": f"路线规划失败: {str(e)}",
-                "locations": locations
-            }
+# 预加载应用时规划器和后台线程推迟到每个工作进程fork后创建
+startup.in_worker(start_background)
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def plan_response(body, etag, cache_status):
+    """返回序列化好的规划结果，按Accept-Encoding压缩，客户端持有相同ETag时返回304"""
+    encoding = compression.response_encoding(body, request.headers.get('Accept-Encoding'))
+    if response_cache.etag_matches(request.headers.get('If-None-Match'), etag):
+        response = Response(status=304)
+    elif encoding:
+        response = Response(compression.compress(body, encoding), mimetype=response_cache.JSON_MIMETYPE)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = Response(body, mimetype=response_cache.JSON_MIMETYPE)
+    # 压缩后的字节与原始字节不同，使用弱ETag，任一编码都能用它重新验证
+    response.headers['ETag'] = f'W/"{etag}"' if encoding else f'"{etag}"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if cache_status:
+        response.headers['X-Cache'] = cache_status
+    return response
+
 @app.route('/plan_trip', methods=['POST'])
 def plan_trip():
     # 获取请求数据
@@ -305,28 +69,118 @@ def plan_trip():
     location = data.get('location')
     interests = data.get('interests')
     dietary_preferences = data.get('dietary_preferences')
+    days = data.get('days', 1)
     
-    # 创建旅游规划器实例
-    planner = TripPlanner()
+    # 相同的请求直接返回缓存的响应字节
+    key = response_cache.make_key(data)
+    cached = response_cache.lookup(key)
+    if cached is not None:
+        return plan_response(*cached, 'HIT')
     
-    # 获取天气信息
-    weather_info = planner.get_weather_forecast(location)
+    # 并发获取天气、生成行程并规划路线
+    result = orchestrator.run_plan(get_planner(), location, interests, dietary_preferences, days)
     
-    # 生成行程
-    itinerary = planner.generate_itinerary(location, interests, dietary_preferences)
+    # 返回结果
+    with metrics.span('serialize'):
+        body, etag = response_cache.respond(key, result)
+    return plan_response(body, etag, 'MISS')
+
+@app.route('/plan_trip_stream', methods=['POST'])
+def plan_trip_stream():
+    """以Server-Sent Events的形式流式返回行程、地点坐标、天气和路线"""
+    # 获取请求数据
+    data = request.json
+    location = data.get('location')
+    interests = data.get('interests')
+    dietary_preferences = data.get('dietary_preferences')
     
-    # 从行程中提取地点
-    locations = planner.extract_locations(itinerary)
+    key = response_cache.make_key(data, 'stream')
     
-    # 规划路线
-    route = planner.get_route_planning(locations) if locations else {"error": "无法提取地点信息"}
+    # 客户端保存的流式结果仍在缓存中时返回304，不再重新生成
+    cached = response_cache.lookup(key)
+    if cached is not None and response_cache.etag_matches(request.headers.get('If-None-Match'), cached[1]):
+        return Response(status=304, headers={'ETag': f'"{cached[1]}"', 'Cache-Control': 'no-cache'})
     
-    # 返回结果
-    return jsonify({
-        'weather': weather_info,
-        'itinerary': itinerary,
-        'route': route
+    def generate():
+        events = []
+        for event, payload in orchestrator.stream_plan(get_planner(), location, interests, dietary_preferences):
+            events.append((event, payload))
+            if event == 'done':
+                # 缓存完整结果，done事件带上ETag供前端之后重新验证
+                payload = dict(payload, etag=response_cache.store_events(key, events))
+            yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # 禁止反向代理缓冲
     })
 
+@app.route('/plan_trips', methods=['POST'])
+def plan_trips():
+    """批量规划，按完成顺序逐行返回NDJSON"""
+    try:
+        items = bulk.parse_items(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return Response(bulk.stream(get_planner(), items), mimetype=bulk.NDJSON_MIMETYPE, headers={
+        'X-Accel-Buffering': 'no'  # 禁止反向代理缓冲
+    })
+
+@app.route('/plans', methods=['POST'])
+def create_plan():
+    """提交异步规划任务，立即返回任务ID；参数相同的任务进行中时返回该任务"""
+    try:
+        job, created = jobs.submit(request.json)
+    except jobs.JobQueueFull as e:
+        response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    response = jsonify(dict(jobs.view(job), deduplicated=not created))
+    response.headers['Location'] = f"/plans/{job['id']}"
+    return response, 200 if job['status'] == jobs.DONE else 202
+
+@app.route('/plans/<job_id>')
+def get_plan(job_id):
+    """查询任务：完成时返回规划结果，否则返回任务状态；?wait=秒数 时等待任务结束"""
+    wait = request.args.get('wait', type=float)
+    job = jobs.wait(job_id, wait) if wait else jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    if job['status'] == jobs.DONE:
+        return plan_response(job['body'], job['etag'], None)
+    if job['status'] == jobs.FAILED:
+        return jsonify(jobs.view(job)), 500
+    response = jsonify(jobs.view(job))
+    response.headers['Retry-After'] = '1'
+    return response, 202
+
+@app.route('/pool_stats')
+def pool_stats():
+    """返回HTTP连接池的使用情况"""
+    return jsonify(http_client.pool_stats())
+
+@app.route('/prewarm', methods=['GET', 'POST'])
+def prewarm_status():
+    """POST触发一轮缓存预热，GET返回预热状态和预热条目服务线上请求的情况"""
+    if not prewarm.authorized(request.headers.get('X-Admin-Token'), request.remote_addr):
+        return jsonify({'error': '无权访问'}), 403
+    # 确保预热器使用共享的规划器
+    get_planner()
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({'error': '请求体必须是JSON对象'}), 400
+        try:
+            started = prewarm.start(data.get('cities'), data.get('combos'), data.get('budget'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(prewarm.status()), 202 if started else 409
+    return jsonify(prewarm.status())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """以Prometheus文本格式输出性能指标"""
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,216 @@
+"""
+ASGI服务入口
+
+以异步方式提供与app.py相同的接口，每个进行中的规划只占用一个协程，
+适合大量并发的长耗时请求。同步的Flask应用仍可通过 python app.py 使用。
+
+运行:
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+"""
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import async_planner
+import http_client
+import metrics
+import response_cache
+import compression
+import prewarm
+import jobs
+import bulk
+from async_planner import AsyncTripPlanner
+from config import Config
+from planner import TripPlanner
+from log_config import setup_logging
+
+setup_logging(Config.LOG_LEVEL)
+
+# 进程内共享的异步旅游规划器实例
+planner = AsyncTripPlanner()
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'index.html'), encoding='utf-8') as f:
+    INDEX_HTML = f.read()
+
+
+async def index(request):
+    return HTMLResponse(INDEX_HTML)
+
+
+def plan_response(request, body, etag, cache_status):
+    """返回序列化好的规划结果，按Accept-Encoding压缩，客户端持有相同ETag时返回304"""
+    encoding = compression.response_encoding(body, request.headers.get('accept-encoding'))
+    # 压缩后的字节与原始字节不同，使用弱ETag，任一编码都能用它重新验证
+    headers = {
+        'ETag': f'W/"{etag}"' if encoding else f'"{etag}"',
+        'Vary': 'Accept-Encoding'
+    }
+    if cache_status:
+        headers['X-Cache'] = cache_status
+    if response_cache.etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+        body = compression.compress(body, encoding)
+    return Response(body, media_type=response_cache.JSON_MIMETYPE, headers=headers)
+
+
+async def plan_trip(request):
+    # 获取请求数据
+    data = await request.json()
+
+    # 相同的请求直接返回缓存的响应字节；缓存可能是Redis，在线程中查询和写入，不阻塞事件循环
+    key = response_cache.make_key(data)
+    cached = await asyncio.to_thread(response_cache.lookup, key)
+    if cached is not None:
+        return plan_response(request, *cached, 'HIT')
+
+    result = await async_planner.run_plan(
+        planner, data.get('location'), data.get('interests'), data.get('dietary_preferences'), data.get('days', 1)
+    )
+    with metrics.span('serialize'):
+        body, etag = await asyncio.to_thread(response_cache.respond, key, result)
+    return plan_response(request, body, etag, 'MISS')
+
+
+async def plan_trip_stream(request):
+    """以Server-Sent Events的形式流式返回行程、地点坐标、天气和路线"""
+    data = await request.json()
+    key = response_cache.make_key(data, 'stream')
+
+    # 客户端保存的流式结果仍在缓存中时返回304，不再重新生成
+    cached = await asyncio.to_thread(response_cache.lookup, key)
+    if cached is not None and response_cache.etag_matches(request.headers.get('if-none-match'), cached[1]):
+        return Response(status_code=304, headers={'ETag': f'"{cached[1]}"', 'Cache-Control': 'no-cache'})
+
+    async def generate():
+        events = []
+        async for event, payload in async_planner.stream_plan(
+            planner, data.get('location'), data.get('interests'), data.get('dietary_preferences')
+        ):
+            events.append((event, payload))
+            if event == 'done':
+                # 缓存完整结果，done事件带上ETag供前端之后重新验证
+                payload = dict(payload, etag=await asyncio.to_thread(response_cache.store_events, key, events))
+            yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # 禁止反向代理缓冲
+    })
+
+
+async def plan_trips(request):
+    """批量规划，按完成顺序逐行返回NDJSON"""
+    try:
+        items = bulk.parse_items(await request.json())
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    # 批量规划在线程中使用同步规划器，逐行产出的结果由Starlette在线程池中迭代
+    return StreamingResponse(bulk.stream(request.app.state.sync_planner, items), media_type=bulk.NDJSON_MIMETYPE,
+                             headers={'X-Accel-Buffering': 'no'})
+
+
+async def create_plan(request):
+    """提交异步规划任务，立即返回任务ID；参数相同的任务进行中时返回该任务"""
+    data = await request.json()
+    try:
+        job, created = await asyncio.to_thread(jobs.submit, data)
+    except jobs.JobQueueFull as e:
+        return JSONResponse({'error': str(e), 'retry_after': e.retry_after}, status_code=429,
+                            headers={'Retry-After': str(e.retry_after)})
+    # 排队任务的位置要查询任务表，与提交一样在线程中执行
+    view = await asyncio.to_thread(jobs.view, job)
+    return JSONResponse(dict(view, deduplicated=not created),
+                        status_code=200 if job['status'] == jobs.DONE else 202,
+                        headers={'Location': f"/plans/{job['id']}"})
+
+
+async def get_plan(request):
+    """查询任务：完成时返回规划结果，否则返回任务状态；?wait=秒数 时等待任务结束"""
+    job_id = request.path_params['job_id']
+    try:
+        wait = float(request.query_params.get('wait') or 0)
+    except ValueError:
+        wait = 0
+    deadline = time.monotonic() + min(wait, Config.JOB_WAIT_MAX)
+    while True:
+        job = await asyncio.to_thread(jobs.get, job_id)
+        if job is None or job['status'] in (jobs.DONE, jobs.FAILED) or time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(Config.JOB_POLL_INTERVAL)
+    if job is None:
+        return JSONResponse({'error': '任务不存在或已过期'}, status_code=404)
+    if job['status'] == jobs.DONE:
+        return plan_response(request, job['body'], job['etag'], None)
+    view = await asyncio.to_thread(jobs.view, job)
+    if job['status'] == jobs.FAILED:
+        return JSONResponse(view, status_code=500)
+    return JSONResponse(view, status_code=202, headers={'Retry-After': '1'})
+
+
+async def pool_stats(request):
+    """返回异步连接池和同步连接池的使用情况"""
+    return JSONResponse({'async': planner.pool_stats(), 'sync': http_client.pool_stats()})
+
+
+async def prewarm_status(request):
+    """POST触发一轮缓存预热，GET返回预热状态和预热条目服务线上请求的情况"""
+    if not prewarm.authorized(request.headers.get('x-admin-token'), request.client.host if request.client else None):
+        return JSONResponse({'error': '无权访问'}, status_code=403)
+    if request.method == 'POST':
+        try:
+            data = await request.json()
+        except ValueError:
+            data = {}
+        if not isinstance(data, dict):
+            return JSONResponse({'error': '请求体必须是JSON对象'}, status_code=400)
+        # 预热在后台线程中使用同步规划器，写入的缓存与异步规划器共享
+        try:
+            started = prewarm.start(data.get('cities'), data.get('combos'), data.get('budget'))
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+        return JSONResponse(prewarm.status(), status_code=202 if started else 409)
+    return JSONResponse(prewarm.status())
+
+
+async def prometheus_metrics(request):
+    """以Prometheus文本格式输出性能指标"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # 批量规划、异步任务和预热在线程中使用同一个同步规划器，写入的缓存与异步规划器共享
+    app.state.sync_planner = TripPlanner()
+    prewarm.get_prewarmer(app.state.sync_planner)
+    prewarm.start_scheduler()
+    jobs.start_workers(app.state.sync_planner)
+    yield
+    await planner.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/plan_trip', plan_trip, methods=['POST']),
+        Route('/plan_trip_stream', plan_trip_stream, methods=['POST']),
+        Route('/plan_trips', plan_trips, methods=['POST']),
+        Route('/plans', create_plan, methods=['POST']),
+        Route('/plans/{job_id}', get_plan),
+        Route('/pool_stats', pool_stats),
+        Route('/prewarm', prewarm_status, methods=['GET', 'POST']),
+        Route('/metrics', prometheus_metrics),
+    ],
+    lifespan=lifespan
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:app', host='0.0.0.0', port=int(os.getenv('PORT', 8000)))
@@ -0,0 +1,708 @@
+"""
+异步旅游规划模块
+
+AsyncTripPlanner使用httpx异步客户端和DeepSeek异步客户端实现TripPlanner的各个步骤，
+在ASGI服务中每个进行中的规划只占用一个协程，而不是一个工作线程。
+提示词构建、各类缓存和响应解析逻辑与同步的TripPlanner共用。
+"""
+import asyncio
+import logging
+import time
+
+import httpx
+
+from config import Config
+import weather
+from geocoder import GEOCODE_URL, DISTRICT_URL, BATCH_SIZE, CityScope, scope_key
+from cache import warm_entries
+from itinerary_cache import itinerary_cache, normalize_days
+from itinerary_parser import Itinerary, ItineraryParser
+from orchestrator import PlanDeadline, PlanRun, day_summaries
+from planner import TripPlanner, ROUTE_URL
+import http_client
+from http_client import endpoint_of
+import metrics
+import upstream
+import local_routing
+import route_cache
+import hedging
+
+logger = logging.getLogger(__name__)
+
+
+
+class AsyncTripPlanner(TripPlanner):
+    """旅游规划器的异步版本"""
+
+    def __init__(self):
+        super().__init__()
+        self._http = None
+        self._llm = {}
+        self._inflight = {}  # 合并相同请求的进行中任务
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    @property
+    def http(self):
+        """共享的异步HTTP客户端，首次使用时创建"""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=Config.ASYNC_MAX_CONNECTIONS,
+                    max_keepalive_connections=Config.HTTP_POOL_MAXSIZE
+                ),
+                timeout=httpx.Timeout(Config.HTTP_READ_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT),
+                # 禁用SSL验证，与同步客户端保持一致
+                verify=False
+            )
+        return self._http
+
+    def llm(self, key):
+        """密钥对应的DeepSeek异步客户端，首次使用时创建，openai也在这时才导入"""
+        if key not in self._llm:
+            from openai import AsyncOpenAI
+            self._llm[key] = AsyncOpenAI(
+                api_key=key,
+                base_url=Config.DEEPSEEK_BASE_URL,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=Config.ASYNC_MAX_CONNECTIONS),
+                    timeout=httpx.Timeout(Config.STAGE_TIMEOUTS['itinerary'], connect=Config.HTTP_CONNECT_TIMEOUT)
+                )
+            )
+        return self._llm[key]
+
+    async def _chat(self, **kwargs):
+        """经过DeepSeek限流器选择密钥后调用chat.completions接口，非流式调用按LLM_HEDGE对冲"""
+        async def attempt():
+            async with upstream.deepseek.aslot('chat') as lease:
+                return await self.llm(lease.key).chat.completions.create(**kwargs)
+
+        if kwargs.get('stream'):
+            return await attempt()
+        return await hedging.acall('chat', attempt)
+
+    async def aclose(self):
+        """关闭底层连接，在服务退出时调用"""
+        if self._http is not None:
+            await self._http.aclose()
+        for llm in self._llm.values():
+            await llm.close()
+
+    def pool_stats(self):
+        """返回异步连接池的配置和当前并发数"""
+        return {
+            'max_connections': Config.ASYNC_MAX_CONNECTIONS,
+            'max_keepalive_connections': Config.HTTP_POOL_MAXSIZE,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight
+        }
+
+    async def _get_json(self, url, params):
+        """
+        经过高德限流器发送GET请求并解析JSON，5xx响应按退避策略最多重试3次
+
+        参数:
+            url (str): 请求地址
+            params (dict): 查询参数
+
+        返回:
+            dict: 响应JSON
+        """
+        endpoint = endpoint_of(url)
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            # 超过P95仍未返回时发出对冲请求，先返回的结果生效，另一个被取消
+            return await hedging.acall(endpoint, lambda: self._fetch_json(url, params, endpoint))
+        finally:
+            self.in_flight -= 1
+
+    async def _fetch_json(self, url, params, endpoint):
+        """发送请求并按退避策略重试5xx响应，读取超时按接口的耗时分布自适应"""
+        timeout = httpx.Timeout(hedging.read_timeout(endpoint), connect=Config.HTTP_CONNECT_TIMEOUT)
+        for attempt in range(http_client.RETRY_ATTEMPTS):
+            started = time.perf_counter()
+            # 每次重试都重新取令牌，熔断后不再重试
+            async with upstream.amap.aslot(endpoint) as lease:
+                if lease.key and 'key' in params:
+                    params = dict(params, key=lease.key)
+                try:
+                    response = await self.http.get(url, params=params, timeout=timeout)
+                except httpx.HTTPError as e:
+                    metrics.UPSTREAM_ERRORS.inc(endpoint=endpoint, reason=type(e).__name__)
+                    raise
+                finally:
+                    metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+                if response.status_code >= 500:
+                    lease.fail()
+                elif upstream.amap_quota_exceeded(response.content):
+                    lease.fail(throttled=True)
+            if response.status_code >= 400:
+                metrics.UPSTREAM_ERRORS.inc(endpoint=endpoint, reason=str(response.status_code))
+            if response.status_code not in http_client.RETRY_STATUSES or attempt == http_client.RETRY_ATTEMPTS - 1:
+                response.raise_for_status()
+                return response.json()
+            metrics.UPSTREAM_RETRIES.inc(endpoint=endpoint)
+            await asyncio.sleep(2 ** attempt)
+
+    async def _single_flight(self, key, factory):
+        """相同key的并发调用共享同一个进行中的任务"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _load_live_weather(self, city):
+        """请求高德实况天气并写入共享的天气缓存"""
+        result = await self._get_json(weather.WEATHER_URL, weather.live_weather_params(self.amap_key, city))
+        weather_data = weather.parse_live_weather(result)
+        if weather_data:
+            weather.store_live_weather(city, weather_data)
+        return weather_data
+
+    async def get_weather_forecast(self, location):
+        """
+        获取指定城市的天气信息
+
+        参数:
+            location (str): 城市名称
+
+        返回:
+            tuple: (天气信息, 错误信息)，如果获取失败则返回None
+        """
+        if not self.amap_key:
+            return None, "喵呜！天气API密钥未配置，请检查.env文件喵~"
+        city = location.strip()
+        try:
+            cached = weather.peek_live_weather(city)
+            if cached is not None:
+                weather_data, stale = cached
+                if stale:
+                    # 先返回过期数据，后台刷新
+                    asyncio.ensure_future(self._single_flight(('weather', city), lambda: self._load_live_weather(city)))
+                metrics.CACHE_REQUESTS.inc(cache='weather', result='stale' if stale else 'hit')
+                warm_entries.hit('weather', city)
+            else:
+                metrics.CACHE_REQUESTS.inc(cache='weather', result='miss')
+                weather_data = await self._single_flight(('weather', city), lambda: self._load_live_weather(city))
+            return weather.format_live_weather(city, weather_data)
+        except httpx.HTTPError as e:
+            return None, f"喵呜！网络出问题了: {e}"
+        except Exception as e:
+            return None, f"喵呜！发生了一些意外: {e}"
+
+    async def _load_forecast(self, city):
+        """请求高德天气预报并写入共享的预报缓存"""
+        casts = weather.parse_forecast(await self._get_json(weather.WEATHER_URL, weather.forecast_params(self.amap_key, city)))
+        if casts:
+            weather.store_forecast(city, casts)
+        return casts
+
+    async def get_forecast(self, location):
+        """
+        异步获取指定城市当天和未来几天的天气预报
+
+        返回:
+            list: 高德逐日预报，如果获取失败则返回None
+        """
+        if not self.amap_key:
+            return None
+        city = location.strip()
+        try:
+            casts = weather.peek_forecast(city)
+            metrics.CACHE_REQUESTS.inc(cache='forecast', result='hit' if casts is not None else 'miss')
+            if casts is None:
+                casts = await self._single_flight(('forecast', city), lambda: self._load_forecast(city))
+            return casts
+        except Exception as e:
+            logger.error("获取天气预报失败: %s", e)
+            return None
+
+    async def generate_itinerary(self, location, interests, dietary_preferences, days=1):
+        """
+        使用DeepSeek异步生成个性化行程，相同或相近的请求直接使用缓存结果
+
+        返回:
+            str: 生成的行程，如果生成失败则返回None
+        """
+        try:
+            normalized, messages = self.prepare_request(location, interests, dietary_preferences, days)
+            cached = itinerary_cache.get(Config.DEEPSEEK_MODEL, messages, normalized)
+            if cached is not None:
+                logger.debug("行程缓存命中: %s", location)
+                return cached
+
+            response = await self._chat(
+                model=Config.DEEPSEEK_MODEL,
+                messages=messages,
+                stream=False
+            )
+            self.record_usage(response, 'markdown')
+            itinerary = response.choices[0].message.content
+            if itinerary:
+                itinerary_cache.set(Config.DEEPSEEK_MODEL, messages, normalized, itinerary)
+            return itinerary
+        except Exception as e:
+            metrics.UPSTREAM_ERRORS.inc(endpoint='chat', reason=type(e).__name__)
+            logger.error("生成行程失败: %s", e)
+            return None
+
+    async def generate_structured_itinerary(self, location, interests, dietary_preferences, days=1):
+        """
+        使用DeepSeek的JSON输出模式异步生成行程
+
+        返回:
+            tuple: (本地渲染的Markdown行程, 结构化行程)，调用失败或格式不符时抛出异常
+        """
+        normalized, messages = self.prepare_request(location, interests, dietary_preferences, days, structured=True)
+        days = normalized[3]
+        cached = itinerary_cache.get(Config.DEEPSEEK_MODEL, messages, normalized)
+        if cached is not None:
+            logger.debug("行程缓存命中: %s", location)
+            return self.structured_result(cached, location, days)
+
+        response = await self._chat(
+            model=Config.DEEPSEEK_MODEL,
+            messages=messages,
+            response_format={'type': 'json_object'},
+            stream=False
+        )
+        self.record_usage(response, 'json')
+        content = response.choices[0].message.content
+        result = self.structured_result(content, location, days)
+        itinerary_cache.set(Config.DEEPSEEK_MODEL, messages, normalized, content)
+        return result
+
+    async def plan_itinerary(self, location, interests, dietary_preferences, days=1):
+        """
+        异步生成行程并得到结构化结果，JSON输出失败时退回Markdown输出
+
+        返回:
+            tuple: (行程文本, 结构化行程)，生成失败时行程文本为None
+        """
+        if Config.ITINERARY_FORMAT == 'json':
+            try:
+                return await self.generate_structured_itinerary(location, interests, dietary_preferences, days)
+            except Exception as e:
+                metrics.UPSTREAM_ERRORS.inc(endpoint='chat', reason=type(e).__name__)
+                logger.warning("JSON格式行程生成失败，改用Markdown输出: %s", e)
+        itinerary = await self.generate_itinerary(location, interests, dietary_preferences, days)
+        return itinerary, self.parse_itinerary(itinerary)
+
+    async def generate_itinerary_stream(self, location, interests, dietary_preferences):
+        """
+        使用DeepSeek异步流式生成个性化行程
+
+        返回:
+            async generator: 逐段产出生成的文本，调用失败时抛出异常
+        """
+        normalized, messages = self.prepare_request(location, interests, dietary_preferences)
+        cached = itinerary_cache.get(Config.DEEPSEEK_MODEL, messages, normalized)
+        if cached is not None:
+            logger.debug("行程缓存命中: %s", location)
+            yield cached
+            return
+
+        stream = await self._chat(
+            model=Config.DEEPSEEK_MODEL,
+            messages=messages,
+            stream=True
+        )
+        parts = []
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield parts[-1]
+        finally:
+            # 客户端断开时关闭上游连接
+            await stream.close()
+
+        # 只缓存完整生成的行程
+        itinerary_cache.set(Config.DEEPSEEK_MODEL, messages, normalized, ''.join(parts))
+
+    async def city_scope(self, city):
+        """异步把城市名称解析为行政区划信息，同一城市的并发查询只请求一次"""
+        city = (city or '').strip()
+        if not city:
+            return None
+        # 本地缓存是同步的SQLite，在线程中查询和写入，不阻塞事件循环
+        scope = await asyncio.to_thread(self.geocoder.cached_scope, city)
+        if scope is None:
+            try:
+                result = await self._single_flight(
+                    ('district', city), lambda: self._get_json(DISTRICT_URL, self.geocoder.district_params(city))
+                )
+                scope = await asyncio.to_thread(
+                    self.geocoder.store_scope, city, self.geocoder.parse_district_response(city, result)
+                )
+            except Exception as e:
+                logger.warning("查询城市adcode失败: %s", e)
+                scope = CityScope(None, city)
+        return scope
+
+    async def _batch_request(self, addresses, scope):
+        """异步调用高德批量地理编码接口"""
+        result = await self._get_json(GEOCODE_URL, self.geocoder.batch_params(addresses, scope))
+        return self.geocoder.parse_batch_response(result, len(addresses))
+
+    async def _resolve_batch(self, names, scope):
+        """解析一个批次的地点：先带城市前缀搜索，失败的地点再用原名重试"""
+        addresses = self.geocoder.scoped_addresses(names, scope)
+        results = dict(zip(names, await self._batch_request(addresses, scope)))
+        retry = [name for name in names if not results[name]] if scope is not None else []
+        if retry:
+            results.update(zip(retry, await self._batch_request(retry, scope)))
+        return results
+
+    async def resolve_locations(self, names, city=None):
+        """
+        并发解析多个地点，优先使用离线索引和本地缓存
+
+        参数:
+            names (list): 地点名称列表
+            city (str): 限定搜索的城市
+
+        返回:
+            dict: 地点到坐标的映射，失败的地点值为None
+        """
+        names = list(dict.fromkeys(names))
+        scope = await self.city_scope(city)
+        results = await asyncio.to_thread(self.geocoder.lookup_local, scope, names)
+        misses = [name for name in names if name not in results]
+        if not misses:
+            return results
+
+        batches = [misses[i:i + BATCH_SIZE] for i in range(0, len(misses), BATCH_SIZE)]
+        resolved = {}
+        for batch in await asyncio.gather(*(self._resolve_batch(b, scope) for b in batches), return_exceptions=True):
+            if isinstance(batch, Exception):
+                logger.warning("批量地理编码失败: %s", batch)
+            else:
+                resolved.update(batch)
+        await asyncio.to_thread(self.geocoder.cache.put_many, scope_key(scope), resolved)
+        for name in misses:
+            results[name] = resolved.get(name)
+        return results
+
+    async def geocode_location(self, location, city=None):
+        """异步获取单个地点的坐标，失败时返回None"""
+        return (await self.resolve_locations([location], city)).get(location)
+
+    async def get_route_planning(self, locations, city=None):
+        """
+        异步解析地点坐标并规划路线，覆盖同步版本以免返回未等待的协程
+
+        参数:
+            locations (list): 地点名称列表
+            city (str): 行程所在城市，用于限定搜索范围
+
+        返回:
+            dict: 路线规划结果，包含错误信息或路线详情
+        """
+        try:
+            if not locations or len(locations) < 2:
+                return {"error": "需要至少两个地点才能规划路线"}
+            coordinates = await self.resolve_locations(locations, city)
+            return await self.plan_route(locations, coordinates)
+        except Exception as e:
+            logger.error("路线规划失败: %s", e)
+            return {
+                "error": f"路线规划失败: {str(e)}",
+                "locations": locations
+            }
+
+    async def plan_route(self, locations, coordinates, groups=None):
+        """
+        优化游览顺序后异步调用高德驾车路线规划API
+
+        返回:
+            dict: 路线规划结果，包含错误信息或路线详情
+        """
+        locations, optimization = self.order_stops(locations, coordinates, groups)
+        params = self.route_params(locations, coordinates)
+        if 'error' in params:
+            return params
+
+        points = [coordinates[location] for location in locations]
+        if route_cache.enabled():
+            pairs, legs, missing = await asyncio.to_thread(route_cache.cached_legs, points)
+            if not missing:
+                return self.annotate_route(route_cache.assemble(points, pairs, legs), locations, optimization)
+
+        reason, probe = local_routing.route_health.degrade_reason()
+        if reason:
+            return self.local_route(locations, coordinates, optimization, reason)
+
+        started = time.monotonic()
+        try:
+            # 自动降级时包括重试在内最多等待ROUTE_SLO
+            fetch = self.fetch_legs(points, pairs, legs, missing) if route_cache.enabled() \
+                else self._get_json(ROUTE_URL, params)
+            route_data = await asyncio.wait_for(fetch, local_routing.request_timeout()[1])
+        except Exception as e:
+            local_routing.route_health.record(time.monotonic() - started, ok=False, probe=probe)
+            logger.error("路线规划请求失败: %r", e)
+            return self.local_route(locations, coordinates, optimization, 'upstream_error')
+
+        ok = route_data.get('status') == '1'
+        local_routing.route_health.record(time.monotonic() - started, ok=ok, probe=probe)
+        if not ok:
+            logger.warning("路线规划返回错误: %s", route_data.get('info'))
+            return self.local_route(locations, coordinates, optimization, 'upstream_error')
+        return self.annotate_route(route_data, locations, optimization)
+
+
+    async def fetch_legs(self, points, pairs, legs, missing):
+        """并发请求缺失的路段，写入路段缓存后拼接整条路线，任一路段失败时抛出异常"""
+        results = await asyncio.gather(
+            *(self._get_json(ROUTE_URL, route_cache.leg_params(self.amap_key, *pair)) for pair in missing),
+            return_exceptions=True
+        )
+        fetched, error = {}, None
+        for pair, result in zip(missing, results):
+            if isinstance(result, Exception):
+                error = error or result
+                continue
+            leg = route_cache.parse_leg(result)
+            if leg is None:
+                error = error or RuntimeError(f"路段规划失败: {result.get('info')}")
+            else:
+                fetched[pair] = leg
+        await asyncio.to_thread(route_cache.get_leg_cache().put_many, fetched, Config.ROUTE_STRATEGY)
+        if error:
+            raise error
+        legs.update(fetched)
+        return route_cache.assemble(points, pairs, legs)
+
+
+async def _timed(run, stage, coro):
+    """执行协程并记录实际耗时"""
+    started = time.monotonic()
+    try:
+        return await coro
+    finally:
+        run.record(stage, time.monotonic() - started)
+
+
+async def _wait(run, task, stage, timeout, default=None):
+    """等待某个阶段的结果，超时则取消该任务并返回默认值"""
+    try:
+        return await asyncio.wait_for(task, timeout)
+    except asyncio.TimeoutError:
+        run.timeout(stage, f"{timeout:.1f}s")
+        return default
+
+
+async def run_plan(planner, location, interests, dietary_preferences, days=1):
+    """
+    异步执行一次完整的行程规划，与orchestrator.run_plan的结果格式一致
+
+    参数:
+        planner (AsyncTripPlanner): 异步旅游规划器实例
+        location (str): 城市名称
+        interests (str): 用户兴趣
+        dietary_preferences (str): 饮食偏好
+        days (int): 行程天数，多于一天时交给run_multi_day_plan
+
+    返回:
+        dict: 包含weather、itinerary、stops、route以及各阶段耗时的结果
+    """
+    days = normalize_days(days)
+    if days > 1:
+        return await run_multi_day_plan(planner, location, interests, dietary_preferences, days)
+
+    deadline = PlanDeadline(Config.PLAN_DEADLINE)
+    run = PlanRun()
+
+    # 天气与行程生成互不依赖，同时开始
+    weather_task = asyncio.ensure_future(_timed(run, 'weather', planner.get_weather_forecast(location)))
+    itinerary_task = asyncio.ensure_future(
+        _timed(run, 'itinerary', planner.plan_itinerary(location, interests, dietary_preferences))
+    )
+
+    itinerary, parsed = await _wait(
+        run, itinerary_task, 'itinerary', deadline.remaining('itinerary'), default=(None, Itinerary())
+    )
+    locations = parsed.locations
+
+    if not locations:
+        route = {"error": "无法提取地点信息"}
+    elif len(locations) < 2:
+        route = {"error": "需要至少两个地点才能规划路线"}
+    else:
+        # 行程生成后的上游请求属于进行中的规划，排在新规划前面
+        with upstream.prioritized(upstream.HIGH):
+            coordinates = await _wait(
+                run, _timed(run, 'geocode', planner.resolve_locations(locations, location)),
+                'geocode', deadline.remaining('geocode'), default={}
+            )
+            route = await _wait(
+                run, _timed(run, 'route', planner.plan_route(
+                    locations, coordinates, parsed.groups())),
+                'route', local_routing.wait_timeout(deadline.remaining('route'))
+            ) or planner.fallback_route(locations, coordinates, parsed.groups())
+
+    weather_info = await _wait(run, weather_task, 'weather', deadline.remaining('weather'))
+
+    result = {
+        'weather': weather_info,
+        'itinerary': itinerary,
+        'stops': parsed.to_list(),
+        'route': route
+    }
+    result.update(run.summary())
+    return result
+
+
+async def run_multi_day_plan(planner, location, interests, dietary_preferences, days):
+    """
+    异步执行多日行程规划，与orchestrator.run_multi_day_plan的结果格式一致
+
+    返回:
+        dict: 包含weather、itinerary、stops、days以及各阶段耗时的结果
+    """
+    deadline = PlanDeadline(Config.PLAN_DEADLINE)
+    run = PlanRun()
+
+    forecast_task = asyncio.ensure_future(_timed(run, 'weather', planner.get_forecast(location)))
+    itinerary_task = asyncio.ensure_future(
+        _timed(run, 'itinerary', planner.plan_itinerary(location, interests, dietary_preferences, days))
+    )
+
+    itinerary, parsed = await _wait(
+        run, itinerary_task, 'itinerary', deadline.remaining('itinerary'), default=(None, Itinerary())
+    )
+
+    routes = {}
+    if len(parsed) >= 2:
+        # 行程生成后的上游请求属于进行中的规划，排在新规划前面
+        with upstream.prioritized(upstream.HIGH):
+            coordinates = await _wait(
+                run, _timed(run, 'geocode', planner.resolve_locations(parsed.locations, location)),
+                'geocode', deadline.remaining('geocode'), default={}
+            )
+
+            # 各天的路线互不依赖，并行规划
+            day_stops = {day: parsed.for_day(day) for day in parsed.days()}
+
+            async def plan_day(day):
+                stops = day_stops[day]
+                return await _wait(
+                    run, planner.plan_route(stops.locations, coordinates, stops.groups()),
+                    'route', local_routing.wait_timeout(deadline.remaining('route'))
+                ) or planner.fallback_route(stops.locations, coordinates, stops.groups())
+
+            started = time.monotonic()
+            results = await asyncio.gather(*(plan_day(day) for day in day_stops))
+            routes = dict(zip(day_stops, results))
+            run.record('route', time.monotonic() - started)
+
+    casts = await _wait(run, forecast_task, 'weather', deadline.remaining('weather'))
+    casts = casts[:days] if casts else None
+
+    result = {
+        'weather': weather.format_forecast(location, casts),
+        'itinerary': itinerary,
+        'stops': parsed.to_list(),
+        'days': day_summaries(parsed, routes, casts)
+    }
+    result.update(run.summary())
+    return result
+
+
+async def stream_plan(planner, location, interests, dietary_preferences):
+    """
+    异步流式执行行程规划，事件格式与orchestrator.stream_plan一致
+
+    返回:
+        async generator: 产出(事件名, 数据)元组
+    """
+    deadline = PlanDeadline(Config.PLAN_DEADLINE)
+    run = PlanRun()
+    parser = ItineraryParser()
+    geocode_tasks = {}
+    pending = set()
+
+    weather_task = asyncio.ensure_future(_timed(run, 'weather', planner.get_weather_forecast(location)))
+    pending.add(weather_task)
+
+    def drain():
+        """取出已完成但尚未发送的任务结果"""
+        events = []
+        for task in [t for t in pending if t.done()]:
+            pending.discard(task)
+            if task is weather_task:
+                events.append(('weather', {'weather': task.result()}))
+            else:
+                location_coord = task.result() if task.exception() is None else None
+                events.append(('geocode', {'name': geocode_tasks[task], 'location': location_coord}))
+        return events
+
+    def locate(stops):
+        """开始新识别地点的地理编码，返回对应的location事件"""
+        events = []
+        for stop in stops:
+            events.append(('location', stop.to_dict()))
+            task = asyncio.ensure_future(planner.geocode_location(stop.name, location))
+            geocode_tasks[task] = stop.name
+            pending.add(task)
+        return events
+
+    started = time.monotonic()
+    try:
+        async for text in planner.generate_itinerary_stream(location, interests, dietary_preferences):
+            if 'first_token' not in run.timings:
+                run.record('first_token', time.monotonic() - started)
+            yield 'token', {'text': text}
+            for event in locate(parser.feed(text)):
+                yield event
+            for event in drain():
+                yield event
+            if deadline.remaining('itinerary') <= 0:
+                run.timeout('itinerary', '生成未在截止时间内完成')
+                break
+    except Exception as e:
+        logger.error("生成行程失败: %s", e)
+        yield 'error', {'stage': 'itinerary', 'error': f"生成行程失败: {str(e)}"}
+    for event in locate(parser.close()):
+        yield event
+    run.record('itinerary', time.monotonic() - started)
+
+    locations = parser.locations
+    if len(locations) < 2:
+        route = {"error": "无法提取地点信息" if not locations else "需要至少两个地点才能规划路线"}
+    else:
+        geocode_wait = [t for t in geocode_tasks if not t.done()]
+        if geocode_wait:
+            _, not_done = await asyncio.wait(geocode_wait, timeout=deadline.remaining('geocode'))
+            if not_done:
+                run.timeout('geocode', f"{len(not_done)}个地点未完成")
+        for event in drain():
+            yield event
+
+        coordinates = {name: None for name in locations}
+        for task, name in geocode_tasks.items():
+            if task.done() and task.exception() is None:
+                coordinates[name] = task.result()
+            else:
+                task.cancel()
+
+        # 生成结束后的路线请求排在新规划前面；with块中没有yield，优先级不会泄漏到调用方
+        with upstream.prioritized(upstream.HIGH):
+            route = await _wait(
+                run, _timed(run, 'route', planner.plan_route(
+                    locations, coordinates, parser.itinerary.groups())),
+                'route', local_routing.wait_timeout(deadline.remaining('route'))
+            ) or planner.fallback_route(locations, coordinates, parser.itinerary.groups())
+    yield 'route', {'route': route}
+
+    if weather_task in pending:
+        weather_info = await _wait(run, weather_task, 'weather', deadline.remaining('weather'))
+        yield 'weather', {'weather': weather_info}
+
+    done = {'itinerary': parser.buffer, 'locations': locations, 'stops': parser.itinerary.to_list()}
+    done.update(run.summary())
+    yield 'done', done
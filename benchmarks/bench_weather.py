@@ -0,0 +1,115 @@
+"""
+天气播报格式化的微基准测试
+
+对比旧实现（每次调用都重建表情、温度情绪和描述字典，重新定义温度判断闭包，
+并重新读取AMAP_KEY）与模块级预计算格式化器的单次调用开销。只测量格式化阶段，
+不发起任何网络请求。测量前先用相同种子的随机数生成器核对两种实现在各种天气和
+温度分段下的输出完全一致。
+
+用法:
+    python benchmarks/bench_weather.py [--number 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import weather  # noqa: E402
+
+SAMPLE = {
+    'weather': '多云',
+    'temperature': '23',
+    'humidity': '61',
+    'winddirection': '东南',
+    'windpower': '≤3'
+}
+
+
+def legacy_format(city, weather_data, rng=random):
+    """按旧实现的方式格式化：每次调用重新构建所有查找表"""
+    os.getenv('AMAP_KEY')
+    cat_emojis = dict(weather.CAT_EMOJIS)
+    temperature_moods = {
+        name: {'emoji': mood['emoji'], 'mood': mood['mood'], 'reactions': list(mood['reactions'])}
+        for name, mood in weather.TEMPERATURE_MOODS.items()
+    }
+    cat_descriptions = {name: list(comments) for name, comments in weather.CAT_DESCRIPTIONS.items()}
+
+    def get_temperature_mood(temp):
+        if temp < 0:
+            return temperature_moods['freezing']
+        elif temp < 10:
+            return temperature_moods['cold']
+        elif temp < 20:
+            return temperature_moods['cool']
+        elif temp < 30:
+            return temperature_moods['warm']
+        elif temp < 35:
+            return temperature_moods['hot']
+        else:
+            return temperature_moods['scorching']
+
+    weather_type = weather_data['weather']
+    temperature = float(weather_data['temperature'])
+    temp_mood = get_temperature_mood(temperature)
+    temp_comment = rng.choice(temp_mood['reactions'])
+    weather_emoji = cat_emojis.get(weather_type, '😺')
+    weather_comment = rng.choice(cat_descriptions.get(weather_type, cat_descriptions['晴']))
+    return f"""
+喵喵喵~ 这里是{city}的天气播报喵~ {weather_emoji}
+
+{weather_comment}
+{temp_comment}
+
+{city}天气: {weather_type} {weather_emoji}
+温度: {temperature}°C {temp_mood['emoji']}
+湿度: {weather_data['humidity']}%
+风向: {weather_data['winddirection']}
+风力: {weather_data['windpower']}级
+
+喵~ 当前温度让我{temp_mood['mood']} {temp_mood['emoji']}
+喵~ 记得多喝水，保持温暖哦！{weather_emoji}
+"""
+
+
+def check_outputs(seeds=range(5)):
+    """用相同种子的随机数生成器逐一核对两种实现的输出，不一致时抛出AssertionError"""
+    weather_types = list(weather.CAT_DESCRIPTIONS) + ['未知天气']
+    temperatures = ('-5', '0', '9.5', '10', '19', '20', '29', '30', '34', '35', '40')
+    for seed in seeds:
+        for weather_type in weather_types:
+            for temperature in temperatures:
+                data = dict(SAMPLE, weather=weather_type, temperature=temperature)
+                weather.set_rng(random.Random(seed))
+                expected = legacy_format('苏州', data, random.Random(seed))
+                actual = weather.formatter.format('苏州', data)
+                assert actual == expected, f"输出不一致: seed={seed} {weather_type} {temperature}°C"
+
+
+def bench(label, func, number, repeat):
+    """运行基准测试并打印每次调用的最佳耗时"""
+    best = min(timeit.repeat(lambda: func('苏州', SAMPLE), number=number, repeat=repeat))
+    per_call = best / number * 1e9
+    print(f"{label:<12} {per_call:10.0f} ns/次")
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description='天气播报格式化微基准测试')
+    parser.add_argument('--number', type=int, default=100000, help='每轮调用次数')
+    parser.add_argument('--repeat', type=int, default=5, help='重复轮数，取最快的一轮')
+    args = parser.parse_args()
+
+    check_outputs()
+    formatter = weather.CatWeatherFormatter(random.Random(0))
+
+    before = bench('旧实现', legacy_format, args.number, args.repeat)
+    after = bench('预计算实现', formatter.format, args.number, args.repeat)
+    print(f"加速比: {before / after:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+/plan_trip 压测工具
+
+以固定的目标RPS（开环方式，不等待上一个请求完成）向应用发送规划请求，
+统计延迟分位数、吞吐量、错误数，并根据响应中的timings汇总各阶段耗时。
+
+配合 mock_upstream.py 使用可以完全离线运行:
+    python mock_upstream.py --port 9000 &
+    AMAP_BASE_URL=http://127.0.0.1:9000/v3 DEEPSEEK_BASE_URL=http://127.0.0.1:9000 python app.py &
+    python benchmarks/load_test.py --rps 20 --duration 30
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+CITIES = ['苏州', '上海', '杭州', '南京', '北京']
+INTERESTS = ['历史,园林', '美食,购物', '自然风光', '博物馆,艺术', '夜景,美食']
+DIETS = ['无', '素食', '清淡', '不吃辣']
+
+
+def percentile(values, p):
+    """计算分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class Results:
+    """线程安全地收集压测结果"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = defaultdict(int)
+        self.stages = defaultdict(list)
+        self.timeouts = defaultdict(int)
+
+    def record(self, latency, status, body):
+        with self.lock:
+            if status != 200:
+                self.errors[str(status)] += 1
+                return
+            self.latencies.append(latency)
+            for stage, seconds in (body.get('timings') or {}).items():
+                self.stages[stage].append(seconds)
+            for stage in body.get('timeouts') or []:
+                self.timeouts[stage] += 1
+
+
+def make_payload(unique):
+    """随机生成一个规划请求，unique为True时使行程缓存无法命中"""
+    payload = {
+        'location': random.choice(CITIES),
+        'interests': random.choice(INTERESTS),
+        'dietary_preferences': random.choice(DIETS),
+    }
+    if unique:
+        payload['interests'] += f",随机{random.randint(0, 10 ** 9)}"
+    return payload
+
+
+def send(session, url, payload, results, timeout):
+    started = time.perf_counter()
+    try:
+        response = session.post(url, json=payload, timeout=timeout)
+        body = response.json() if response.status_code == 200 else {}
+        results.record(time.perf_counter() - started, response.status_code, body)
+    except requests.RequestException as e:
+        results.record(time.perf_counter() - started, type(e).__name__, {})
+
+
+def report(results, elapsed):
+    """打印压测报告"""
+    ok = len(results.latencies)
+    failed = sum(results.errors.values())
+    print(f"\n完成请求: {ok}，失败: {failed}，耗时: {elapsed:.1f}s，吞吐量: {ok / elapsed:.2f} req/s")
+    if results.errors:
+        print(f"错误分布: {dict(results.errors)}")
+    if ok:
+        print("端到端延迟(ms): " + "  ".join(
+            f"p{p}={percentile(results.latencies, p) * 1000:.0f}" for p in (50, 95, 99)
+        ) + f"  max={max(results.latencies) * 1000:.0f}")
+    if results.stages:
+        print("\n各阶段耗时(ms):")
+        print(f"  {'阶段':<12}{'p50':>10}{'p95':>10}{'p99':>10}{'样本数':>10}")
+        for stage, values in sorted(results.stages.items()):
+            print(f"  {stage:<12}" + ''.join(
+                f"{percentile(values, p) * 1000:>10.0f}" for p in (50, 95, 99)
+            ) + f"{len(values):>10}")
+    if results.timeouts:
+        print(f"\n阶段超时次数: {dict(results.timeouts)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/plan_trip 压测工具')
+    parser.add_argument('--url', default='http://127.0.0.1:5000/plan_trip')
+    parser.add_argument('--rps', type=float, default=5, help='目标每秒请求数')
+    parser.add_argument('--duration', type=float, default=30, help='压测时长（秒）')
+    parser.add_argument('--concurrency', type=int, default=200, help='最大并发请求数')
+    parser.add_argument('--timeout', type=float, default=120, help='单个请求的超时（秒）')
+    parser.add_argument('--unique', action='store_true', help='为每个请求生成不同的兴趣，绕过行程缓存')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子，便于重复同一组请求')
+    parser.add_argument('--json', dest='json_output', help='把原始结果写入JSON文件')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = Results()
+    session = requests.Session()
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency))
+    interval = 1.0 / args.rps
+    total = int(args.rps * args.duration)
+
+    print(f"开始压测 {args.url}：{args.rps} req/s，持续 {args.duration}s，共 {total} 个请求")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for i in range(total):
+            # 按计划时间发送，避免慢请求拖慢发送节奏
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, session, args.url, make_payload(args.unique), results, args.timeout)
+    elapsed = time.perf_counter() - started
+
+    report(results, elapsed)
+    if args.json_output:
+        with open(args.json_output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'latencies': results.latencies,
+                'errors': results.errors,
+                'stages': results.stages,
+                'timeouts': results.timeouts,
+                'elapsed': elapsed,
+            }, f, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+"""
+批量行程规划
+
+一次请求提交多个规划参数，结果按完成顺序逐条以NDJSON返回。批量请求之间共享的工作只做一次:
+- 参数规范化后相同的条目只规划一次，响应缓存中已有的结果直接返回
+- 按城市分组，每个城市只查询一次天气
+- 行程生成在有界的线程池中执行，同一城市的条目连续提交
+- 一个城市的行程全部生成后，合并去重其中所有【】地点，做一次批量地理编码，
+  之后各条目（多日行程的每一天）的路线并行规划，每完成一个条目就输出一行
+
+每行的格式:
+    {"index": 0, "etag": "...", "result": {...}}   与 /plan_trip 相同的结果
+    {"index": 1, "error": "..."}                    参数无效或行程生成失败的条目
+"""
+import json
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from config import Config
+from itinerary_cache import normalize_days
+from itinerary_parser import Itinerary
+import metrics
+from orchestrator import PlanRun, _timed, day_summaries, executor
+import response_cache
+import upstream
+import weather
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+BULK_ITEMS = metrics.registry.counter('bulk_items_total', '批量规划的条目数，按结果来源区分')
+
+# 所有批量请求共用的行程生成线程池，限制批量请求同时调用大模型的数量
+_llm_executor = upstream.ContextExecutor(max_workers=Config.BULK_LLM_CONCURRENCY, thread_name_prefix='bulk-llm')
+
+
+class BulkItem:
+    """批量请求中参数相同的一组条目"""
+
+    def __init__(self, key, data, index):
+        self.key = key
+        self.location = data.get('location').strip()
+        self.city = self.location.lower()
+        self.interests = data.get('interests')
+        self.dietary_preferences = data.get('dietary_preferences')
+        self.days = normalize_days(data.get('days', 1))
+        self.indexes = [index]
+        self.run = PlanRun()
+        self.itinerary = None
+        self.parsed = Itinerary()
+        self.error = None  # 行程生成失败的原因
+        self.routes = {}  # 多日行程每天的路线
+        self.route_pending = 0  # 还未完成的路线规划数
+        self.route_started = None
+
+
+def parse_items(data):
+    """
+    校验批量请求体
+
+    参数:
+        data: 规划参数列表，或{"requests": [...]}
+
+    返回:
+        list: 规划参数列表
+
+    异常:
+        ValueError: 请求体格式不对或条目数超过BULK_MAX_ITEMS
+    """
+    items = data.get('requests') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise ValueError("请求体应为非空的规划参数列表")
+    if len(items) > Config.BULK_MAX_ITEMS:
+        raise ValueError(f"一次最多提交{Config.BULK_MAX_ITEMS}个规划请求")
+    return items
+
+
+def _line(index, **fields):
+    return (json.dumps(dict(index=index, **fields), ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def _result_line(index, body, etag):
+    """拼接序列化好的结果，不重新解析"""
+    return b''.join((json.dumps({'index': index, 'etag': etag}, ensure_ascii=False)[:-1].encode('utf-8'),
+                     b', "result": ', body, b'}\n'))
+
+
+def _result(future, timeout):
+    """等待共享的任务结果，失败或超时返回None"""
+    try:
+        return future.result(timeout=timeout)
+    except Exception as e:
+        logger.warning("批量规划的共享任务失败: %s", e)
+        return None
+
+
+def _geocode(planner, names, location):
+    """在线程池中解析一个城市所有条目的地点，返回(坐标, 耗时)"""
+    started = time.monotonic()
+    try:
+        coordinates = planner.geocoder.resolve_many(names, location, timeout=Config.STAGE_TIMEOUTS['geocode'])
+    except Exception as e:
+        logger.error("批量规划地理编码失败: %s", e)
+        coordinates = {}
+    return coordinates, time.monotonic() - started
+
+
+def _dispatch(planner, group, coordinates, routing, pending, live, forecasts):
+    """提交一个城市各条目的路线规划，不需要规划路线的条目直接产出结果"""
+    for item in group:
+        if len(item.parsed) >= 2:
+            # 多日行程每天的路线分别提交，与orchestrator.run_multi_day_plan一样并行规划
+            if item.days > 1:
+                stops = {day: item.parsed.for_day(day) for day in item.parsed.days()}
+            else:
+                stops = {None: item.parsed}
+            item.route_pending = len(stops)
+            item.route_started = time.monotonic()
+            # 行程生成后的上游请求排在新规划前面；with块中没有yield，优先级不会泄漏到调用方
+            with upstream.prioritized(upstream.HIGH):
+                for day, day_stops in stops.items():
+                    route_future = executor.submit(planner.plan_route, day_stops.locations, coordinates,
+                                                   day_stops.groups())
+                    routing[route_future] = (item, day, day_stops, coordinates)
+                    pending.add(route_future)
+        elif item.days > 1:
+            yield from _finish(item, {}, live, forecasts)
+        else:
+            error = "无法提取地点信息" if not item.parsed.locations else "需要至少两个地点才能规划路线"
+            yield from _finish(item, {"error": error}, live, forecasts)
+
+
+def _assemble(item, weather_info, casts, route):
+    """组合与 /plan_trip 相同格式的结果"""
+    result = {'weather': None, 'itinerary': item.itinerary, 'stops': item.parsed.to_list()}
+    if item.days > 1:
+        casts = casts[:item.days] if casts else None
+        result['weather'] = weather.format_forecast(item.location, casts)
+        result['days'] = day_summaries(item.parsed, route or {}, casts)
+    else:
+        result['weather'] = weather_info
+        result['route'] = route
+    result.update(item.run.summary())
+    return result
+
+
+def _fail(item):
+    """行程生成失败的条目不写入响应缓存，为参数相同的每个条目产出一行错误"""
+    BULK_ITEMS.inc(result='failed')
+    for index in item.indexes:
+        yield _line(index, error=item.error)
+
+
+def _finish(item, route, live, forecasts):
+    """组合条目的结果并写入响应缓存，为参数相同的每个条目产出一行"""
+    timeout = Config.STAGE_TIMEOUTS['weather']
+    weather_info = _result(live[item.city], timeout) if item.days == 1 else None
+    casts = _result(forecasts[item.city], timeout) if item.days > 1 else None
+    body, etag = response_cache.respond(item.key, _assemble(item, weather_info, casts, route))
+    BULK_ITEMS.inc(result='planned')
+    for index in item.indexes:
+        yield _result_line(index, body, etag)
+
+
+def stream(planner, data_items):
+    """
+    执行批量规划，按完成顺序产出NDJSON行
+
+    参数:
+        planner (TripPlanner): 同步规划器
+        data_items (list): parse_items校验过的规划参数列表
+
+    返回:
+        generator: 每个条目产出一行bytes，参数相同的条目各自产出一行
+    """
+    items = {}
+    for index, data in enumerate(data_items):
+        if not isinstance(data, dict) or not isinstance(data.get('location'), str) or not data['location'].strip():
+            BULK_ITEMS.inc(result='invalid')
+            yield _line(index, error="缺少城市名称")
+            continue
+        key = response_cache.make_key(data)
+        if key in items:
+            BULK_ITEMS.inc(result='deduplicated')
+            items[key].indexes.append(index)
+            continue
+        cached = response_cache.lookup(key)
+        if cached is not None:
+            BULK_ITEMS.inc(result='cached')
+            yield _result_line(index, *cached)
+            continue
+        items[key] = BulkItem(key, data, index)
+
+    cities = {}
+    for item in items.values():
+        cities.setdefault(item.city, []).append(item)
+
+    # 每个城市只查询一次天气：单日行程使用实况，多日行程使用逐日预报
+    live, forecasts = {}, {}
+    for city, group in cities.items():
+        location = group[0].location
+        if any(item.days == 1 for item in group):
+            live[city] = executor.submit(planner.get_weather_forecast, location)
+        if any(item.days > 1 for item in group):
+            forecasts[city] = executor.submit(planner.get_forecast, location)
+
+    # 按城市顺序提交行程生成，同一城市的条目尽早全部完成
+    generating = {}
+    for group in cities.values():
+        for item in group:
+            future = _llm_executor.submit(
+                _timed, item.run, 'itinerary', planner.plan_itinerary,
+                item.location, item.interests, item.dietary_preferences, item.days
+            )
+            generating[future] = item
+    waiting = {city: len(group) for city, group in cities.items()}
+    geocoding = {}
+    routing = {}
+    pending = set(generating)
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future in generating:
+                item = generating.pop(future)
+                try:
+                    item.itinerary, item.parsed = future.result()
+                except Exception as e:
+                    logger.error("批量规划生成行程失败: %s", e)
+                    item.error = f"行程生成失败: {e}"
+                else:
+                    if not item.itinerary:
+                        item.error = "行程生成失败"
+                city = item.city
+                waiting[city] -= 1
+                if waiting[city]:
+                    continue
+
+                # 生成失败的条目输出错误，与空行程区分
+                group = []
+                for entry in cities[city]:
+                    if entry.error:
+                        yield from _fail(entry)
+                    else:
+                        group.append(entry)
+
+                # 城市的行程全部生成后，所有条目的地点合并为一次批量地理编码，在线程池中执行，
+                # 等待编码期间其他城市已完成的条目照常输出
+                routable = [entry for entry in group if len(entry.parsed) >= 2]
+                names = [name for entry in routable for name in entry.parsed.locations]
+                if names:
+                    with upstream.prioritized(upstream.HIGH):
+                        geocode_future = executor.submit(_geocode, planner, names, routable[0].location)
+                    geocoding[geocode_future] = group
+                    pending.add(geocode_future)
+                else:
+                    yield from _dispatch(planner, group, {}, routing, pending, live, forecasts)
+            elif future in geocoding:
+                group = geocoding.pop(future)
+                coordinates, elapsed = future.result()
+                # 一次编码计入一次阶段耗时，各条目的timings都记录这次编码的耗时
+                metrics.STAGE_SECONDS.observe(elapsed, stage='geocode')
+                for entry in group:
+                    if len(entry.parsed) >= 2:
+                        entry.run.timings['geocode'] = round(elapsed, 3)
+                yield from _dispatch(planner, group, coordinates, routing, pending, live, forecasts)
+            else:
+                item, day, day_stops, coordinates = routing.pop(future)
+                route = _result(future, None)
+                if day is not None:
+                    # 某一天规划失败时与orchestrator一样本地估算
+                    item.routes[day] = route or planner.fallback_route(
+                        day_stops.locations, coordinates, day_stops.groups()
+                    )
+                item.route_pending -= 1
+                if not item.route_pending:
+                    item.run.record('route', time.monotonic() - item.route_started)
+                    yield from _finish(item, item.routes if item.days > 1 else route, live, forecasts)
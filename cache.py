@@ -0,0 +1,166 @@
+"""
+进程内缓存工具
+
+提供线程安全、带过期时间和容量上限的LRU缓存。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+
+class TTLCache:
+    """带TTL的LRU缓存，超出容量时淘汰最久未使用的条目"""
+
+    def __init__(self, max_entries, ttl):
+        """
+        参数:
+            max_entries (int): 最多保留的条目数
+            ttl (float): 默认有效期（秒）
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (过期时间, 值)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        读取缓存，过期条目视为未命中并被删除
+
+        参数:
+            key: 缓存键
+            default: 未命中时返回的值
+
+        返回:
+            缓存的值或default
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """
+        写入缓存
+
+        参数:
+            key: 缓存键
+            value: 缓存的值
+            ttl (float): 有效期（秒），默认使用构造时的ttl
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """删除缓存条目"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __contains__(self, key):
+        """判断键是否存在且未过期，不影响命中统计和LRU顺序"""
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """返回缓存的命中统计"""
+        return {'entries': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+
+class SingleFlight:
+    """合并相同键的并发调用，同一时刻每个键只执行一次"""
+
+    def __init__(self):
+        self._calls = {}  # key -> _Call
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """
+        执行func，若相同键的调用正在进行则等待并共享其结果
+
+        参数:
+            key: 调用键
+            func (callable): 无参函数
+
+        返回:
+            func的返回值；func抛出的异常会传递给所有等待者
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+        else:
+            try:
+                call.result = func()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.event.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self, key):
+        """判断某个键是否有正在进行的调用"""
+        with self._lock:
+            return key in self._calls
+
+
+class _Call:
+    """一次正在进行的调用"""
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class WarmTracker:
+    """记录预热写入的缓存条目，统计它们之后服务了多少线上请求"""
+
+    def __init__(self):
+        self._keys = {}  # 缓存名 -> 预热写入的键集合
+        self._lock = threading.Lock()
+
+    def mark(self, cache, key):
+        """记录预热写入的条目"""
+        with self._lock:
+            self._keys.setdefault(cache, set()).add(key)
+
+    def hit(self, cache, key):
+        """线上请求命中缓存时调用，命中的是预热条目时计数"""
+        keys = self._keys.get(cache)
+        if keys and key in keys:
+            metrics.PREWARM_HITS.inc(cache=cache)
+
+    def count(self, cache):
+        """预热写入过的条目数"""
+        return len(self._keys.get(cache, ()))
+
+
+# 进程内共享的预热条目记录
+warm_entries = WarmTracker()
@@ -0,0 +1,75 @@
+"""
+响应压缩
+
+根据请求的Accept-Encoding选择brotli或gzip压缩JSON响应。
+brotli为可选依赖，未安装时只使用gzip。
+"""
+import gzip
+
+from config import Config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # 比默认的11快得多，压缩率接近
+
+
+def accepted_encodings(accept_encoding):
+    """
+    解析Accept-Encoding请求头
+
+    返回:
+        set: q值大于0的编码名称
+    """
+    encodings = set()
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            encodings.add(name)
+    return encodings
+
+
+def choose_encoding(accept_encoding):
+    """选择客户端支持的编码，优先brotli，都不支持时返回None"""
+    encodings = accepted_encodings(accept_encoding)
+    if brotli is not None and ('br' in encodings or '*' in encodings):
+        return 'br'
+    if 'gzip' in encodings or '*' in encodings:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    """按编码压缩响应字节"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # 固定mtime，相同的内容压缩结果相同
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+
+def response_encoding(body, accept_encoding):
+    """
+    决定响应使用的编码，不实际压缩，304响应也据此给出一致的ETag
+
+    参数:
+        body (bytes): 响应字节
+        accept_encoding (str): 请求头的值
+
+    返回:
+        str: 'br'或'gzip'，不压缩时返回None
+    """
+    if len(body) < Config.COMPRESS_MIN_SIZE:
+        return None
+    return choose_encoding(accept_encoding)
@@ -1,7 +1,7 @@
 import os
 from dotenv import load_dotenv
 
-# 加载环境变量
+# 加载环境变量，整个进程只在这里加载一次，其他模块从Config读取
 load_dotenv()
 
 # API密钥配置
@@ -14,13 +14,144 @@ class Config:
     DEBUG = True
     
     # 高德地图API配置
-    AMAP_BASE_URL = "https://restapi.amap.com/v3"
+    AMAP_BASE_URL = os.getenv('AMAP_BASE_URL', "https://restapi.amap.com/v3")
     
     # DeepSeek配置
     DEEPSEEK_MODEL = "deepseek-chat"
+    DEEPSEEK_BASE_URL = os.getenv('DEEPSEEK_BASE_URL', "https://api.deepseek.com")
     
     # OpenAI配置
     OPENAI_MODEL = "gpt-3.5-turbo"
     
     # 天气API配置
-    WEATHER_BASE_URL = "https://api.weatherapi.com/v1" 
\ No newline at end of file
+    WEATHER_BASE_URL = "https://api.weatherapi.com/v1"
+
+    # 并发编排配置
+    PLANNER_MAX_WORKERS = int(os.getenv('PLANNER_MAX_WORKERS', 16))  # 共享线程池大小
+    PLAN_DEADLINE = float(os.getenv('PLAN_DEADLINE', 60))  # 单个请求的整体截止时间（秒）
+    STAGE_TIMEOUTS = {  # 各阶段的最长等待时间（秒）
+        'weather': float(os.getenv('WEATHER_TIMEOUT', 5)),
+        'itinerary': float(os.getenv('ITINERARY_TIMEOUT', 45)),
+        'geocode': float(os.getenv('GEOCODE_TIMEOUT', 10)),
+        'route': float(os.getenv('ROUTE_TIMEOUT', 12)),
+    }
+
+    # 地理编码缓存配置
+    GEOCODE_CACHE_PATH = os.getenv('GEOCODE_CACHE_PATH', 'cache/geocode.sqlite3')
+    GEOCODE_CACHE_TTL = float(os.getenv('GEOCODE_CACHE_TTL', 30 * 24 * 3600))  # 成功结果保留30天
+    GEOCODE_NEGATIVE_TTL = float(os.getenv('GEOCODE_NEGATIVE_TTL', 24 * 3600))  # 失败结果保留1天
+    GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv('GEOCODE_CACHE_MAX_ENTRIES', 100000))
+    CITY_SCOPE_CACHE_SIZE = int(os.getenv('CITY_SCOPE_CACHE_SIZE', 1000))  # 内存中缓存的城市行政区划条目数
+    POI_INDEX_PATH = os.getenv('POI_INDEX_PATH', 'cache/poi.idx')  # 离线POI索引，文件不存在时不使用
+
+    # HTTP连接池配置
+    HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 10))  # 缓存的主机连接池数量
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 32))  # 每个主机的最大连接数
+    HTTP_POOL_BLOCK = os.getenv('HTTP_POOL_BLOCK', 'false').lower() == 'true'
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 10))
+
+    # 行程缓存配置
+    ITINERARY_CACHE_MAX_ENTRIES = int(os.getenv('ITINERARY_CACHE_MAX_ENTRIES', 2000))
+    ITINERARY_CACHE_TTL = float(os.getenv('ITINERARY_CACHE_TTL', 6 * 3600))  # 行程缓存6小时
+    ITINERARY_CACHE_SIMILARITY = float(os.getenv('ITINERARY_CACHE_SIMILARITY', 0))  # 兴趣近似匹配阈值，0表示关闭
+
+    ITINERARY_FORMAT = os.getenv('ITINERARY_FORMAT', 'json').lower()  # json: 结构化输出；markdown: 自由文本输出
+
+    # 完整响应缓存配置
+    RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'memory').lower()  # memory、redis或none
+    RESPONSE_CACHE_URL = os.getenv('RESPONSE_CACHE_URL', 'redis://127.0.0.1:6379/0')  # redis后端的连接地址
+    RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 30 * 60))  # 响应中包含天气，与天气缓存的新鲜期一致
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 500))
+
+    # 异步规划任务配置
+    JOB_DB_PATH = os.getenv('JOB_DB_PATH', 'cache/jobs.sqlite3')  # 任务和结果的存储位置，工作进程与web进程共用
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))  # 本进程执行任务的线程数，0表示只接收任务
+    JOB_QUEUE_LIMIT = int(os.getenv('JOB_QUEUE_LIMIT', 100))  # 最多排队的任务数，超过后返回429
+    JOB_TTL = float(os.getenv('JOB_TTL', 3600))  # 已结束的任务保留多久（秒）
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 0.5))  # 工作线程和长轮询检查任务表的间隔（秒）
+    JOB_WAIT_MAX = float(os.getenv('JOB_WAIT_MAX', 30))  # 长轮询最多等待的秒数
+    JOB_HEARTBEAT_INTERVAL = float(os.getenv('JOB_HEARTBEAT_INTERVAL', 5))  # 执行中的任务刷新心跳的间隔（秒），超过3倍间隔未刷新的任务被重新领取
+
+    # 批量规划配置
+    BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', 200))  # 一次批量请求最多的条目数
+    BULK_LLM_CONCURRENCY = int(os.getenv('BULK_LLM_CONCURRENCY', 4))  # 所有批量请求同时生成行程的上限
+
+    # 多日行程配置
+    MAX_TRIP_DAYS = int(os.getenv('MAX_TRIP_DAYS', 7))  # 最多支持的天数
+
+    # 天气缓存配置
+    WEATHER_CACHE_TTL = float(os.getenv('WEATHER_CACHE_TTL', 30 * 60))  # 实况天气30分钟内视为新鲜
+    WEATHER_STALE_TTL = float(os.getenv('WEATHER_STALE_TTL', 2 * 3600))  # 过期后2小时内仍可先返回再后台刷新
+    WEATHER_CACHE_MAX_ENTRIES = int(os.getenv('WEATHER_CACHE_MAX_ENTRIES', 1000))
+
+    # 异步服务配置
+    ASYNC_MAX_CONNECTIONS = int(os.getenv('ASYNC_MAX_CONNECTIONS', 200))  # 异步客户端的最大并发连接数
+
+    # 上游限流配置
+    AMAP_KEYS = [key.strip() for key in os.getenv('AMAP_KEYS', AMAP_KEY or '').split(',') if key.strip()]  # 多个高德密钥用逗号分隔
+    DEEPSEEK_API_KEYS = [key.strip() for key in os.getenv('DEEPSEEK_API_KEYS', DEEPSEEK_API_KEY or '').split(',') if key.strip()]
+    UPSTREAM_KEY_SELECTION = os.getenv('UPSTREAM_KEY_SELECTION', 'round_robin').lower()  # round_robin或least_loaded
+    UPSTREAM_RATE_LIMITS = {  # 每个密钥在各接口上的每秒请求数，0表示不限流
+        'geocode': float(os.getenv('AMAP_GEOCODE_QPS', 30)),
+        'direction': float(os.getenv('AMAP_DIRECTION_QPS', 30)),
+        'weather': float(os.getenv('AMAP_WEATHER_QPS', 30)),
+        'config': float(os.getenv('AMAP_DISTRICT_QPS', 30)),
+        'chat': float(os.getenv('DEEPSEEK_CHAT_QPS', 10)),
+    }
+    UPSTREAM_QUEUE_TIMEOUT = float(os.getenv('UPSTREAM_QUEUE_TIMEOUT', 5))  # 排队等待令牌的最长时间（秒）
+    BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', 5))  # 连续失败多少次后熔断，0表示不熔断
+    BREAKER_COOLDOWN = float(os.getenv('BREAKER_COOLDOWN', 30))  # 熔断后多久放行一个探测请求（秒）
+
+    # 缓存预热配置
+    PREWARM_CITIES = os.getenv('PREWARM_CITIES', '北京,上海,广州,深圳,杭州,成都,西安,南京,重庆,苏州')  # 按热门程度排列
+    PREWARM_COMBOS = os.getenv('PREWARM_COMBOS', '历史文化:无;美食:无')  # 兴趣:饮食偏好，组合之间用分号分隔
+    PREWARM_BUDGET = int(os.getenv('PREWARM_BUDGET', 100))  # 每轮预热最多发出的上游请求数
+    PREWARM_INTERVAL = float(os.getenv('PREWARM_INTERVAL', 0))  # 定时预热的间隔（秒），0表示不定时预热
+    PREWARM_STREAM = os.getenv('PREWARM_STREAM', 'true').lower() == 'true'  # 是否同时预热流式接口使用的Markdown行程
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')  # 管理接口的访问令牌，未配置时只允许本机访问
+
+    # 日志配置
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+
+    # 多进程部署配置
+    WEB_WORKERS = int(os.getenv('WEB_WORKERS', 4))  # gunicorn工作进程数
+    WEB_BIND = os.getenv('WEB_BIND', '0.0.0.0:5000')  # gunicorn监听地址
+    PRELOAD_APP = os.getenv('PRELOAD_APP', 'true').lower() == 'true'  # 是否在fork工作进程前导入应用并执行预加载
+
+    # 路线优化配置
+    ROUTE_OPTIMIZE = os.getenv('ROUTE_OPTIMIZE', 'true').lower() == 'true'  # 规划路线前是否优化游览顺序
+    ROUTE_PAYLOAD = os.getenv('ROUTE_PAYLOAD', 'slim').lower()  # slim只返回页面使用的字段，full返回高德的完整响应
+    ROUTE_POLYLINE_ZOOM = int(os.getenv('ROUTE_POLYLINE_ZOOM', 14))  # 按该地图缩放级别简化路线坐标，0表示不简化
+
+    # 分段路线缓存配置
+    ROUTE_STRATEGY = os.getenv('ROUTE_STRATEGY', '0')  # 高德驾车路线策略，0为速度优先
+    ROUTE_LEG_CACHE = os.getenv('ROUTE_LEG_CACHE', 'true').lower() == 'true'  # 按相邻地点分段请求并缓存路线，ROUTE_PAYLOAD为full时不使用
+    ROUTE_LEG_CACHE_PATH = os.getenv('ROUTE_LEG_CACHE_PATH', 'cache/route_legs.sqlite3')
+    ROUTE_LEG_CACHE_TTL = float(os.getenv('ROUTE_LEG_CACHE_TTL', 7 * 24 * 3600))  # 路段保留7天
+    ROUTE_LEG_CACHE_MAX_ENTRIES = int(os.getenv('ROUTE_LEG_CACHE_MAX_ENTRIES', 50000))
+    ROUTE_LEG_PRECISION = int(os.getenv('ROUTE_LEG_PRECISION', 4))  # 缓存键中坐标保留的小数位数，4位约10米
+    ROUTE_LEG_CONCURRENCY = int(os.getenv('ROUTE_LEG_CONCURRENCY', 8))  # 同时请求的路段数
+
+    # 对冲请求与自适应超时配置
+    HEDGE = os.getenv('HEDGE', 'true').lower() == 'true'  # 高德请求超过P95未返回时发出对冲请求
+    HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 0.95))  # 发出对冲请求的耗时分位数
+    HEDGE_BUDGET = float(os.getenv('HEDGE_BUDGET', 0.1))  # 对冲请求最多占高德请求的比例
+    HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', 0.05))  # 发出对冲请求前至少等待的秒数
+    HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', 20))  # 样本少于该数时不对冲，使用默认超时
+    HEDGE_WINDOW = int(os.getenv('HEDGE_WINDOW', 200))  # 每个接口保留的最近耗时样本数
+    HEDGE_TIMEOUT_FACTOR = float(os.getenv('HEDGE_TIMEOUT_FACTOR', 3))  # 读取超时为P99耗时的倍数
+    HEDGE_MIN_TIMEOUT = float(os.getenv('HEDGE_MIN_TIMEOUT', 1))  # 自适应读取超时的下限（秒）
+    HEDGE_MAX_WORKERS = int(os.getenv('HEDGE_MAX_WORKERS', 32))  # 执行对冲请求的线程数
+    LLM_HEDGE = os.getenv('LLM_HEDGE', 'false').lower() == 'true'  # 非流式的行程生成是否对冲，会额外消耗token
+    LLM_HEDGE_BUDGET = float(os.getenv('LLM_HEDGE_BUDGET', 0.05))  # 对冲的行程生成最多占生成次数的比例
+
+    # 路线降级配置
+    ROUTE_DEGRADE = os.getenv('ROUTE_DEGRADE', 'auto').lower()  # auto: 按SLO和熔断自动降级；always: 始终本地估算；never: 不降级
+    ROUTE_SLO = float(os.getenv('ROUTE_SLO', 3))  # 单次路线规划的耗时目标（秒），也是请求高德的读取超时
+    DEGRADED_ROAD_FACTOR = float(os.getenv('DEGRADED_ROAD_FACTOR', 1.4))  # 行驶距离与直线距离之比
+    DEGRADED_SPEED_KMH = float(os.getenv('DEGRADED_SPEED_KMH', 25))  # 估算时间使用的市区平均车速
+    DEGRADED_PROBE_INTERVAL = float(os.getenv('DEGRADED_PROBE_INTERVAL', 15))  # 降级期间放行真实请求的间隔（秒）
+
+    # 响应压缩配置
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))  # 小于该字节数的响应不压缩
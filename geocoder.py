@@ -0,0 +1,464 @@
+"""
+地理编码模块
+
+负责把行程中的地点名称解析为坐标：
+- 通过高德行政区域查询把请求的城市解析为adcode，地理编码限定在该城市内
+- 优先查询离线POI索引，其次是本地SQLite缓存，带TTL、LRU淘汰和失败结果的负缓存
+- 未命中的地点使用高德批量地理编码接口（batch=true）一次解析多个
+- 多个批次并发请求
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import TimeoutError as FutureTimeoutError, wait
+
+from config import Config
+from storage import SQLiteStore
+from cache import SingleFlight, TTLCache, warm_entries
+from poi_index import get_index
+import metrics
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_URL = f"{Config.AMAP_BASE_URL}/geocode/geo"
+DISTRICT_URL = f"{Config.AMAP_BASE_URL}/config/district"
+
+# 高德批量地理编码每次最多支持10个地址
+BATCH_SIZE = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS geocodes (
+    city TEXT NOT NULL,
+    name TEXT NOT NULL,
+    location TEXT,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (city, name)
+);
+CREATE INDEX IF NOT EXISTS idx_geocodes_last_access ON geocodes (last_access);
+CREATE TABLE IF NOT EXISTS cities (
+    city TEXT PRIMARY KEY,
+    adcode TEXT,
+    name TEXT,
+    expires_at REAL NOT NULL
+);
+"""
+
+# 城市的行政区划信息，adcode为None表示行政区域查询失败，只按城市名称限定
+CityScope = namedtuple('CityScope', ['adcode', 'name'])
+
+
+def scope_key(scope):
+    """缓存中区分城市使用的键"""
+    if scope is None:
+        return ''
+    return scope.adcode or scope.name
+
+
+class GeocodeCache:
+    """地理编码结果的持久化缓存"""
+
+    def __init__(self, path, ttl, negative_ttl, max_entries):
+        """
+        参数:
+            path (str): SQLite数据库路径
+            ttl (float): 成功结果的有效期（秒）
+            negative_ttl (float): 解析失败结果的有效期（秒）
+            max_entries (int): 最多保留的条目数，超出后按最近访问时间淘汰
+        """
+        self.store = SQLiteStore(path, _SCHEMA)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+
+    def get_many(self, city, names):
+        """
+        批量查询缓存
+
+        参数:
+            city (str): 城市名称
+            names (list): 地点名称列表
+
+        返回:
+            dict: 命中的地点到坐标的映射，负缓存命中的值为None
+        """
+        if not names:
+            return {}
+        now = time.time()
+        placeholders = ','.join('?' * len(names))
+        rows = self.store.execute(
+            f"SELECT name, location FROM geocodes WHERE city = ? AND expires_at > ? AND name IN ({placeholders})",
+            (city, now, *names)
+        ).fetchall()
+        if rows:
+            # 更新访问时间，供LRU淘汰使用
+            self.store.executemany(
+                "UPDATE geocodes SET last_access = ? WHERE city = ? AND name = ?",
+                [(now, city, name) for name, _ in rows]
+            )
+        return dict(rows)
+
+    def put_many(self, city, results):
+        """
+        写入解析结果
+
+        参数:
+            city (str): 城市名称
+            results (dict): 地点到坐标的映射，值为None表示解析失败
+        """
+        if not results:
+            return
+        now = time.time()
+        self.store.executemany(
+            "INSERT OR REPLACE INTO geocodes (city, name, location, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+            [
+                (city, name, location, now + (self.ttl if location else self.negative_ttl), now)
+                for name, location in results.items()
+            ]
+        )
+        self.evict()
+
+    def get_city(self, city):
+        """
+        查询缓存的城市行政区划信息
+
+        返回:
+            CityScope: 未缓存或已过期时返回None
+        """
+        row = self.store.execute(
+            "SELECT adcode, name FROM cities WHERE city = ? AND expires_at > ?", (city, time.time())
+        ).fetchone()
+        return CityScope(*row) if row else None
+
+    def put_city(self, city, scope):
+        """写入城市的行政区划信息，查询不到的城市使用负缓存有效期"""
+        ttl = self.ttl if scope.adcode else self.negative_ttl
+        self.store.execute(
+            "INSERT OR REPLACE INTO cities (city, adcode, name, expires_at) VALUES (?, ?, ?, ?)",
+            (city, scope.adcode, scope.name, time.time() + ttl)
+        )
+
+    def evict(self):
+        """删除过期条目，并在超出容量时淘汰最久未访问的条目"""
+        self.store.execute("DELETE FROM geocodes WHERE expires_at <= ?", (time.time(),))
+        self.store.execute(
+            "DELETE FROM geocodes WHERE rowid IN ("
+            "SELECT rowid FROM geocodes ORDER BY last_access "
+            "LIMIT max(0, (SELECT COUNT(*) FROM geocodes) - ?))",
+            (self.max_entries,)
+        )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """获取进程内共享的地理编码缓存，首次调用时创建"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = GeocodeCache(
+                    Config.GEOCODE_CACHE_PATH,
+                    ttl=Config.GEOCODE_CACHE_TTL,
+                    negative_ttl=Config.GEOCODE_NEGATIVE_TTL,
+                    max_entries=Config.GEOCODE_CACHE_MAX_ENTRIES
+                )
+    return _cache
+
+
+class Geocoder:
+    """带缓存的批量地理编码器"""
+
+    def __init__(self, session, amap_key, executor, cache=None, index=None):
+        """
+        参数:
+            session (requests.Session): 发送请求使用的会话
+            amap_key (str): 高德地图API密钥
+            executor (Executor): 并发执行批量请求的线程池
+            cache (GeocodeCache): 缓存实例，默认使用进程内共享缓存
+            index (POIIndex): 离线POI索引，默认使用POI_INDEX_PATH配置的索引
+        """
+        self.session = session
+        self.amap_key = amap_key
+        self.executor = executor
+        self._cache = cache
+        self._index = index
+        # 城市名称到CityScope的进程内缓存，有效期与本地缓存一致
+        self._scopes = TTLCache(Config.CITY_SCOPE_CACHE_SIZE, Config.GEOCODE_CACHE_TTL)
+        self._flight = SingleFlight()
+
+    @property
+    def cache(self):
+        """地理编码缓存，未指定时在首次使用时获取共享缓存"""
+        if self._cache is None:
+            self._cache = get_cache()
+        return self._cache
+
+    @property
+    def index(self):
+        """离线POI索引，未配置时为None"""
+        if self._index is None:
+            self._index = get_index()
+        return self._index
+
+    def district_params(self, city):
+        """构建行政区域查询请求参数"""
+        return {'key': self.amap_key, 'keywords': city, 'subdistrict': 0}
+
+    @staticmethod
+    def parse_district_response(city, result):
+        """
+        解析行政区域查询响应
+
+        返回:
+            CityScope: 查询不到该城市时adcode为None
+        """
+        if result.get('status') != '1':
+            raise RuntimeError(f"行政区域查询API返回错误: {result.get('info')}")
+        districts = result.get('districts') or []
+        if not districts or not districts[0].get('adcode'):
+            return CityScope(None, city)
+        return CityScope(districts[0]['adcode'], districts[0].get('name') or city)
+
+    def cached_scope(self, city):
+        """查询内存或本地缓存中的城市行政区划信息，未缓存时返回None"""
+        scope = self._scopes.get(city)
+        if scope is None:
+            scope = self.cache.get_city(city)
+            if scope is not None:
+                self._remember_scope(city, scope)
+        return scope
+
+    def _remember_scope(self, city, scope):
+        self._scopes.set(city, scope, None if scope.adcode else Config.GEOCODE_NEGATIVE_TTL)
+
+    def store_scope(self, city, scope):
+        """缓存城市的行政区划信息"""
+        self._remember_scope(city, scope)
+        self.cache.put_city(city, scope)
+        return scope
+
+    def scope(self, city):
+        """
+        把城市名称解析为行政区划信息，同一城市的并发查询只请求一次
+
+        参数:
+            city (str): 城市名称，如"苏州"、"苏州市"
+
+        返回:
+            CityScope: 城市为空时返回None，查询失败时只带城市名称
+        """
+        city = (city or '').strip()
+        if not city:
+            return None
+        scope = self.cached_scope(city)
+        if scope is None:
+            try:
+                scope = self._flight.do(city, lambda: self._load_scope(city))
+            except Exception as e:
+                logger.warning("查询城市adcode失败: %s", e)
+                scope = CityScope(None, city)
+        return scope
+
+    def _load_scope(self, city):
+        response = self.session.get(DISTRICT_URL, params=self.district_params(city))
+        return self.store_scope(city, self.parse_district_response(city, response.json()))
+
+    def lookup_local(self, scope, names):
+        """
+        在离线POI索引和本地缓存中查找地点
+
+        参数:
+            scope (CityScope): 城市行政区划信息
+            names (list): 去重后的地点名称列表
+
+        返回:
+            dict: 命中的地点到坐标的映射，负缓存命中的值为None
+        """
+        results = {}
+        index = self.index
+        if index is not None and scope is not None and scope.adcode:
+            for name in names:
+                location = self._lookup_index(index, scope, name)
+                if location:
+                    results[name] = location
+            metrics.CACHE_REQUESTS.inc(len(results), cache='poi_index', result='hit')
+            metrics.CACHE_REQUESTS.inc(len(names) - len(results), cache='poi_index', result='miss')
+
+        remaining = [name for name in names if name not in results]
+        key = scope_key(scope)
+        cached = self.cache.get_many(key, remaining)
+        for name in cached:
+            warm_entries.hit('geocode', (key, name))
+        metrics.CACHE_REQUESTS.inc(len(cached), cache='geocode', result='hit')
+        metrics.CACHE_REQUESTS.inc(len(remaining) - len(cached), cache='geocode', result='miss')
+        results.update(cached)
+        return results
+
+    @staticmethod
+    def _lookup_index(index, scope, name):
+        """精确匹配规范化名称，其次去掉城市名前缀，最后接受唯一的前缀匹配"""
+        location = index.lookup(scope.adcode, name)
+        short = scope.name.rstrip('市')
+        if location is None and short and name.startswith(short) and len(name) > len(short):
+            location = index.lookup(scope.adcode, name[len(short):])
+        if location is None:
+            matches = index.search(scope.adcode, name, limit=2)
+            if len(matches) == 1:
+                location = matches[0][1]
+        return location
+
+    def geocode(self, name, city=None):
+        """
+        在当前线程中解析单个地点，适合已经运行在线程池中的调用方
+
+        参数:
+            name (str): 地点名称
+            city (str): 限定搜索的城市
+
+        返回:
+            str: "经度,纬度"格式的坐标，如果获取失败则返回None
+        """
+        scope = self.scope(city)
+        cached = self.lookup_local(scope, [name])
+        if name in cached:
+            return cached[name]
+        try:
+            result = self._resolve_batch([name], scope)
+        except Exception as e:
+            logger.warning("获取地点坐标时发生错误: %s", e)
+            return None
+        self.cache.put_many(scope_key(scope), result)
+        return result[name]
+
+    def resolve_many(self, names, city=None, timeout=None):
+        """
+        并发解析多个地点，优先使用离线索引和缓存
+
+        参数:
+            names (list): 地点名称列表
+            city (str): 限定搜索的城市
+            timeout (float): 最长等待秒数，None表示一直等待
+
+        返回:
+            dict: 地点到坐标的映射，失败或超时的地点值为None
+        """
+        names = list(dict.fromkeys(names))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        scope = self._scope_before(city, deadline)
+        results = self.lookup_local(scope, names)
+        misses = [name for name in names if name not in results]
+        if not misses:
+            return results
+
+        # 未命中的地点按批次并发请求
+        batches = [misses[i:i + BATCH_SIZE] for i in range(0, len(misses), BATCH_SIZE)]
+        futures = [self.executor.submit(self._resolve_batch, batch, scope) for batch in batches]
+        done, not_done = wait(futures, timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+
+        resolved = {}
+        for future in futures:
+            if future in done and future.exception() is None:
+                resolved.update(future.result())
+            elif future in done:
+                logger.warning("批量地理编码失败: %s", future.exception())
+            else:
+                future.cancel()
+
+        # 只缓存确定的结果，请求异常或超时的地点下次重新请求
+        self.cache.put_many(scope_key(scope), resolved)
+        for name in misses:
+            results[name] = resolved.get(name)
+        return results
+
+    def _scope_before(self, city, deadline):
+        """在截止时间前解析城市，超时时按查询失败处理，查询在后台继续并写入缓存"""
+        city = (city or '').strip()
+        if deadline is None or not city:
+            return self.scope(city)
+        scope = self.cached_scope(city)
+        if scope is not None:
+            return scope
+        future = self.executor.submit(self.scope, city)
+        try:
+            return future.result(max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            logger.warning("查询城市adcode超时: %s", city)
+            return CityScope(None, city)
+
+    @staticmethod
+    def scoped_addresses(names, scope):
+        """带上城市名称前缀的地址，没有限定城市时使用原名"""
+        if scope is None:
+            return list(names)
+        return [name if name.startswith(scope.name) else f"{scope.name}{name}" for name in names]
+
+    def _resolve_batch(self, names, scope=None):
+        """
+        解析一个批次的地点：先带城市前缀搜索，失败的地点再用原名重试
+
+        返回:
+            dict: 地点到坐标的映射，未找到的地点值为None
+        """
+        results = dict(zip(names, self._batch_request(self.scoped_addresses(names, scope), scope)))
+        retry = [name for name in names if not results[name]] if scope is not None else []
+        if retry:
+            results.update(zip(retry, self._batch_request(retry, scope)))
+
+        for name, location in results.items():
+            if location:
+                logger.debug("成功获取坐标: %s -> %s", name, location)
+            else:
+                logger.info("无法获取地点坐标: %s", name)
+        return results
+
+    def batch_params(self, addresses, scope=None):
+        """构建批量地理编码请求参数，限定在scope对应的城市内"""
+        params = {
+            'key': self.amap_key,
+            'address': '|'.join(addresses),
+            'batch': 'true'
+        }
+        if scope is not None:
+            params['city'] = scope.adcode or scope.name
+        return params
+
+    @staticmethod
+    def parse_batch_response(result, count):
+        """
+        解析批量地理编码响应
+
+        参数:
+            result (dict): 高德接口返回的JSON
+            count (int): 请求中的地址数量
+
+        返回:
+            list: 与地址一一对应的坐标，未找到的为None
+        """
+        if result.get('status') != '1':
+            raise RuntimeError(f"地理编码API返回错误: {result.get('info')}")
+
+        geocodes = result.get('geocodes') or []
+        locations = []
+        for i in range(count):
+            # 批量模式下未匹配的地址返回空列表而不是坐标字符串
+            location = geocodes[i].get('location') if i < len(geocodes) else None
+            locations.append(location if isinstance(location, str) and location else None)
+        return locations
+
+    def _batch_request(self, addresses, scope=None):
+        """
+        调用高德批量地理编码接口
+
+        参数:
+            addresses (list): 地址列表，最多BATCH_SIZE个
+            scope (CityScope): 限定搜索的城市
+
+        返回:
+            list: 与地址一一对应的坐标，未找到的为None
+        """
+        response = self.session.get(GEOCODE_URL, params=self.batch_params(addresses, scope))
+        return self.parse_batch_response(response.json(), len(addresses))
@@ -0,0 +1,27 @@
+"""
+gunicorn配置
+
+    gunicorn app:app
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+
+PRELOAD_APP开启时主进程先导入应用并执行startup.preload()，工作进程fork后以写时复制共享
+已导入的模块、预编译的正则和离线索引；每个工作进程在post_fork中启动自己的后台线程。
+"""
+from config import Config
+import startup
+
+bind = Config.WEB_BIND
+workers = Config.WEB_WORKERS
+preload_app = Config.PRELOAD_APP
+
+# 导入应用时推迟后台线程，等fork后在工作进程中启动
+startup.preloading = preload_app
+
+
+def when_ready(server):
+    if preload_app:
+        server.log.info("预加载完成: %s", startup.preload())
+
+
+def post_fork(server, worker):
+    startup.after_fork()
@@ -0,0 +1,346 @@
+"""
+对冲请求与自适应超时
+
+按接口（geocode、weather、direction、config、chat）维护最近请求耗时的滚动窗口:
+- 请求耗时超过该接口的P95（HEDGE_PERCENTILE）仍未返回时，再发出一个相同的请求，
+  采用先返回的结果，取消另一个：同步请求的主请求在调用方线程中执行，只有对冲请求进入线程池，
+  对冲请求先返回时通过abort中断主请求的连接；落后的对冲请求在返回后丢弃并关闭响应；
+  异步请求取消协程并断开连接
+- 对冲请求数按预算限制：每个请求积累HEDGE_BUDGET个对冲额度，大模型使用单独的LLM_HEDGE_BUDGET，
+  避免上游整体变慢时请求量翻倍
+- 读取超时取P99乘以HEDGE_TIMEOUT_FACTOR，不超过HTTP_READ_TIMEOUT，代替固定的超时
+
+样本不足HEDGE_MIN_SAMPLES时不对冲，使用默认超时。后台预热的请求不对冲。
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, TimeoutError as FutureTimeoutError, wait
+
+from config import Config
+import metrics
+import upstream
+
+HEDGES = metrics.registry.counter('upstream_hedges_total', '对冲请求数，fired为发出的对冲请求，won为对冲请求先返回')
+
+# 对冲请求在这里执行；不能中断的调用（大模型）的主请求也在这里执行，调用线程只负责等待
+executor = upstream.ContextExecutor(max_workers=Config.HEDGE_MAX_WORKERS, thread_name_prefix='hedge')
+
+
+class LatencyWindow:
+    """各接口最近成功请求的耗时"""
+
+    def __init__(self, size):
+        self.size = size
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds):
+        """记录一次成功请求的耗时"""
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = deque(maxlen=self.size)
+            samples.append(seconds)
+
+    def percentile(self, endpoint, q):
+        """
+        计算接口耗时的分位数
+
+        返回:
+            float: 分位耗时（秒），样本不足HEDGE_MIN_SAMPLES时返回None
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(endpoint) or ())
+        if len(samples) < Config.HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+class HedgeBudget:
+    """每个请求积累ratio个对冲额度，发出对冲请求消耗一个"""
+
+    def __init__(self, ratio, burst=10):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def deposit(self, endpoint):
+        with self._lock:
+            self._tokens[endpoint] = min(self.burst, self._tokens.get(endpoint, 0.0) + self.ratio)
+
+    def withdraw(self, endpoint):
+        """取得一个对冲额度，额度不足时返回False"""
+        with self._lock:
+            if self._tokens.get(endpoint, 0.0) < 1:
+                return False
+            self._tokens[endpoint] -= 1
+            return True
+
+
+latency = LatencyWindow(Config.HEDGE_WINDOW)
+_budgets = {'amap': HedgeBudget(Config.HEDGE_BUDGET), 'chat': HedgeBudget(Config.LLM_HEDGE_BUDGET)}
+
+
+def _budget(endpoint):
+    return _budgets['chat' if endpoint == 'chat' else 'amap']
+
+
+def hedge_delay(endpoint, priority=None):
+    """
+    发出对冲请求前等待的秒数
+
+    返回:
+        float: 该接口耗时的P95（不小于HEDGE_MIN_DELAY），不对冲时返回None
+    """
+    enabled = Config.LLM_HEDGE if endpoint == 'chat' else Config.HEDGE
+    # 预热等后台任务（上下文中的LOW优先级）不对冲
+    if not enabled or upstream.request_priority(priority) == upstream.LOW:
+        return None
+    delay = latency.percentile(endpoint, Config.HEDGE_PERCENTILE)
+    return None if delay is None else max(delay, Config.HEDGE_MIN_DELAY)
+
+
+def read_timeout(endpoint, default=None):
+    """
+    接口的自适应读取超时
+
+    参数:
+        endpoint (str): 接口名
+        default (float): 样本不足时使用的超时，也是自适应超时的上限，默认为HTTP_READ_TIMEOUT
+
+    返回:
+        float: 超时秒数
+    """
+    default = Config.HTTP_READ_TIMEOUT if default is None else default
+    p99 = latency.percentile(endpoint, 0.99)
+    if p99 is None:
+        return default
+    return min(default, max(Config.HEDGE_MIN_TIMEOUT, p99 * Config.HEDGE_TIMEOUT_FACTOR))
+
+
+def _timed_call(endpoint, func):
+    started = time.monotonic()
+    result = func()
+    latency.record(endpoint, time.monotonic() - started)
+    return result
+
+
+def _discard(future, discard):
+    """取消落后的请求：尚未开始时直接取消，否则在返回后交给discard释放资源"""
+    if future.cancel() or discard is None:
+        return
+    future.add_done_callback(lambda f: f.exception() is None and f.result() is not None and discard(f.result()))
+
+
+class _Timer:
+    """单个后台线程按到期时间执行回调，用于在对冲延迟到达时发出对冲请求"""
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, delay, callback):
+        """delay秒后执行callback，返回可传给cancel的条目"""
+        entry = [time.monotonic() + delay, next(self._seq), callback]
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                # 首次使用时启动；fork出的子进程中没有这个线程，同样在这里重新启动
+                self._thread = threading.Thread(target=self._loop, name='hedge-timer', daemon=True)
+                self._thread.start()
+            heapq.heappush(self._heap, entry)
+            self._cond.notify()
+        return entry
+
+    @staticmethod
+    def cancel(entry):
+        entry[2] = None
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, callback = heapq.heappop(self._heap)
+            if callback is not None:
+                callback()
+
+
+_timer = _Timer()
+
+
+class _Hedge:
+    """一次对冲调用的状态：主请求在调用方线程中执行，对冲请求在线程池中执行"""
+
+    def __init__(self, endpoint, backup, abort):
+        self.endpoint = endpoint
+        self.backup_func = backup
+        self.abort = abort
+        self.backup = None
+        self.primary_done = False
+        self.won = False
+        self._lock = threading.Lock()
+
+    def fire(self):
+        """到达对冲延迟时由计时线程调用，额度不足或主请求已结束时不发出"""
+        with self._lock:
+            if self.primary_done or not _budget(self.endpoint).withdraw(self.endpoint):
+                return
+            HEDGES.inc(endpoint=self.endpoint, result='fired')
+            self.backup = executor.submit(_timed_call, self.endpoint, self.backup_func)
+        self.backup.add_done_callback(self._backup_done)
+
+    def _backup_done(self, future):
+        """对冲请求先成功时中断主请求"""
+        if future.cancelled() or future.exception() is not None:
+            return
+        with self._lock:
+            if self.primary_done:
+                return
+            self.won = True
+        self.abort()
+
+    def finish(self):
+        """主请求结束，返回(对冲请求是否先成功, 对冲请求)"""
+        with self._lock:
+            self.primary_done = True
+            return self.won, self.backup
+
+
+def call(endpoint, func, discard=None, priority=None, backup=None, abort=None):
+    """
+    执行一次上游调用，超过P95仍未返回时发出对冲请求
+
+    提供abort时主请求在调用方线程中执行，只有对冲请求进入线程池，对冲请求先成功时调用abort
+    中断主请求，主请求随后应尽快返回（返回值被丢弃）。没有abort的调用无法提前结束主请求，
+    主请求也在线程池中执行。
+
+    参数:
+        endpoint (str): 接口名
+        func (callable): 发出主请求的函数
+        discard (callable): 处理被丢弃的结果，例如关闭响应
+        priority (int): 请求的优先级，后台请求不对冲
+        backup (callable): 发出对冲请求的函数，必须可以在其他线程中执行，默认为func
+        abort (callable): 从其他线程中断主请求
+
+    返回:
+        先成功返回的结果；两个请求都失败时抛出主请求的异常
+    """
+    budget = _budget(endpoint)
+    budget.deposit(endpoint)
+    delay = hedge_delay(endpoint, priority)
+    if delay is None:
+        return _timed_call(endpoint, func)
+    if abort is None:
+        return _call_pooled(endpoint, func, discard, delay, budget)
+
+    hedge = _Hedge(endpoint, backup or func, abort)
+    entry = _timer.schedule(delay, hedge.fire)
+    result, error = None, None
+    try:
+        result = _timed_call(endpoint, func)
+    except Exception as e:
+        error = e
+    finally:
+        _timer.cancel(entry)
+    won, backup_future = hedge.finish()
+    if won:
+        if result is not None and discard is not None:
+            discard(result)
+        HEDGES.inc(endpoint=endpoint, result='won')
+        return backup_future.result()
+    if backup_future is not None:
+        if error is None:
+            _discard(backup_future, discard)
+            return result
+        # 主请求失败时等待对冲请求
+        try:
+            result = backup_future.result()
+        except Exception:
+            raise error
+        HEDGES.inc(endpoint=endpoint, result='won')
+        return result
+    if error is not None:
+        raise error
+    return result
+
+
+def _call_pooled(endpoint, func, discard, delay, budget):
+    """主请求无法中断时，两个请求都在线程池中执行，调用线程等待先成功的一个"""
+    primary = executor.submit(_timed_call, endpoint, func)
+    try:
+        return primary.result(timeout=delay)
+    except FutureTimeoutError:
+        pass
+    if not budget.withdraw(endpoint):
+        return primary.result()
+
+    HEDGES.inc(endpoint=endpoint, result='fired')
+    backup = executor.submit(_timed_call, endpoint, func)
+    pending = {primary, backup}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for loser in pending:
+                    _discard(loser, discard)
+                if future is backup:
+                    HEDGES.inc(endpoint=endpoint, result='won')
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def _timed_acall(endpoint, factory):
+    started = time.monotonic()
+    result = await factory()
+    latency.record(endpoint, time.monotonic() - started)
+    return result
+
+
+async def acall(endpoint, factory, priority=None):
+    """
+    call的异步版本，落后的请求被取消
+
+    参数:
+        endpoint (str): 接口名
+        factory (callable): 每次调用返回一个新的协程
+        priority (int): 请求的优先级，后台请求不对冲
+    """
+    budget = _budget(endpoint)
+    budget.deposit(endpoint)
+    delay = hedge_delay(endpoint, priority)
+    if delay is None:
+        return await _timed_acall(endpoint, factory)
+
+    primary = asyncio.ensure_future(_timed_acall(endpoint, factory))
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done or not budget.withdraw(endpoint):
+            return await primary
+
+        HEDGES.inc(endpoint=endpoint, result='fired')
+        backup = asyncio.ensure_future(_timed_acall(endpoint, factory))
+        pending.add(backup)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is backup:
+                        HEDGES.inc(endpoint=endpoint, result='won')
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # 返回、失败或调用方被取消时，取消仍在进行的请求
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,331 @@
+"""
+进程内共享的HTTP客户端
+
+所有对高德和其他上游服务的请求都通过同一个带连接池的Session发出，
+以复用keep-alive连接和TLS会话，并统一超时与重试策略。
+"""
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from config import Config
+import hedging
+import metrics
+import upstream
+
+# 需要重试的HTTP状态码和最多尝试的次数，同步和异步客户端共用
+RETRY_STATUSES = {500, 502, 503, 504}
+RETRY_ATTEMPTS = 4
+
+
+def endpoint_of(url):
+    """
+    从URL中取出用于统计的接口名，例如 /v3/geocode/geo -> geocode
+
+    参数:
+        url (str): 请求地址
+
+    返回:
+        str: 接口名
+    """
+    parts = [part for part in urlsplit(url).path.split('/') if part]
+    if parts and parts[0][:1] == 'v' and parts[0][1:].isdigit():
+        parts = parts[1:]
+    return parts[0] if parts else 'root'
+
+
+class CountingRetry(Retry):
+    """记录重试次数的重试策略"""
+
+    def increment(self, method=None, url=None, *args, **kwargs):
+        metrics.UPSTREAM_RETRIES.inc(endpoint=endpoint_of(url or ''))
+        return super().increment(method, url, *args, **kwargs)
+
+
+# 当前线程中正在执行的主请求的连接记录，对冲请求先返回时用它中断主请求
+_tracking = threading.local()
+
+
+class ConnectionTracker:
+    """记录一个请求占用的连接，其他线程可以通过abort()中断它"""
+
+    def __init__(self):
+        self.aborted = False
+        self._connections = set()
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+
+    def add(self, conn):
+        with self._lock:
+            self._connections.add(conn)
+            if self.aborted:
+                self._shutdown(conn)
+
+    def remove(self, conn):
+        with self._lock:
+            self._connections.discard(conn)
+
+    def abort(self):
+        """关闭仍被占用的连接的套接字，阻塞在读取上的请求随即失败"""
+        with self._lock:
+            self.aborted = True
+            for conn in self._connections:
+                self._shutdown(conn)
+        self._event.set()
+
+    def wait(self, seconds):
+        """等待seconds秒，期间被中断时提前返回"""
+        return self._event.wait(seconds)
+
+    @staticmethod
+    def _shutdown(conn):
+        sock = getattr(conn, 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class _TrackingPool:
+    """从连接池取出和归还连接时更新当前线程的ConnectionTracker；归还后的连接不会再被中断"""
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        tracker = getattr(_tracking, 'tracker', None)
+        if tracker is not None:
+            tracker.add(conn)
+        return conn
+
+    def _put_conn(self, conn):
+        tracker = getattr(_tracking, 'tracker', None)
+        if tracker is not None:
+            tracker.remove(conn)
+        super()._put_conn(conn)
+
+
+class _TrackingHTTPConnectionPool(_TrackingPool, HTTPConnectionPool):
+    pass
+
+
+class _TrackingHTTPSConnectionPool(_TrackingPool, HTTPSConnectionPool):
+    pass
+
+
+class TrackingAdapter(HTTPAdapter):
+    """连接可以被ConnectionTracker中断的HTTPAdapter"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TrackingHTTPConnectionPool,
+            'https': _TrackingHTTPSConnectionPool
+        }
+
+
+class PooledSession(requests.Session):
+    """带默认超时和并发统计的Session"""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.default_timeout = timeout
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_requests = 0
+
+    def request(self, method, url, **kwargs):
+        """
+        发送请求，未指定timeout时使用默认超时
+
+        高德请求先经过限流器并由其选择密钥，读取超时按接口的耗时分布自适应，
+        超过P95仍未返回时发出对冲请求。主请求在当前线程中执行，对冲请求先返回时中断主请求的连接
+        """
+        source = upstream.for_url(url)
+        if source is None:
+            kwargs.setdefault('timeout', self.default_timeout)
+            return self._send(method, url, **kwargs)
+        endpoint = endpoint_of(url)
+        kwargs.setdefault('timeout', (Config.HTTP_CONNECT_TIMEOUT, hedging.read_timeout(endpoint)))
+        # 对冲请求在其他线程中执行，优先级在当前线程中确定
+        priority = upstream.request_priority()
+        tracker = ConnectionTracker()
+
+        def primary():
+            _tracking.tracker = tracker
+            try:
+                return self._attempt(source, endpoint, priority, method, url, tracker=tracker, **kwargs)
+            finally:
+                _tracking.tracker = None
+
+        return hedging.call(
+            endpoint, primary, discard=lambda response: response.close(), priority=priority,
+            backup=lambda: self._attempt(source, endpoint, priority, method, url, **kwargs), abort=tracker.abort
+        )
+
+    def _attempt(self, source, endpoint, priority, method, url, tracker=None, **kwargs):
+        """
+        经过限流器发送高德请求，5xx响应按退避策略重试
+
+        每次重试都重新取令牌，退避期间不占用令牌；每个5xx响应都计入熔断器，熔断后不再重试。
+        重试用完后返回最后一个响应；被对冲请求中断时返回None，取令牌前、发送前和退避期间
+        都会检查中断，不再发出注定被丢弃的请求。
+        """
+        params = kwargs.get('params')
+        aborted = (lambda: tracker.aborted) if tracker is not None else (lambda: False)
+        for attempt in range(RETRY_ATTEMPTS):
+            if aborted():
+                return None
+            with source.slot(endpoint, priority) as lease:
+                # 排队等令牌期间对冲请求可能已经先成功
+                if aborted():
+                    return None
+                if lease.key and isinstance(params, dict) and 'key' in params:
+                    kwargs['params'] = dict(params, key=lease.key)
+                try:
+                    response = self._send(method, url, **kwargs)
+                except requests.RequestException:
+                    # 对冲请求已经先成功，中断不是上游的错误
+                    if aborted():
+                        return None
+                    raise
+                if response.status_code >= 500:
+                    lease.fail()
+                elif upstream.amap_quota_exceeded(response.content):
+                    lease.fail(throttled=True)
+            if response.status_code not in RETRY_STATUSES or attempt == RETRY_ATTEMPTS - 1:
+                return response
+            response.close()
+            if aborted():
+                return None
+            metrics.UPSTREAM_RETRIES.inc(endpoint=endpoint)
+            # 退避期间对冲请求先成功时立即结束
+            if tracker is not None:
+                if tracker.wait(2 ** attempt):
+                    return None
+            else:
+                time.sleep(2 ** attempt)
+
+    def _send(self, method, url, **kwargs):
+        """发送请求并记录耗时、错误和并发数"""
+        endpoint = endpoint_of(url)
+        with self._lock:
+            self.in_flight += 1
+            self.total_requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            response = super().request(method, url, **kwargs)
+            if response.status_code >= 400:
+                metrics.UPSTREAM_ERRORS.inc(endpoint=endpoint, reason=str(response.status_code))
+            return response
+        except requests.RequestException as e:
+            tracker = getattr(_tracking, 'tracker', None)
+            if tracker is None or not tracker.aborted:
+                metrics.UPSTREAM_ERRORS.inc(endpoint=endpoint, reason=type(e).__name__)
+            raise
+        finally:
+            metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+            with self._lock:
+                self.in_flight -= 1
+
+
+def _build_session():
+    """根据配置创建共享Session"""
+    session = PooledSession(timeout=(Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT))
+    # 连接层只重试建立连接失败（请求尚未到达上游）；5xx在PooledSession._attempt中
+    # 按次取令牌重试，让限流器和熔断器看到每一次请求
+    retry_strategy = CountingRetry(
+        total=2,  # 最大重试次数
+        connect=2,
+        read=0,
+        status=0,
+        backoff_factor=0.5  # 重试间隔
+    )
+    adapter = TrackingAdapter(
+        pool_connections=Config.HTTP_POOL_CONNECTIONS,  # 缓存的主机连接池数量
+        pool_maxsize=Config.HTTP_POOL_MAXSIZE,  # 每个主机保留的最大连接数
+        pool_block=Config.HTTP_POOL_BLOCK,  # 连接耗尽时是否等待而不是新建临时连接
+        max_retries=retry_strategy
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # 禁用SSL验证，解决SSL连接问题
+    session.verify = False
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """获取进程内共享的Session，首次调用时创建"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def get(url, **kwargs):
+    """使用共享Session发送GET请求"""
+    return get_session().get(url, **kwargs)
+
+
+def pool_stats():
+    """
+    统计连接池使用情况，用于在压测时调整连接池大小
+
+    返回:
+        dict: 全局并发数、每个主机的连接创建数、请求数和空闲连接数，以及各上游密钥的并发和排队情况
+    """
+    session = get_session()
+    hosts = {}
+    seen = set()
+    for adapter in session.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            # 队列中非None的元素是已建立且空闲的连接
+            idle = sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+            hosts[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                'connections_created': pool.num_connections,
+                'requests': pool.num_requests,
+                'idle_connections': idle,
+                'maxsize': pool.pool.maxsize if pool.pool else 0
+            }
+    return {
+        'pool_connections': Config.HTTP_POOL_CONNECTIONS,
+        'pool_maxsize': Config.HTTP_POOL_MAXSIZE,
+        'in_flight': session.in_flight,
+        'peak_in_flight': session.peak_in_flight,
+        'total_requests': session.total_requests,
+        'hosts': hosts,
+        'upstreams': {source.name: source.stats() for source in (upstream.amap, upstream.deepseek)}
+    }
+
+
+def _pool_samples():
+    """为/metrics提供连接池仪表数据"""
+    stats = pool_stats()
+    samples = [({'kind': 'in_flight'}, stats['in_flight']), ({'kind': 'peak_in_flight'}, stats['peak_in_flight'])]
+    for host, host_stats in stats['hosts'].items():
+        samples.append(({'kind': 'idle_connections', 'host': host}, host_stats['idle_connections']))
+        samples.append(({'kind': 'connections_created', 'host': host}, host_stats['connections_created']))
+    return samples
+
+
+metrics.registry.gauge('http_pool_connections', 'HTTP连接池使用情况', _pool_samples)
@@ -0,0 +1,160 @@
+"""
+行程生成结果缓存
+
+对城市、兴趣和饮食偏好做规范化处理后，用规范化提示词和模型名的哈希作为键
+缓存大模型生成的行程。可选的近似匹配允许兴趣集合高度相似的请求共享结果。
+"""
+import hashlib
+import json
+import re
+import threading
+
+from cache import TTLCache, warm_entries
+from config import Config
+import metrics
+
+# 兴趣和饮食偏好的分隔符：中英文逗号、顿号、分号和空白
+_SEPARATORS = re.compile(r'[,，、;；\s]+')
+
+
+def normalize_terms(text):
+    """
+    把逗号分隔的兴趣或饮食偏好规范化为去重、排序后的词元组
+
+    参数:
+        text (str): 用户输入
+
+    返回:
+        tuple: 规范化后的词
+    """
+    if not text:
+        return ()
+    return tuple(sorted({term for term in _SEPARATORS.split(text.strip().lower()) if term}))
+
+
+def normalize_days(days):
+    """把行程天数限制在1到MAX_TRIP_DAYS之间，无法解析时按一天处理"""
+    try:
+        days = int(days)
+    except (TypeError, ValueError):
+        return 1
+    return max(1, min(days, Config.MAX_TRIP_DAYS))
+
+
+def normalize_request(location, interests, dietary_preferences, days=1):
+    """
+    规范化行程请求参数
+
+    返回:
+        tuple: (城市, 兴趣词元组, 饮食偏好词元组, 天数)
+    """
+    return (
+        (location or '').strip().lower(),
+        normalize_terms(interests),
+        normalize_terms(dietary_preferences),
+        normalize_days(days)
+    )
+
+
+class ItineraryCache:
+    """行程生成结果的缓存"""
+
+    def __init__(self, max_entries, ttl, similarity=0):
+        """
+        参数:
+            max_entries (int): 最多缓存的行程数
+            ttl (float): 行程的有效期（秒）
+            similarity (float): 近似匹配的兴趣集合Jaccard相似度阈值，0表示关闭
+        """
+        self.entries = TTLCache(max_entries, ttl)
+        self.similarity = similarity
+        # (模型, 系统提示词摘要, 城市, 饮食偏好, 天数) -> {兴趣词集合: 缓存键}，用于近似匹配；
+        # 系统提示词区分JSON和Markdown输出，两种格式的结果不能互相替代
+        self._index = {}
+        self._lock = threading.Lock()
+        self.near_hits = 0
+
+    @staticmethod
+    def make_key(model, messages):
+        """用模型名和规范化后的提示词计算缓存键"""
+        payload = json.dumps([model, messages], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def index_key(model, messages, normalized):
+        """近似匹配索引的键，兴趣不参与"""
+        city, _, diet, days = normalized
+        system = [m['content'] for m in messages if m.get('role') == 'system']
+        digest = hashlib.sha256(json.dumps(system, ensure_ascii=False).encode('utf-8')).hexdigest()
+        return model, digest, city, diet, days
+
+    def get(self, model, messages, normalized):
+        """
+        查询缓存，精确未命中时按配置尝试近似匹配
+
+        参数:
+            model (str): 模型名称
+            messages (list): 由规范化参数构建的提示消息
+            normalized (tuple): normalize_request的结果
+
+        返回:
+            str: 缓存的行程文本，未命中时返回None
+        """
+        key = self.make_key(model, messages)
+        itinerary = self.entries.get(key)
+        if itinerary is not None:
+            warm_entries.hit('itinerary', key)
+        if itinerary is not None or not self.similarity:
+            metrics.CACHE_REQUESTS.inc(cache='itinerary', result='hit' if itinerary is not None else 'miss')
+            return itinerary
+
+        wanted = set(normalized[1])
+        with self._lock:
+            candidates = list(self._index.get(self.index_key(model, messages, normalized), {}).items())
+
+        best_key, best_score = None, 0.0
+        for terms, key in candidates:
+            union = wanted | terms
+            score = len(wanted & terms) / len(union) if union else 1.0
+            if score > best_score:
+                best_key, best_score = key, score
+        itinerary = self.entries.get(best_key) if best_key is not None and best_score >= self.similarity else None
+        if itinerary is not None:
+            self.near_hits += 1
+        metrics.CACHE_REQUESTS.inc(cache='itinerary', result='near_hit' if itinerary is not None else 'miss')
+        return itinerary
+
+    def set(self, model, messages, normalized, itinerary):
+        """
+        写入生成的行程
+
+        参数:
+            model (str): 模型名称
+            messages (list): 由规范化参数构建的提示消息
+            normalized (tuple): normalize_request的结果
+            itinerary (str): 行程文本
+        """
+        key = self.make_key(model, messages)
+        self.entries.set(key, itinerary)
+        if self.similarity:
+            with self._lock:
+                bucket = self._index.setdefault(self.index_key(model, messages, normalized), {})
+                bucket[frozenset(normalized[1])] = key
+                # 清理已被淘汰或过期的索引项
+                if len(bucket) > Config.ITINERARY_CACHE_MAX_ENTRIES:
+                    for terms in [t for t, k in bucket.items() if k not in self.entries]:
+                        del bucket[terms]
+
+    def stats(self):
+        """返回缓存命中统计"""
+        stats = self.entries.stats()
+        stats['near_hits'] = self.near_hits
+        return stats
+
+
+# 进程内共享的行程缓存
+itinerary_cache = ItineraryCache(
+    max_entries=Config.ITINERARY_CACHE_MAX_ENTRIES,
+    ttl=Config.ITINERARY_CACHE_TTL,
+    similarity=Config.ITINERARY_CACHE_SIMILARITY
+)
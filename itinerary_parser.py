@@ -0,0 +1,377 @@
+"""
+行程文本解析模块
+
+把大模型生成的Markdown行程解析成结构化行程：按出现顺序排列的地点，以及每个地点所属的
+天（多日行程中"## 第2天"这样的标题）、时段（上午/午餐/下午/晚餐/晚间）、游览或用餐时间
+和类型（景点/餐厅）。
+解析器只扫描一遍文本，支持在流式输出过程中增量解析。
+
+大模型以JSON格式输出行程时，from_plan直接把JSON转换为同样的结构化行程，
+render_markdown在本地渲染出供展示的Markdown文本。
+"""
+
+import re
+
+# 【】标注的地点，不跨行
+_MARK = re.compile(r'【([^【】\n]*)】')
+# Markdown标题，或单独成行的加粗文字
+_HEADING = re.compile(r'#+\s*(.*?)\s*#*$|\*\*([^*【】]+?)\*\*[：:]?$')
+# 地点下方的详情行，如"- 游览时间：9:00-11:30"
+_DETAIL = re.compile(r'[-*•]?\s*(游览时间|用餐时间|时间|推荐菜品|简介|交通建议)\s*[：:]\s*(.*)')
+_DISH_SEPARATORS = re.compile(r'[、，,;；/]+')
+_CLOCK = re.compile(r'(\d{1,2})\s*[:：]\s*(\d{2})')
+# 多日行程中每天的标题，如"第2天"、"第三天"、"第十二天"、"Day 2"；中文天数只接受一到九十九的写法
+_DAY = re.compile(
+    r'第\s*(\d+|[一二三四五六七八九]?十[一二三四五六七八九]?|[一二三四五六七八九])\s*[天日]|day\s*(\d+)',
+    re.IGNORECASE
+)
+_CHINESE_DIGITS = '一二三四五六七八九'
+
+# 标题关键字到时段的映射，按顺序匹配（"午餐"要先于"上午"、"下午"）
+SECTION_ALIASES = (
+    ('早餐', '早餐'),
+    ('午餐', '午餐'),
+    ('晚餐', '晚餐'),
+    ('上午', '上午'),
+    ('下午', '下午'),
+    ('晚间', '晚间'),
+    ('晚上', '晚间'),
+    ('夜', '晚间'),
+)
+
+SIGHT = 'sight'
+RESTAURANT = 'restaurant'
+
+
+def match_section(text):
+    """返回文字中提到的时段名称，没有时返回None"""
+    for keyword, section in SECTION_ALIASES:
+        if keyword in text:
+            return section
+    return None
+
+
+def section_of(heading):
+    """把标题文字归一化为时段名称，无法识别时返回标题本身"""
+    return match_section(heading) or heading
+
+
+def day_number(text):
+    """把"3"、"三"、"十二"这样的天数转换为整数"""
+    if text.isdigit():
+        return int(text)
+    tens, _, ones = text.rpartition('十')
+    if not _:
+        return _CHINESE_DIGITS.index(ones) + 1
+    return (_CHINESE_DIGITS.index(tens) + 1 if tens else 1) * 10 + (_CHINESE_DIGITS.index(ones) + 1 if ones else 0)
+
+
+class Stop:
+    """行程中的一个地点"""
+
+    __slots__ = ('name', 'day', 'section', 'kind', 'time', 'start', 'end', 'intro', 'dishes', 'area', 'transport')
+
+    def __init__(self, name, section=None, day=None):
+        self.name = name
+        self.day = day  # 多日行程中的第几天，单日行程为None
+        self.section = section
+        self.kind = RESTAURANT if section and '餐' in section else SIGHT
+        self.time = None  # 原始时间描述
+        self.start = None  # 开始时间，HH:MM
+        self.end = None  # 结束时间，HH:MM
+        self.intro = None  # 简介
+        self.dishes = None  # 餐厅的推荐菜品列表
+        self.area = None  # 所在区域，用于辅助定位
+        self.transport = None  # 交通建议
+
+    def set_time(self, text):
+        """记录时间描述并解析其中的起止时间"""
+        self.time = text
+        clocks = ['%02d:%s' % (int(h), m) for h, m in _CLOCK.findall(text)]
+        if clocks:
+            self.start = clocks[0]
+            self.end = clocks[1] if len(clocks) > 1 else None
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __repr__(self):
+        return f"Stop({self.name!r}, section={self.section!r}, kind={self.kind!r})"
+
+
+class Itinerary:
+    """按出现顺序排列且去重的地点"""
+
+    __slots__ = ('stops', '_names')
+
+    def __init__(self):
+        self.stops = []
+        self._names = set()
+
+    def add(self, name, section, day=None):
+        """添加地点，重复出现（包括在之前的天中出现过）或名称太短时返回None"""
+        if len(name) <= 1 or name in self._names:
+            return None
+        self._names.add(name)
+        stop = Stop(name, section, day)
+        self.stops.append(stop)
+        return stop
+
+    @property
+    def locations(self):
+        return [stop.name for stop in self.stops]
+
+    def groups(self):
+        """
+        按时段把地点分组，用于路线顺序优化
+
+        返回:
+            list: 按时段先后排列的地点下标列表
+        """
+        groups = []
+        section = object()
+        for i, stop in enumerate(self.stops):
+            if not groups or stop.section != section:
+                section = stop.section
+                groups.append([])
+            groups[-1].append(i)
+        return groups
+
+    def days(self):
+        """按出现顺序返回行程中的天，单日行程返回[None]"""
+        return list(dict.fromkeys(stop.day for stop in self.stops))
+
+    def for_day(self, day):
+        """返回只包含某一天地点的行程"""
+        itinerary = Itinerary()
+        for stop in self.stops:
+            if stop.day == day:
+                itinerary._names.add(stop.name)
+                itinerary.stops.append(stop)
+        return itinerary
+
+    def to_list(self):
+        return [stop.to_dict() for stop in self.stops]
+
+    def __len__(self):
+        return len(self.stops)
+
+    def __iter__(self):
+        return iter(self.stops)
+
+
+class ItineraryParser:
+    """在不断增长的行程文本上增量解析结构化行程"""
+
+    def __init__(self):
+        self.buffer = ''
+        self.itinerary = Itinerary()
+        self._line_start = 0  # 当前行的起始位置
+        self._pos = 0  # 当前行中尚未扫描部分的起始位置
+        self._section = None
+        self._day = None
+        self._current = None  # 详情行所属的地点
+
+    @property
+    def locations(self):
+        return self.itinerary.locations
+
+    def feed(self, chunk):
+        """
+        追加一段文本，返回这段文本中新出现且已闭合的地点
+
+        参数:
+            chunk (str): 新生成的文本片段
+
+        返回:
+            list: 新提取的Stop列表
+        """
+        self.buffer += chunk
+        found = []
+        while True:
+            end = self.buffer.find('\n', self._pos)
+            if end == -1:
+                break
+            self._line(end, found)
+            self._line_start = self._pos = end + 1
+
+        # 尚未结束的行先提取已闭合的地点，标题行要等整行到齐才能确定时段
+        if not self.buffer[self._line_start:].lstrip().startswith('#'):
+            self._marks(len(self.buffer), found)
+        return found
+
+    def close(self):
+        """文本结束时处理最后一行，返回新提取的地点"""
+        found = []
+        if self._line_start < len(self.buffer):
+            self._line(len(self.buffer), found)
+            self._line_start = self._pos = len(self.buffer)
+        return found
+
+    def _line(self, end, found):
+        """处理一整行"""
+        line = self.buffer[self._line_start:end].strip()
+        heading = _HEADING.match(line)
+        if heading:
+            title = heading.group(1) or heading.group(2)
+            day = _DAY.search(title)
+            if day:
+                # 新的一天从没有时段开始，除非标题里同时写了时段
+                self._day = day_number(day.group(1) or day.group(2))
+                self._section = match_section(title[day.end():])
+            else:
+                self._section = section_of(title) or None
+            self._current = None
+        elif self._current is not None:
+            detail = _DETAIL.match(line)
+            if detail:
+                self._detail(self._current, detail.group(1), detail.group(2).strip())
+        self._marks(end, found)
+
+    @staticmethod
+    def _detail(stop, label, value):
+        """把详情行记录到地点上"""
+        if label == '简介':
+            stop.intro = value
+        elif label == '交通建议':
+            stop.transport = value
+        elif label == '推荐菜品':
+            stop.dishes = [dish for dish in _DISH_SEPARATORS.split(value) if dish]
+            stop.kind = RESTAURANT
+        elif stop.time is None:
+            stop.set_time(value)
+            if label == '用餐时间':
+                stop.kind = RESTAURANT
+
+    def _marks(self, end, found):
+        """提取当前行中_pos到end之间已闭合的地点"""
+        for match in _MARK.finditer(self.buffer, self._pos, end):
+            self._pos = match.end()
+            stop = self.itinerary.add(match.group(1).strip(), self._section, self._day)
+            # 重复提到的地点后面的详情不属于之前的地点
+            self._current = stop
+            if stop is not None:
+                found.append(stop)
+
+
+def parse_itinerary(text):
+    """
+    一次性解析完整的行程文本
+
+    参数:
+        text (str): 行程文本
+
+    返回:
+        Itinerary: 结构化行程
+    """
+    parser = ItineraryParser()
+    if text:
+        parser.feed(text)
+        parser.close()
+    return parser.itinerary
+
+
+# JSON行程中时段对应的Markdown标题
+SECTION_TITLES = {
+    '早餐': '早餐',
+    '上午': '上午行程',
+    '午餐': '午餐',
+    '下午': '下午行程',
+    '晚餐': '晚餐',
+    '晚间': '晚间行程',
+}
+
+
+def _plan_days(plan):
+    """取出JSON行程中的天，格式不符时抛出ValueError"""
+    days = plan.get('days') if isinstance(plan, dict) else None
+    if not isinstance(days, list) or not days:
+        raise ValueError("行程JSON缺少days")
+    for day in days:
+        if not isinstance(day, dict) or not isinstance(day.get('stops'), list):
+            raise ValueError("行程JSON中的天缺少stops")
+    return days
+
+
+def from_plan(plan, multi_day=False):
+    """
+    把大模型输出的JSON行程转换为结构化行程
+
+    参数:
+        plan (dict): 形如{"days": [{"day": 1, "theme": "", "stops": [...]}], "tips": ""}的行程
+        multi_day (bool): 是否为多日行程，单日行程中地点的day为None
+
+    返回:
+        Itinerary: 结构化行程，跨天重复的地点只保留第一次出现
+
+    异常:
+        ValueError: JSON结构不符合约定
+    """
+    itinerary = Itinerary()
+    for i, day in enumerate(_plan_days(plan)):
+        number = day.get('day') if isinstance(day.get('day'), int) else i + 1
+        for item in day['stops']:
+            if not isinstance(item, dict) or not isinstance(item.get('name'), str):
+                continue
+            section = item.get('section')
+            stop = itinerary.add(
+                item['name'].strip('【】 '),
+                section_of(section) if isinstance(section, str) and section else None,
+                number if multi_day else None
+            )
+            if stop is None:
+                continue
+            if item.get('start'):
+                stop.set_time('-'.join(str(item[key]) for key in ('start', 'end') if item.get(key)))
+            dishes = item.get('dishes')
+            if isinstance(dishes, list) and dishes:
+                stop.dishes = [str(dish) for dish in dishes]
+                stop.kind = RESTAURANT
+            stop.intro = item.get('intro') or None
+            stop.area = item.get('area') or None
+            stop.transport = item.get('transport') or None
+    return itinerary
+
+
+def render_markdown(plan, location, multi_day=False):
+    """
+    把JSON行程渲染为与大模型Markdown输出格式相同的文本，供页面展示和导出
+
+    参数:
+        plan (dict): 行程JSON
+        location (str): 城市名称
+        multi_day (bool): 是否为多日行程
+
+    返回:
+        str: Markdown行程
+    """
+    days = _plan_days(plan)
+    title = f"{location}{len(days)}日游行程规划" if multi_day else f"{location}完美一日游行程规划"
+    lines = [f"### {title}", '']
+    for i, day in enumerate(days):
+        if multi_day:
+            theme = day.get('theme')
+            lines += [f"## 第{day.get('day') or i + 1}天" + (f"：{theme}" if theme else ''), '']
+        section = None
+        for item in day['stops']:
+            if not isinstance(item, dict) or not item.get('name'):
+                continue
+            current = section_of(item.get('section') or '') or None
+            if current != section and current:
+                lines.append(f"# {SECTION_TITLES.get(current, current)}")
+            section = current
+            is_meal = bool(item.get('dishes')) or (current is not None and '餐' in current)
+            lines.append(f"【{str(item['name']).strip('【】 ')}】")
+            if item.get('start'):
+                window = '-'.join(str(item[key]) for key in ('start', 'end') if item.get(key))
+                lines.append(f"- {'用餐时间' if is_meal else '游览时间'}：{window}")
+            if item.get('intro'):
+                lines.append(f"- 简介：{item['intro']}")
+            if item.get('dishes'):
+                lines.append(f"- 推荐菜品：{'、'.join(map(str, item['dishes']))}")
+            if item.get('transport'):
+                lines.append(f"- 交通建议：{item['transport']}")
+            lines.append('')
+    if plan.get('tips'):
+        lines += ['# 交通总建议', f"- {plan['tips']}"]
+    return '\n'.join(lines).rstrip() + '\n'
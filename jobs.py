@@ -0,0 +1,491 @@
+"""
+异步规划任务
+
+POST /plans 把规划请求写入任务表后立即返回任务ID，由有上限的工作线程池执行，
+客户端通过 GET /plans/<id> 轮询或长轮询（?wait=秒数）获取结果。
+
+- 准入控制：排队的任务达到JOB_QUEUE_LIMIT时拒绝新任务，返回429并给出Retry-After
+- 去重：与进行中的任务参数相同的请求返回已有的任务；响应缓存中已有结果时直接完成
+- 持久化：任务和结果保存在本地SQLite中，web进程设置JOB_WORKERS=0只负责接收任务，
+  同一台机器上可以单独运行工作进程:
+    python jobs.py --workers 8
+- 故障恢复：工作进程定期刷新执行中任务的心跳，心跳超时的任务被重新领取；每次领取生成新的
+  owner令牌，结果只有持有当前令牌的工作线程才能写入
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+from config import Config
+import metrics
+import orchestrator
+from planner import TripPlanner
+import response_cache
+from storage import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    request TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    worker TEXT,
+    owner TEXT,
+    heartbeat REAL,
+    etag TEXT,
+    body BLOB,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, status);
+"""
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+_COLUMNS = (
+    'id', 'key', 'request', 'status', 'created', 'started', 'finished', 'worker', 'owner', 'heartbeat',
+    'etag', 'body', 'error'
+)
+# 早期版本的任务表没有的列
+_ADDED_COLUMNS = (('owner', 'TEXT'), ('heartbeat', 'REAL'))
+
+# UPDATE ... RETURNING需要SQLite 3.35及以上
+_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# 没有已完成任务可参考时估算的单个任务耗时（秒）
+DEFAULT_JOB_SECONDS = 10
+
+JOBS = metrics.registry.counter('plan_jobs_total', '规划任务数，按提交和执行结果区分')
+
+
+class JobQueueFull(RuntimeError):
+    """排队的任务过多，retry_after为建议的重试等待秒数"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class JobStore:
+    """保存在SQLite中的任务队列，多个进程可以同时提交和领取任务"""
+
+    def __init__(self, path, queue_limit, ttl):
+        """
+        参数:
+            path (str): 数据库文件路径
+            queue_limit (int): 最多排队的任务数
+            ttl (float): 已结束的任务保留多久（秒）
+        """
+        self.db = SQLiteStore(path, _SCHEMA)
+        self.queue_limit = queue_limit
+        self.ttl = ttl
+        existing = {row[1] for row in self.db.execute('PRAGMA table_info(jobs)')}
+        for column, kind in _ADDED_COLUMNS:
+            if column not in existing:
+                self.db.execute(f'ALTER TABLE jobs ADD COLUMN {column} {kind}')
+
+    @staticmethod
+    def _row(row):
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def submit(self, key, request):
+        """
+        提交任务，参数相同的任务仍在排队或执行时返回该任务
+
+        参数:
+            key (str): 响应缓存键，用于去重
+            request (dict): 规划参数
+
+        返回:
+            tuple: (任务, 是否为新建的任务)
+
+        异常:
+            JobQueueFull: 排队的任务达到上限
+        """
+        now = time.time()
+        conn = self.db.connection()
+        # 写锁保证去重检查、队列长度检查和插入是原子的
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM jobs WHERE finished < ?', (now - self.ttl,))
+            existing = conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE key = ? AND status IN (?, ?) ORDER BY created LIMIT 1",
+                (key, QUEUED, RUNNING)
+            ).fetchone()
+            if existing:
+                conn.execute('COMMIT')
+                return self._row(existing), False
+            depth = conn.execute('SELECT COUNT(*) FROM jobs WHERE status = ?', (QUEUED,)).fetchone()[0]
+            if depth >= self.queue_limit:
+                conn.execute('ROLLBACK')
+                raise JobQueueFull(f"排队的规划任务已达上限{self.queue_limit}", self.retry_after())
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                'INSERT INTO jobs (id, key, request, status, created) VALUES (?, ?, ?, ?, ?)',
+                (job_id, key, json.dumps(request, ensure_ascii=False), QUEUED, now)
+            )
+            conn.execute('COMMIT')
+        except JobQueueFull:
+            raise
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return self.get(job_id), True
+
+    def complete(self, key, request, etag, body):
+        """直接记录一个已完成的任务，用于响应缓存中已有结果的请求"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self.db.execute(
+            'INSERT INTO jobs (id, key, request, status, created, finished, etag, body) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (job_id, key, json.dumps(request, ensure_ascii=False), DONE, now, now, etag, body)
+        )
+        return self.get(job_id)
+
+    def claim(self, worker, stale_after):
+        """
+        领取最早排队的任务；心跳超过stale_after秒未刷新的执行中任务视为工作进程已退出，重新领取
+
+        参数:
+            worker (str): 工作进程名称
+            stale_after (float): 心跳超时的秒数
+
+        返回:
+            dict: 领取到的任务，owner为本次领取的令牌；没有任务时返回None
+        """
+        now = time.time()
+        params = (RUNNING, now, worker, uuid.uuid4().hex, now)
+        pending = (QUEUED, RUNNING, now - stale_after)
+        if _RETURNING:
+            row = self.db.execute(
+                f"""UPDATE jobs SET status = ?, started = ?, worker = ?, owner = ?, heartbeat = ?
+                    WHERE id = (
+                        SELECT id FROM jobs WHERE status = ? OR (status = ? AND heartbeat < ?)
+                        ORDER BY created LIMIT 1
+                    )
+                    RETURNING {', '.join(_COLUMNS)}""",
+                params + pending
+            ).fetchone()
+            return self._row(row)
+
+        # 旧版本SQLite在写事务中先查询再更新
+        conn = self.db.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT id FROM jobs WHERE status = ? OR (status = ? AND heartbeat < ?) ORDER BY created LIMIT 1',
+                pending
+            ).fetchone()
+            if row:
+                conn.execute(
+                    'UPDATE jobs SET status = ?, started = ?, worker = ?, owner = ?, heartbeat = ? WHERE id = ?',
+                    params + row
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return self.get(row[0]) if row else None
+
+    def heartbeat(self, owners):
+        """刷新本进程执行中任务的心跳"""
+        owners = list(owners)
+        if owners:
+            self.db.execute(
+                f"UPDATE jobs SET heartbeat = ? WHERE status = ? AND owner IN ({', '.join('?' * len(owners))})",
+                (time.time(), RUNNING, *owners)
+            )
+
+    def finish(self, job, etag, body):
+        """
+        记录任务结果
+
+        返回:
+            bool: 是否写入，任务已被其他工作线程重新领取时返回False
+        """
+        return self.db.execute(
+            'UPDATE jobs SET status = ?, finished = ?, etag = ?, body = ? WHERE id = ? AND owner = ? AND status = ?',
+            (DONE, time.time(), etag, body, job['id'], job['owner'], RUNNING)
+        ).rowcount > 0
+
+    def fail(self, job, error):
+        """
+        记录任务失败
+
+        返回:
+            bool: 是否写入，任务已被其他工作线程重新领取时返回False
+        """
+        return self.db.execute(
+            'UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ? AND owner = ? AND status = ?',
+            (FAILED, time.time(), error, job['id'], job['owner'], RUNNING)
+        ).rowcount > 0
+
+    def get(self, job_id):
+        """按ID查询任务，不存在时返回None"""
+        return self._row(self.db.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone())
+
+    def position(self, job):
+        """排队任务前面还有多少个任务"""
+        return self.db.execute(
+            'SELECT COUNT(*) FROM jobs WHERE status = ? AND created < ?', (QUEUED, job['created'])
+        ).fetchone()[0]
+
+    def depth(self):
+        """各状态的任务数"""
+        counts = dict(self.db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        return {status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)}
+
+    def retry_after(self):
+        """
+        估算队列空出一个位置需要的秒数：最近任务的平均耗时除以正在执行的任务数
+
+        返回:
+            int: 1到60之间的秒数
+        """
+        average, running = self.db.execute(
+            """SELECT
+                   (SELECT AVG(finished - started) FROM (
+                        SELECT finished, started FROM jobs
+                        WHERE status = ? AND started IS NOT NULL ORDER BY finished DESC LIMIT 20)),
+                   (SELECT COUNT(*) FROM jobs WHERE status = ?)""",
+            (DONE, RUNNING)
+        ).fetchone()
+        seconds = (average or DEFAULT_JOB_SECONDS) / max(1, running)
+        return max(1, min(60, math.ceil(seconds)))
+
+
+class WorkerPool:
+    """从任务表领取并执行规划任务的线程池"""
+
+    def __init__(self, store, planner, workers):
+        """
+        参数:
+            store (JobStore): 任务表
+            planner (TripPlanner): 同步规划器
+            workers (int): 工作线程数
+        """
+        self.store = store
+        self.planner = planner
+        self.workers = workers
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._wake = threading.Event()
+        self._threads = []
+        self._running = set()  # 本进程执行中任务的owner令牌
+        self._running_lock = threading.Lock()
+        self._heartbeat = None
+
+    def start(self):
+        """启动工作线程和心跳线程"""
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._beat, name='plan-heartbeat', daemon=True)
+            self._heartbeat.start()
+        for _ in range(self.workers - len(self._threads)):
+            thread = threading.Thread(target=self._loop, name=f'plan-worker-{len(self._threads)}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        """有新任务时唤醒本进程的工作线程，其他进程的工作线程按JOB_POLL_INTERVAL轮询"""
+        self._wake.set()
+
+    def _beat(self):
+        while True:
+            time.sleep(Config.JOB_HEARTBEAT_INTERVAL)
+            with self._running_lock:
+                owners = list(self._running)
+            try:
+                self.store.heartbeat(owners)
+            except Exception as e:
+                logger.error("刷新规划任务心跳失败: %s", e)
+
+    def _loop(self):
+        while True:
+            try:
+                job = self.store.claim(self.name, Config.JOB_HEARTBEAT_INTERVAL * 3)
+            except Exception as e:
+                logger.error("领取规划任务失败: %s", e)
+                job = None
+            if job is None:
+                self._wake.wait(Config.JOB_POLL_INTERVAL)
+                self._wake.clear()
+                continue
+            self.run(job)
+
+    def run(self, job):
+        """执行一个任务并记录结果"""
+        request = json.loads(job['request'])
+        with self._running_lock:
+            self._running.add(job['owner'])
+        try:
+            result = orchestrator.run_plan(
+                self.planner, request.get('location'), request.get('interests'),
+                request.get('dietary_preferences'), request.get('days', 1)
+            )
+            body, etag = response_cache.respond(job['key'], result)
+            status, recorded = DONE, self.store.finish(job, etag, body)
+        except Exception as e:
+            logger.error("规划任务%s失败: %s", job['id'], e)
+            status, recorded = FAILED, self.store.fail(job, str(e))
+        finally:
+            with self._running_lock:
+                self._running.discard(job['owner'])
+            with _finished:
+                _finished.notify_all()
+        if recorded:
+            JOBS.inc(result=status)
+        else:
+            logger.warning("规划任务%s已被其他工作线程重新领取，丢弃本次结果", job['id'])
+            JOBS.inc(result='superseded')
+
+
+_store = None
+_pool = None
+_lock = threading.Lock()
+# 本进程内有任务结束时通知长轮询的请求
+_finished = threading.Condition()
+
+
+def get_store():
+    """获取进程内共享的任务表"""
+    global _store
+    if _store is None:
+        with _lock:
+            if _store is None:
+                _store = JobStore(Config.JOB_DB_PATH, Config.JOB_QUEUE_LIMIT, Config.JOB_TTL)
+    return _store
+
+
+def start_workers(planner=None, workers=None):
+    """
+    启动本进程的工作线程，JOB_WORKERS为0时只接收任务不执行
+
+    参数:
+        planner (TripPlanner): 同步规划器，未提供时创建一个
+        workers (int): 工作线程数，默认为JOB_WORKERS
+    """
+    global _pool
+    workers = Config.JOB_WORKERS if workers is None else workers
+    if workers <= 0:
+        return None
+    store = get_store()
+    with _lock:
+        if _pool is None:
+            _pool = WorkerPool(store, planner or TripPlanner(), workers)
+    _pool.start()
+    return _pool
+
+
+def submit(data):
+    """
+    提交规划请求
+
+    参数:
+        data (dict): 与 /plan_trip 相同的请求参数
+
+    返回:
+        tuple: (任务, 是否为新建的任务)
+
+    异常:
+        JobQueueFull: 排队的任务达到上限
+    """
+    request = {name: data.get(name) for name in ('location', 'interests', 'dietary_preferences')}
+    request['days'] = data.get('days', 1)
+    key = response_cache.make_key(data)
+    store = get_store()
+
+    cached = response_cache.lookup(key)
+    if cached is not None:
+        JOBS.inc(result='cached')
+        return store.complete(key, request, cached[1], cached[0]), True
+
+    try:
+        job, created = store.submit(key, request)
+    except JobQueueFull:
+        JOBS.inc(result='rejected')
+        raise
+    JOBS.inc(result='queued' if created else 'deduplicated')
+    if created and _pool is not None:
+        _pool.notify()
+    return job, created
+
+
+def get(job_id):
+    """查询任务，不存在时返回None"""
+    return get_store().get(job_id)
+
+
+def wait(job_id, timeout):
+    """
+    等待任务结束，最多等待timeout秒
+
+    返回:
+        dict: 任务的最新状态，不存在时返回None
+    """
+    deadline = time.monotonic() + min(timeout, Config.JOB_WAIT_MAX)
+    while True:
+        job = get(job_id)
+        remaining = deadline - time.monotonic()
+        if job is None or job['status'] in (DONE, FAILED) or remaining <= 0:
+            return job
+        # 本进程的任务结束时立即唤醒，其他进程执行的任务按轮询间隔检查
+        with _finished:
+            _finished.wait(min(remaining, Config.JOB_POLL_INTERVAL))
+
+
+def view(job):
+    """
+    任务状态的JSON表示，不包含结果
+
+    返回:
+        dict: id、status、时间戳，排队时附带position，失败时附带error
+    """
+    data = {name: job[name] for name in ('id', 'status', 'created', 'started', 'finished')}
+    data['url'] = f"/plans/{job['id']}"
+    if job['status'] == QUEUED:
+        data['position'] = get_store().position(job)
+    elif job['status'] == FAILED:
+        data['error'] = job['error']
+    return data
+
+
+def _queue_samples():
+    """为/metrics提供各状态的任务数"""
+    return [({'status': status}, count) for status, count in get_store().depth().items()]
+
+
+metrics.registry.gauge('plan_jobs', '任务表中各状态的规划任务数', _queue_samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='运行独立的规划任务工作进程')
+    parser.add_argument('--workers', type=int, default=max(1, Config.JOB_WORKERS), help='工作线程数')
+    args = parser.parse_args()
+
+    from log_config import setup_logging
+    setup_logging(Config.LOG_LEVEL)
+
+    start_workers(workers=args.workers)
+    logger.info("规划任务工作进程已启动: %d个线程，任务表 %s", args.workers, Config.JOB_DB_PATH)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
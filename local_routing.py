@@ -0,0 +1,152 @@
+"""
+本地估算路线（降级模式）
+
+高德驾车路线规划变慢或不可用时，用已经解析好的地点坐标在本地估算路线：
+相邻地点之间的球面距离乘以道路系数作为行驶距离，按平均车速估算时间。
+估算结果构造成与高德响应相同的结构，再经过与正常结果相同的后处理，
+因此响应格式不变，只是多了一个说明降级原因的degraded字段。
+
+自动降级的条件（ROUTE_DEGRADE=auto）:
+- 高德熔断器处于熔断冷却期
+- 最近若干次路线规划的P90耗时超过ROUTE_SLO（失败按超时计）；降级期间每隔
+  DEGRADED_PROBE_INTERVAL秒放行一次真实请求，恢复后自动退出降级
+- 单次请求失败、返回错误或等待超过ROUTE_SLO
+"""
+import math
+import threading
+import time
+from collections import deque
+
+from config import Config
+import metrics
+from route_optimizer import haversine, parse_coordinate
+import upstream
+
+ROUTE_DEGRADED = metrics.registry.counter('route_degraded_total', '使用本地估算路线的次数，按原因区分')
+
+# 判断是否超出SLO时参考的最近请求数和分位数
+SLO_WINDOW = 20
+SLO_PERCENTILE = 0.9
+
+
+def estimate_route(locations, coordinates):
+    """
+    按途经顺序估算驾车路线
+
+    参数:
+        locations (list): 按途经顺序排列的地点名称列表
+        coordinates (dict): 地点名称到"经度,纬度"坐标的映射
+
+    返回:
+        dict: 与高德驾车路线规划响应结构相同的路线数据，每两个相邻地点之间为一个步骤
+    """
+    points = [coordinates[location] for location in locations]
+    speed = Config.DEGRADED_SPEED_KMH / 3.6  # 米/秒
+    steps = []
+    total_distance = total_duration = 0
+    for start, end in zip(points, points[1:]):
+        distance = round(haversine(parse_coordinate(start), parse_coordinate(end)) * Config.DEGRADED_ROAD_FACTOR)
+        duration = round(distance / speed)
+        total_distance += distance
+        total_duration += duration
+        steps.append({
+            'instruction': '按直线距离估算',
+            'distance': str(distance),
+            'duration': str(duration),
+            'polyline': f"{start};{end}"
+        })
+    return {
+        'status': '1',
+        'info': 'OK',
+        'route': {
+            'origin': points[0],
+            'destination': points[-1],
+            'paths': [{'distance': str(total_distance), 'duration': str(total_duration), 'steps': steps}]
+        }
+    }
+
+
+class RouteHealth:
+    """记录高德路线规划的耗时，判断是否需要降级"""
+
+    def __init__(self, slo, window=SLO_WINDOW, percentile=SLO_PERCENTILE):
+        """
+        参数:
+            slo (float): 单次路线规划的耗时目标（秒）
+            window (int): 参考的最近请求数
+            percentile (float): 与SLO比较的分位数
+        """
+        self.slo = slo
+        self.percentile = percentile
+        self.samples = deque(maxlen=window)
+        self._last_probe = 0.0
+        self._probe = None  # 降级期间放行的探测请求的令牌，记录结果后清除
+        self._lock = threading.Lock()
+
+    def record(self, seconds, ok=True, probe=None):
+        """
+        记录一次请求的耗时，失败按无穷大计
+
+        参数:
+            seconds (float): 请求耗时
+            ok (bool): 请求是否成功
+            probe (object): degrade_reason()为该请求返回的探测令牌；探测请求在SLO内成功时清空窗口，立即恢复
+        """
+        with self._lock:
+            if probe is not None and probe is self._probe:
+                self._probe = None
+                if ok and seconds <= self.slo:
+                    self.samples.clear()
+                    return
+            self.samples.append(seconds if ok else math.inf)
+
+    def slow(self):
+        """最近请求的分位耗时是否超过SLO，样本不足一半窗口时不判断"""
+        with self._lock:
+            samples = sorted(self.samples)
+        if len(samples) < self.samples.maxlen // 2:
+            return False
+        return samples[min(len(samples) - 1, int(len(samples) * self.percentile))] > self.slo
+
+    def degrade_reason(self):
+        """
+        判断本次路线规划是否直接使用本地估算
+
+        返回:
+            tuple: (降级原因, 探测令牌)；不需要降级时原因为None，本次请求是降级期间放行的探测请求时
+                带有令牌，请求结束后传给record()
+        """
+        if Config.ROUTE_DEGRADE == 'always':
+            return 'offline', None
+        if Config.ROUTE_DEGRADE != 'auto':
+            return None, None
+        if upstream.amap.breaker.cooling_down():
+            return 'circuit_open', None
+        if self.slow():
+            with self._lock:
+                now = time.monotonic()
+                if now - self._last_probe >= Config.DEGRADED_PROBE_INTERVAL:
+                    # 放行一次真实请求，用它的耗时判断是否恢复；降级前已发出的请求不会占用探测
+                    self._last_probe = now
+                    self._probe = object()
+                    return None, self._probe
+            return 'slo', None
+        return None, None
+
+
+def request_timeout():
+    """请求高德路线规划的(连接, 读取)超时，自动降级时读取超时不超过ROUTE_SLO"""
+    if Config.ROUTE_DEGRADE == 'auto':
+        return Config.HTTP_CONNECT_TIMEOUT, min(Config.HTTP_READ_TIMEOUT, Config.ROUTE_SLO)
+    return Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT
+
+
+def wait_timeout(remaining):
+    """自动降级时路线阶段最多等待的秒数，超过后改用本地估算"""
+    if Config.ROUTE_DEGRADE == 'auto':
+        return min(remaining, Config.ROUTE_SLO + 1)
+    return remaining
+
+
+# 进程内共享的路线规划健康状态
+route_health = RouteHealth(Config.ROUTE_SLO)
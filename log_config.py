@@ -0,0 +1,54 @@
+"""
+日志配置
+
+日志记录在请求线程中只把记录放入队列，由后台线程负责格式化和写出，
+避免同步的stdout写入阻塞请求处理。后台线程不会随fork进入子进程，
+预加载应用后fork出的工作进程会重新启动自己的写出线程。
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+_listener = None
+_queue_handler = None
+
+
+def setup_logging(level='INFO'):
+    """
+    配置根日志器，多次调用只生效一次
+
+    参数:
+        level (str): 日志级别，如DEBUG、INFO、WARNING
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s'))
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_restart)
+
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(level.upper())
+
+
+def _stop():
+    _listener.stop()
+
+
+def _restart():
+    """fork后的子进程中没有写出线程，换一个新队列并重新启动"""
+    global _listener
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+    _queue_handler.queue = log_queue
@@ -0,0 +1,181 @@
+"""
+性能指标模块
+
+提供计数器、直方图和按需采集的仪表，并按Prometheus文本格式输出，
+供 /metrics 接口使用。所有指标都是进程内的，多进程部署时由Prometheus分别抓取。
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# 默认的耗时分桶（秒），覆盖从本地缓存到大模型生成的范围
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in pairs)
+    return '{' + body + '}'
+
+
+class Counter:
+    """只增不减的计数器"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """计数器加amount"""
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """读取某组标签的当前值"""
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, key, value) for key, value in items]
+
+
+class Histogram:
+    """按固定分桶统计取值分布的直方图"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # 标签 -> [各分桶计数..., 总和, 总数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """记录一次取值"""
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """统计代码块的耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        samples = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", key + (('le', repr(float(bound))),), cumulative))
+            samples.append((f"{self.name}_bucket", key + (('le', '+Inf'),), series[-1]))
+            samples.append((f"{self.name}_sum", key, series[-2]))
+            samples.append((f"{self.name}_count", key, series[-1]))
+        return samples
+
+
+class Gauge:
+    """在抓取时通过回调读取当前值的仪表"""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, help_text, callback):
+        """
+        参数:
+            callback (callable): 返回[(标签字典, 值), ...]的函数
+        """
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+
+    def samples(self):
+        try:
+            return [(self.name, _label_key(labels), value) for labels, value in self.callback()]
+        except Exception:
+            return []
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text):
+        return self.register(Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, buckets))
+
+    def gauge(self, name, help_text, callback):
+        return self.register(Gauge(name, help_text, callback))
+
+    def render(self):
+        """按Prometheus文本格式输出所有指标"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+# 进程内的默认注册表和通用指标
+registry = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STAGE_SECONDS = registry.histogram('plan_stage_seconds', '行程规划各阶段耗时（秒）')
+UPSTREAM_SECONDS = registry.histogram('upstream_request_seconds', '单次上游请求耗时（秒）')
+UPSTREAM_ERRORS = registry.counter('upstream_errors_total', '上游请求失败次数')
+UPSTREAM_RETRIES = registry.counter('upstream_retries_total', '上游请求按重试策略重试的次数')
+CACHE_REQUESTS = registry.counter('cache_requests_total', '缓存查询次数，按命中结果区分')
+STAGE_TIMEOUTS = registry.counter('plan_stage_timeouts_total', '行程规划阶段超时次数')
+PREWARM_HITS = registry.counter('prewarm_hits_total', '预热写入的缓存条目服务的线上请求数')
+LLM_TOKENS = registry.counter('llm_tokens_total', '大模型消耗的token数，按类型和输出格式区分')
+
+
+def span(stage):
+    """统计行程规划某个阶段耗时的上下文管理器"""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def render():
+    """输出默认注册表中的所有指标"""
+    return registry.render()
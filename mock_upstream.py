@@ -0,0 +1,299 @@
+"""
+本地模拟上游服务
+
+模拟高德行政区域查询、地理编码、驾车路线规划、实况天气接口以及DeepSeek的chat.completions接口，
+支持配置延迟、抖动、错误率和流式输出，用于在离线环境下压测和回归性能。
+
+用法:
+    python mock_upstream.py --port 9000 --latency 80 --llm-latency 1500
+
+然后让应用指向模拟服务:
+    AMAP_BASE_URL=http://127.0.0.1:9000/v3 DEEPSEEK_BASE_URL=http://127.0.0.1:9000 python app.py
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+
+# 运行参数，由命令行覆盖
+settings = {
+    'latency': 0.05,  # 高德接口基础延迟（秒）
+    'jitter': 0.02,  # 延迟抖动的标准差（秒）
+    'error_rate': 0.0,  # 返回503的概率
+    'llm_latency': 1.0,  # 大模型首个token前的延迟（秒）
+    'token_interval': 0.02,  # 流式输出时每段文本的间隔（秒）
+    'miss_rate': 0.05,  # 地理编码找不到地点的概率
+}
+
+# 模拟城市中心坐标，未知城市使用苏州
+CITY_CENTERS = {
+    '苏州': (120.585, 31.299),
+    '上海': (121.473, 31.230),
+    '北京': (116.407, 39.904),
+    '杭州': (120.155, 30.274),
+    '南京': (118.797, 32.060),
+}
+CITY_ADCODES = {
+    '苏州': '320500',
+    '上海': '310000',
+    '北京': '110000',
+    '杭州': '330100',
+    '南京': '320100',
+}
+
+SIGHTS = ['拙政园', '狮子林', '平江路', '虎丘', '留园', '苏州博物馆', '山塘街', '网师园', '金鸡湖', '寒山寺', '沧浪亭', '观前街']
+RESTAURANTS = ['松鹤楼', '得月楼', '同得兴', '朱鸿兴', '陆稿荐', '新聚丰']
+
+
+def _delay(base):
+    """按基础延迟和抖动休眠"""
+    time.sleep(max(0.0, random.gauss(base, settings['jitter'])))
+
+
+def _should_fail():
+    return random.random() < settings['error_rate']
+
+
+def _city_center(text):
+    """按城市名称或adcode查找城市中心"""
+    for city, center in CITY_CENTERS.items():
+        if city in (text or '') or CITY_ADCODES[city] == text:
+            return center
+    return CITY_CENTERS['苏州']
+
+
+def _strip_city(address):
+    for city in CITY_CENTERS:
+        for prefix in (f"{city}市", city):
+            if address.startswith(prefix) and len(address) > len(prefix):
+                return address[len(prefix):]
+    return address
+
+
+def _fake_location(name, city):
+    """根据地点名称生成稳定的伪坐标，分布在城市中心附近约10公里范围内"""
+    digest = hashlib.md5(name.encode('utf-8')).digest()
+    lng, lat = _city_center(city)
+    lng += (digest[0] / 255 - 0.5) * 0.2
+    lat += (digest[1] / 255 - 0.5) * 0.2
+    return f"{lng:.6f},{lat:.6f}"
+
+
+def _distance(a, b):
+    """两个"经度,纬度"坐标之间的球面距离（米）"""
+    lng1, lat1 = map(float, a.split(','))
+    lng2, lat2 = map(float, b.split(','))
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    h = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(h))
+
+
+@app.route('/v3/geocode/geo')
+def geocode():
+    _delay(settings['latency'])
+    if _should_fail():
+        return Response(status=503)
+    city = request.args.get('city', '')
+    addresses = request.args.get('address', '').split('|')
+    geocodes = []
+    for address in addresses:
+        if random.random() < settings['miss_rate']:
+            geocodes.append({'formatted_address': [], 'location': []})
+        else:
+            geocodes.append({'formatted_address': address, 'location': _fake_location(_strip_city(address), city)})
+    return jsonify({'status': '1', 'info': 'OK', 'count': str(len(geocodes)), 'geocodes': geocodes})
+
+
+@app.route('/v3/config/district')
+def district():
+    _delay(settings['latency'])
+    if _should_fail():
+        return Response(status=503)
+    keywords = request.args.get('keywords', '')
+    districts = [
+        {'adcode': adcode, 'name': f"{city}市", 'level': 'city'}
+        for city, adcode in CITY_ADCODES.items() if city in keywords
+    ]
+    return jsonify({'status': '1', 'info': 'OK', 'count': str(len(districts)), 'districts': districts})
+
+
+@app.route('/v3/direction/driving')
+def driving():
+    _delay(settings['latency'] * 2)
+    if _should_fail():
+        return Response(status=503)
+    points = [request.args['origin']]
+    if request.args.get('waypoints'):
+        points += request.args['waypoints'].split('|')
+    points.append(request.args['destination'])
+
+    steps = []
+    for start, end in zip(points, points[1:]):
+        distance = _distance(start, end) * 1.3
+        # 模拟真实响应的体积：每一步都带有折线
+        polyline = ';'.join(f"{float(start.split(',')[0]) + i * 1e-4:.6f},{float(start.split(',')[1]) + i * 1e-4:.6f}" for i in range(50))
+        steps.append({
+            'instruction': '沿道路行驶',
+            'distance': str(int(distance)),
+            'duration': str(int(distance / 8.3)),
+            'polyline': polyline,
+            'tmcs': [{'distance': str(int(distance)), 'status': '畅通', 'polyline': polyline}],
+        })
+    path = {
+        'distance': str(sum(int(s['distance']) for s in steps)),
+        'duration': str(sum(int(s['duration']) for s in steps)),
+        'strategy': '速度最快',
+        'steps': steps,
+    }
+    return jsonify({'status': '1', 'info': 'OK', 'count': '1', 'route': {'origin': points[0], 'destination': points[-1], 'paths': [path]}})
+
+
+@app.route('/v3/weather/weatherInfo')
+def weather_info():
+    _delay(settings['latency'])
+    if _should_fail():
+        return Response(status=503)
+    city = request.args.get('city', '')
+    if request.args.get('extensions') == 'all':
+        today = time.time()
+        casts = []
+        for i in range(4):
+            day = time.localtime(today + i * 86400)
+            high = random.randint(0, 38)
+            casts.append({
+                'date': time.strftime('%Y-%m-%d', day), 'week': str(day.tm_wday + 1),
+                'dayweather': random.choice(['晴', '多云', '阴', '雨']), 'nightweather': random.choice(['晴', '多云', '阴']),
+                'daytemp': str(high), 'nighttemp': str(high - random.randint(3, 10)),
+                'daywind': '东南', 'nightwind': '东南', 'daypower': '≤3', 'nightpower': '≤3',
+            })
+        return jsonify({'status': '1', 'info': 'OK', 'forecasts': [{'city': city, 'adcode': '320500', 'casts': casts}]})
+    return jsonify({'status': '1', 'info': 'OK', 'lives': [{
+        'province': city, 'city': city, 'adcode': '320500', 'weather': random.choice(['晴', '多云', '阴', '雨']),
+        'temperature': str(random.randint(-5, 38)), 'winddirection': '东南', 'windpower': '≤3', 'humidity': '60',
+    }], 'forecasts': []})
+
+
+def _day_lines(sights, restaurants):
+    """生成一天的行程小节"""
+    sections = [
+        ('上午行程', sights[:2], '游览时间'), ('午餐', restaurants[:1], '用餐时间'),
+        ('下午行程', sights[2:4], '游览时间'), ('晚餐', restaurants[1:2], '用餐时间'),
+        ('晚间行程（可选）', sights[4:5], '游览时间'),
+    ]
+    lines = []
+    hour = 9
+    for title, places, label in sections:
+        lines.append(f"# {title}")
+        for place in places:
+            lines += [f"【{place}】", f"- {label}：{hour:02d}:00-{hour + 1:02d}:30", '- 简介：模拟的景点介绍。', '- 交通建议：步行或打车。', '']
+            hour += 2
+    return lines
+
+
+def _itinerary_text(location, days=1):
+    """生成带【】标注地点、结构与真实输出相似的行程文本，多日行程每天一个小节"""
+    if days <= 1:
+        lines = [f"### {location}完美一日游行程规划", ''] + _day_lines(random.sample(SIGHTS, 5), random.sample(RESTAURANTS, 2))
+    else:
+        lines = [f"### {location}{days}日游行程规划", '']
+        for day in range(1, days + 1):
+            # 地点不够时允许跨天重复，用来覆盖去重逻辑
+            lines += [f"## 第{day}天：模拟主题", ''] + _day_lines(random.sample(SIGHTS, 5), random.sample(RESTAURANTS, 2))
+    lines += ['# 交通总建议', '- 地铁和公交覆盖主要景点。']
+    return '\n'.join(lines)
+
+
+def _plan_json(days=1):
+    """生成与结构化输出格式一致的JSON行程"""
+    plan_days = []
+    for day in range(1, max(days, 1) + 1):
+        sights = random.sample(SIGHTS, 5)
+        restaurants = random.sample(RESTAURANTS, 2)
+        slots = [
+            ('上午', sights[0]), ('上午', sights[1]), ('午餐', restaurants[0]),
+            ('下午', sights[2]), ('下午', sights[3]), ('晚餐', restaurants[1]), ('晚间', sights[4]),
+        ]
+        stops = []
+        for i, (section, name) in enumerate(slots):
+            stop = {'name': name, 'section': section, 'start': f"{9 + i * 2:02d}:00", 'end': f"{10 + i * 2:02d}:30",
+                    'intro': '模拟的景点介绍。', 'area': '姑苏区', 'transport': '步行或打车。'}
+            if '餐' in section:
+                stop['dishes'] = ['松鼠桂鱼', '响油鳝糊']
+            stops.append(stop)
+        plan_days.append({'day': day, 'theme': '模拟主题', 'stops': stops})
+    return json.dumps({'days': plan_days, 'tips': '地铁和公交覆盖主要景点。'}, ensure_ascii=False)
+
+
+def _chunks(text, size=8):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@app.route('/chat/completions', methods=['POST'])
+@app.route('/v1/chat/completions', methods=['POST'])
+def chat_completions():
+    if _should_fail():
+        return Response(status=503)
+    body = request.get_json(force=True)
+    prompt = body['messages'][-1]['content']
+    fields = dict(line.strip().split('：', 1) for line in prompt.splitlines() if line.strip().startswith(('地点：', '天数：')))
+    days = int(fields.get('天数', 1))
+    if (body.get('response_format') or {}).get('type') == 'json_object':
+        text = _plan_json(days)
+    else:
+        text = _itinerary_text(fields.get('地点', '苏州').strip(), days)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    model = body.get('model', 'deepseek-chat')
+
+    if not body.get('stream'):
+        time.sleep(settings['llm_latency'] + settings['token_interval'] * len(_chunks(text)))
+        return jsonify({
+            'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': len(prompt), 'completion_tokens': len(text), 'total_tokens': len(prompt) + len(text)},
+        })
+
+    def generate():
+        time.sleep(settings['llm_latency'])
+        for piece in _chunks(text):
+            chunk = {
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}],
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            time.sleep(settings['token_interval'])
+        yield 'data: [DONE]\n\n'
+
+    return Response(generate(), mimetype='text/event-stream')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟高德与DeepSeek上游服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--latency', type=float, default=50, help='高德接口基础延迟（毫秒）')
+    parser.add_argument('--jitter', type=float, default=20, help='延迟抖动标准差（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回503的概率（0~1）')
+    parser.add_argument('--llm-latency', type=float, default=1000, help='大模型首个token前的延迟（毫秒）')
+    parser.add_argument('--token-interval', type=float, default=20, help='流式输出每段文本的间隔（毫秒）')
+    parser.add_argument('--miss-rate', type=float, default=0.05, help='地理编码找不到地点的概率（0~1）')
+    args = parser.parse_args()
+
+    settings.update(
+        latency=args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate,
+        llm_latency=args.llm_latency / 1000, token_interval=args.token_interval / 1000, miss_rate=args.miss_rate,
+    )
+    print(f"模拟上游服务运行在 http://{args.host}:{args.port} ，参数: {settings}")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
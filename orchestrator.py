@@ -0,0 +1,371 @@
+"""
+行程规划并发编排模块
+
+使用有界线程池并发执行天气查询、行程生成、地点地理编码和路线规划，
+为每个阶段和整个请求设置截止时间，某个阶段超时时返回已完成的部分结果。
+"""
+import logging
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError, wait
+
+from config import Config
+from itinerary_cache import normalize_days
+from itinerary_parser import Itinerary, ItineraryParser
+import local_routing
+import metrics
+import upstream
+import weather
+
+logger = logging.getLogger(__name__)
+
+# 进程内共享的有界线程池，所有请求的上游调用都在这里执行，任务沿用提交者的上游优先级
+executor = upstream.ContextExecutor(
+    max_workers=Config.PLANNER_MAX_WORKERS,
+    thread_name_prefix='planner'
+)
+
+
+class PlanDeadline:
+    """单个请求的截止时间，负责计算各阶段实际可用的等待时间"""
+
+    def __init__(self, total_seconds):
+        self.expires_at = time.monotonic() + total_seconds
+
+    def remaining(self, stage=None):
+        """
+        计算某个阶段还可以等待的秒数
+
+        参数:
+            stage (str): 阶段名称，对应Config.STAGE_TIMEOUTS中的键
+
+        返回:
+            float: 可等待的秒数，取阶段超时与整体剩余时间中的较小值
+        """
+        remaining = max(0.0, self.expires_at - time.monotonic())
+        if stage is None:
+            return remaining
+        return min(remaining, Config.STAGE_TIMEOUTS.get(stage, remaining))
+
+
+class PlanRun:
+    """记录一次规划过程中各阶段的耗时和超时情况"""
+
+    def __init__(self):
+        self.timings = {}
+        self.timeouts = []
+
+    def record(self, stage, seconds):
+        """记录某个阶段的耗时，同时计入阶段耗时直方图"""
+        self.timings[stage] = round(seconds, 3)
+        metrics.STAGE_SECONDS.observe(seconds, stage=stage)
+
+    def timeout(self, stage, detail):
+        """记录某个阶段超时"""
+        self.timeouts.append(stage)
+        metrics.STAGE_TIMEOUTS.inc(stage=stage)
+        logger.warning("阶段超时: %s (%s)", stage, detail)
+
+    def wait(self, future, stage, timeout, default=None):
+        """
+        等待某个阶段的结果，超时则取消该任务并返回默认值
+
+        参数:
+            future (Future): 阶段任务
+            stage (str): 阶段名称
+            timeout (float): 最长等待秒数
+            default: 超时时返回的值
+
+        返回:
+            阶段结果或默认值
+        """
+        started = time.monotonic()
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self.timeout(stage, f"{timeout:.1f}s")
+            return default
+        finally:
+            self.timings.setdefault(stage, round(time.monotonic() - started, 3))
+
+    def summary(self):
+        """返回可直接放入响应中的耗时统计"""
+        return {'timings': self.timings, 'timeouts': self.timeouts}
+
+
+def _timed(run, stage, func, *args):
+    """在工作线程中执行任务并记录实际耗时"""
+    started = time.monotonic()
+    try:
+        return func(*args)
+    finally:
+        run.record(stage, time.monotonic() - started)
+
+
+def geocode_all(planner, locations, city, deadline, run):
+    """
+    并发批量获取所有地点的坐标
+
+    参数:
+        planner (TripPlanner): 旅游规划器实例
+        locations (list): 地点名称列表
+        city (str): 行程所在城市
+        deadline (PlanDeadline): 请求截止时间
+        run (PlanRun): 耗时记录
+
+    返回:
+        dict: 地点名称到坐标的映射，超时或失败的地点值为None
+    """
+    started = time.monotonic()
+    timeout = deadline.remaining('geocode')
+    coordinates = planner.geocoder.resolve_many(locations, city, timeout=timeout)
+    elapsed = time.monotonic() - started
+    if elapsed >= timeout and not all(coordinates.values()):
+        run.timeout('geocode', f"{timeout:.1f}s")
+    run.record('geocode', elapsed)
+    return coordinates
+
+
+def run_plan(planner, location, interests, dietary_preferences, days=1):
+    """
+    并发执行一次完整的行程规划
+
+    天气查询与行程生成同时开始；行程生成后并发批量解析所有地点的坐标，
+    全部坐标就绪后再规划路线。任一阶段超时都不会阻塞整个请求。
+
+    参数:
+        planner (TripPlanner): 旅游规划器实例
+        location (str): 城市名称
+        interests (str): 用户兴趣
+        dietary_preferences (str): 饮食偏好
+        days (int): 行程天数，多于一天时交给run_multi_day_plan
+
+    返回:
+        dict: 包含weather、itinerary、stops、route以及各阶段耗时的结果
+    """
+    days = normalize_days(days)
+    if days > 1:
+        return run_multi_day_plan(planner, location, interests, dietary_preferences, days)
+
+    deadline = PlanDeadline(Config.PLAN_DEADLINE)
+    run = PlanRun()
+
+    # 天气与行程生成互不依赖，同时开始
+    weather_future = executor.submit(_timed, run, 'weather', planner.get_weather_forecast, location)
+    itinerary_future = executor.submit(
+        _timed, run, 'itinerary', planner.plan_itinerary, location, interests, dietary_preferences
+    )
+
+    itinerary, parsed = run.wait(
+        itinerary_future, 'itinerary', deadline.remaining('itinerary'), default=(None, Itinerary())
+    )
+    locations = parsed.locations
+
+    if not locations:
+        route = {"error": "无法提取地点信息"}
+    elif len(locations) < 2:
+        route = {"error": "需要至少两个地点才能规划路线"}
+    else:
+        # 行程生成后的上游请求属于进行中的规划，排在新规划前面
+        with upstream.prioritized(upstream.HIGH):
+            coordinates = geocode_all(planner, locations, location, deadline, run)
+            route_future = executor.submit(_timed, run, 'route', planner.plan_route, locations, coordinates,
+                                           parsed.groups())
+        # 超过路线SLO仍未返回时改用本地估算，保证响应时间有上限
+        route = run.wait(route_future, 'route', local_routing.wait_timeout(deadline.remaining('route'))) \
+            or planner.fallback_route(locations, coordinates, parsed.groups())
+
+    weather_info = run.wait(weather_future, 'weather', deadline.remaining('weather'))
+
+    result = {
+        'weather': weather_info,
+        'itinerary': itinerary,
+        'stops': parsed.to_list(),
+        'route': route
+    }
+    result.update(run.summary())
+    return result
+
+
+def day_summaries(parsed, routes, casts):
+    """
+    组合多日行程中每一天的地点、天气和路线
+
+    参数:
+        parsed (Itinerary): 结构化行程
+        routes (dict): 天到路线规划结果的映射
+        casts (list): 从当天开始的逐日预报，可以为None
+
+    返回:
+        list: 每天一个字典，包含day、weather、locations和route
+    """
+    casts = casts or []
+    summaries = []
+    for i, day in enumerate(parsed.days()):
+        index = (day or i + 1) - 1
+        summaries.append({
+            'day': day or i + 1,
+            'weather': weather.describe_cast(casts[index]) if index < len(casts) else None,
+            'locations': parsed.for_day(day).locations,
+            'route': routes.get(day)
+        })
+    return summaries
+
+
+def run_multi_day_plan(planner, location, interests, dietary_preferences, days):
+    """
+    并发执行多日行程规划
+
+    一次调用生成按天分节的行程，同时获取一次天气预报供所有天使用；
+    所有地点一起批量地理编码，之后各天的路线并行规划。
+
+    参数:
+        planner (TripPlanner): 旅游规划器实例
+        location (str): 城市名称
+        interests (str): 用户兴趣
+        dietary_preferences (str): 饮食偏好
+        days (int): 行程天数
+
+    返回:
+        dict: 包含weather、itinerary、stops、days以及各阶段耗时的结果
+    """
+    deadline = PlanDeadline(Config.PLAN_DEADLINE)
+    run = PlanRun()
+
+    forecast_future = executor.submit(_timed, run, 'weather', planner.get_forecast, location)
+    itinerary_future = executor.submit(
+        _timed, run, 'itinerary', planner.plan_itinerary, location, interests, dietary_preferences, days
+    )
+
+    itinerary, parsed = run.wait(
+        itinerary_future, 'itinerary', deadline.remaining('itinerary'), default=(None, Itinerary())
+    )
+
+    routes = {}
+    if len(parsed) >= 2:
+        # 行程生成后的上游请求属于进行中的规划，排在新规划前面
+        with upstream.prioritized(upstream.HIGH):
+            coordinates = geocode_all(planner, parsed.locations, location, deadline, run)
+
+            # 各天的路线互不依赖，并行规划
+            started = time.monotonic()
+            futures = {}
+            for day in parsed.days():
+                stops = parsed.for_day(day)
+                futures[day] = executor.submit(planner.plan_route, stops.locations, coordinates, stops.groups())
+        for day, future in futures.items():
+            stops = parsed.for_day(day)
+            routes[day] = run.wait(future, 'route', local_routing.wait_timeout(deadline.remaining('route'))) \
+                or planner.fallback_route(stops.locations, coordinates, stops.groups())
+        run.record('route', time.monotonic() - started)
+
+    casts = run.wait(forecast_future, 'weather', deadline.remaining('weather'))
+    casts = casts[:days] if casts else None
+
+    result = {
+        'weather': weather.format_forecast(location, casts),
+        'itinerary': itinerary,
+        'stops': parsed.to_list(),
+        'days': day_summaries(parsed, routes, casts)
+    }
+    result.update(run.summary())
+    return result
+
+
+def stream_plan(planner, location, interests, dietary_preferences):
+    """
+    流式执行行程规划，按完成顺序产出事件
+
+    行程文本边生成边转发；每当一个【】地点闭合就立即提交地理编码任务，
+    使地理编码与行程生成重叠进行。生成结束后等待剩余坐标并规划路线。
+
+    参数:
+        planner (TripPlanner): 旅游规划器实例
+        location (str): 城市名称
+        interests (str): 用户兴趣
+        dietary_preferences (str): 饮食偏好
+
+    返回:
+        generator: 产出(事件名, 数据)元组，事件包括weather、token、location、
+                   geocode、route、error和done
+    """
+    deadline = PlanDeadline(Config.PLAN_DEADLINE)
+    run = PlanRun()
+    parser = ItineraryParser()
+    geocode_futures = {}
+    pending = set()
+
+    weather_future = executor.submit(_timed, run, 'weather', planner.get_weather_forecast, location)
+    pending.add(weather_future)
+
+    def drain():
+        """产出已完成但尚未发送的任务结果"""
+        for future in [f for f in pending if f.done()]:
+            pending.discard(future)
+            if future is weather_future:
+                yield 'weather', {'weather': future.result()}
+            else:
+                name = geocode_futures[future]
+                location_coord = future.result() if future.exception() is None else None
+                yield 'geocode', {'name': name, 'location': location_coord}
+
+    def locate(stops):
+        """发送新识别的地点并立即开始地理编码"""
+        for stop in stops:
+            yield 'location', stop.to_dict()
+            future = executor.submit(planner.geocode_location, stop.name, location)
+            geocode_futures[future] = stop.name
+            pending.add(future)
+
+    started = time.monotonic()
+    try:
+        for text in planner.generate_itinerary_stream(location, interests, dietary_preferences):
+            if 'first_token' not in run.timings:
+                run.record('first_token', time.monotonic() - started)
+            yield 'token', {'text': text}
+            yield from locate(parser.feed(text))
+            yield from drain()
+            if deadline.remaining('itinerary') <= 0:
+                run.timeout('itinerary', '生成未在截止时间内完成')
+                break
+    except Exception as e:
+        logger.error("生成行程失败: %s", e)
+        yield 'error', {'stage': 'itinerary', 'error': f"生成行程失败: {str(e)}"}
+    yield from locate(parser.close())
+    run.record('itinerary', time.monotonic() - started)
+
+    locations = parser.locations
+    if len(locations) < 2:
+        route = {"error": "无法提取地点信息" if not locations else "需要至少两个地点才能规划路线"}
+    else:
+        # 等待尚未完成的地理编码
+        geocode_wait = [f for f in geocode_futures if not f.done()]
+        if geocode_wait:
+            _, not_done = wait(geocode_wait, timeout=deadline.remaining('geocode'))
+            if not_done:
+                run.timeout('geocode', f"{len(not_done)}个地点未完成")
+        yield from drain()
+
+        coordinates = {name: None for name in locations}
+        for future, name in geocode_futures.items():
+            if future.done() and future.exception() is None:
+                coordinates[name] = future.result()
+            else:
+                future.cancel()
+
+        # 生成结束后的路线请求排在新规划前面；with块中没有yield，优先级不会泄漏到调用方
+        with upstream.prioritized(upstream.HIGH):
+            route_future = executor.submit(_timed, run, 'route', planner.plan_route, locations, coordinates,
+                                           parser.itinerary.groups())
+        route = run.wait(route_future, 'route', local_routing.wait_timeout(deadline.remaining('route'))) \
+            or planner.fallback_route(locations, coordinates, parser.itinerary.groups())
+    yield 'route', {'route': route}
+
+    if weather_future in pending:
+        weather_info = run.wait(weather_future, 'weather', deadline.remaining('weather'))
+        pending.discard(weather_future)
+        yield 'weather', {'weather': weather_info}
+
+    done = {'itinerary': parser.buffer, 'locations': locations, 'stops': parser.itinerary.to_list()}
+    done.update(run.summary())
+    yield 'done', done
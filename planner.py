@@ -0,0 +1,741 @@
+"""
+旅游规划核心逻辑
+
+TripPlanner负责天气查询、行程生成、地点解析和路线规划，
+被同步的Flask应用和异步服务共同使用。
+"""
+import json
+import logging
+import threading
+import time
+from config import Config, AMAP_KEY
+import weather
+import orchestrator
+import http_client
+from geocoder import Geocoder
+from itinerary_cache import itinerary_cache, normalize_request
+from itinerary_parser import parse_itinerary, from_plan, render_markdown
+import metrics
+import route_optimizer
+import upstream
+import hedging
+import local_routing
+import route_cache
+from route_payload import slim_route
+
+logger = logging.getLogger(__name__)
+
+# 结构化输出的行程格式，作为提示词的一部分发送给大模型
+PLAN_SCHEMA = (
+    '{"days":[{"day":1,"theme":"当天主题","stops":[{"name":"地点全称","section":"上午|午餐|下午|晚餐|晚间",'
+    '"start":"09:00","end":"11:00","intro":"一句话简介","dishes":["餐厅的推荐菜"],"area":"所在区或街道",'
+    '"transport":"如何到达"}]}],"tips":"整体交通建议"}'
+)
+
+
+def compact_prompt(prompt):
+    """去掉提示词每行的缩进和多余空行，减少输入token"""
+    lines = [line.strip() for line in prompt.strip().splitlines()]
+    return '\n'.join(line for i, line in enumerate(lines) if line or (i and lines[i - 1]))
+
+# 高德驾车路线规划API地址
+ROUTE_URL = f"{Config.AMAP_BASE_URL}/direction/driving"
+
+# DeepSeek客户端，每个密钥一个；openai导入较慢，首次创建客户端时才导入
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def llm_client(key):
+    """返回密钥对应的DeepSeek客户端，首次使用时创建"""
+    if key not in _clients:
+        with _clients_lock:
+            if key not in _clients:
+                from openai import OpenAI
+                _clients[key] = OpenAI(api_key=key, base_url=Config.DEEPSEEK_BASE_URL)
+    return _clients[key]
+
+
+def chat_completion(**kwargs):
+    """
+    经过DeepSeek限流器选择密钥后调用chat.completions接口
+
+    非流式调用在LLM_HEDGE开启时按耗时分布对冲，落后的生成结果只计入token消耗
+    """
+    priority = upstream.request_priority()
+
+    def attempt():
+        with upstream.deepseek.slot('chat', priority) as lease:
+            return llm_client(lease.key).chat.completions.create(**kwargs)
+
+    if kwargs.get('stream'):
+        return attempt()
+    return hedging.call(
+        'chat', attempt, discard=lambda response: TripPlanner.record_usage(response, 'hedged'), priority=priority
+    )
+
+class TripPlanner:
+    """旅游规划器类，负责处理天气、行程生成和路线规划等功能"""
+    
+    def __init__(self):
+        """初始化旅游规划器"""
+        self.amap_key = AMAP_KEY
+        # 使用进程内共享的连接池，复用keep-alive连接
+        self.session = http_client.get_session()
+        # 带本地缓存的批量地理编码器
+        self.geocoder = Geocoder(self.session, self.amap_key, orchestrator.executor)
+
+    def get_weather_forecast(self, location):
+        """
+        获取指定城市的天气信息
+        
+        参数:
+            location (str): 城市名称
+            
+        返回:
+            str: 天气信息，如果获取失败则返回None
+        """
+        try:
+            weather_data = weather.get_weather(location)
+            return weather_data
+        except Exception as e:
+            logger.error("获取天气信息失败: %s", e)
+            return None
+
+    def get_forecast(self, location):
+        """
+        获取指定城市当天和未来几天的天气预报，多日行程的所有天共用一次请求
+        
+        参数:
+            location (str): 城市名称
+            
+        返回:
+            list: 高德逐日预报，如果获取失败则返回None
+        """
+        try:
+            return weather.get_forecast(location)
+        except Exception as e:
+            logger.error("获取天气预报失败: %s", e)
+            return None
+
+    def build_messages(self, location, interests, dietary_preferences):
+        """
+        构建生成行程所用的对话消息
+        
+        参数:
+            location (str): 城市名称
+            interests (str): 用户兴趣
+            dietary_preferences (str): 饮食偏好
+            
+        返回:
+            list: 发送给DeepSeek的消息列表
+        """
+        # 构建提示词
+        prompt = f"""
+        基于以下信息，生成一个完美的一日游行程：
+        地点：{location}
+        兴趣：{interests}
+        饮食偏好：{dietary_preferences}
+        
+        请按照以下格式生成行程：
+
+        ### 完美一日游行程规划
+
+        # 上午行程
+        [景点1]
+        - 游览时间：[具体时间]
+        - 简介：[景点介绍]
+        - 交通建议：[如何到达]
+
+        [景点2]
+        - 游览时间：[具体时间]
+        - 简介：[景点介绍]
+        - 交通建议：[如何到达]
+
+        # 午餐
+        [餐厅1]
+        - 用餐时间：[具体时间]
+        - 推荐菜品：[特色菜品]
+        - 交通建议：[如何到达]
+
+        # 下午行程
+        [景点3]
+        - 游览时间：[具体时间]
+        - 简介：[景点介绍]
+        - 交通建议：[如何到达]
+
+        [景点4]
+        - 游览时间：[具体时间]
+        - 简介：[景点介绍]
+        - 交通建议：[如何到达]
+
+        # 晚餐
+        [餐厅2]
+        - 用餐时间：[具体时间]
+        - 推荐菜品：[特色菜品]
+        - 交通建议：[如何到达]
+
+        # 晚间行程（可选）
+        [景点5]
+        - 游览时间：[具体时间]
+        - 简介：[景点介绍]
+        - 交通建议：[如何到达]
+
+        # 交通总建议
+        - 提供该城市的整体交通建议
+        - 包括公共交通、打车、步行等建议
+        - 可以推荐交通APP或实用工具
+
+        注意事项：
+        1. 请确保每个景点和餐厅都用【】标注，这样我可以提取它们进行路线规划
+        2. 时间安排要合理，考虑交通时间
+        3. 景点之间要相对集中，减少不必要的奔波
+        4. 交通建议要具体且实用
+        5. 推荐当地特色美食和必去景点
+        """
+        
+        return [
+            {"role": "system", "content": "你是一个专业的旅游规划师，擅长规划合理且有趣的行程。"},
+            {"role": "user", "content": compact_prompt(prompt)}
+        ]
+
+    def build_multi_day_messages(self, location, interests, dietary_preferences, days):
+        """
+        构建一次生成多日行程所用的对话消息，每天一个小节
+        
+        参数:
+            location (str): 城市名称
+            interests (str): 用户兴趣
+            dietary_preferences (str): 饮食偏好
+            days (int): 行程天数
+            
+        返回:
+            list: 发送给DeepSeek的消息列表
+        """
+        prompt = f"""
+        基于以下信息，生成一个{days}天的旅游行程：
+        地点：{location}
+        天数：{days}
+        兴趣：{interests}
+        饮食偏好：{dietary_preferences}
+        
+        请按照以下格式生成行程，从第1天到第{days}天，每天一个小节：
+
+        ### {days}日游行程规划
+
+        ## 第1天：[当天主题]
+        # 上午行程
+        [景点1]
+        - 游览时间：[具体时间]
+        - 简介：[景点介绍]
+
+        # 午餐
+        [餐厅1]
+        - 用餐时间：[具体时间]
+        - 推荐菜品：[特色菜品]
+
+        # 下午行程
+        [景点2]
+        - 游览时间：[具体时间]
+        - 简介：[景点介绍]
+
+        # 晚餐
+        [餐厅2]
+        - 用餐时间：[具体时间]
+        - 推荐菜品：[特色菜品]
+
+        ## 第2天：[当天主题]
+        ……
+
+        # 交通总建议
+        - 提供该城市的整体交通建议
+
+        注意事项：
+        1. 请确保每个景点和餐厅都用【】标注，这样我可以提取它们进行路线规划
+        2. 不同的天不要重复安排同一个景点或餐厅
+        3. 同一天的景点要相对集中，按区域安排每天的行程
+        4. 时间安排要合理，考虑交通时间
+        5. 推荐当地特色美食和必去景点
+        """
+        
+        return [
+            {"role": "system", "content": "你是一个专业的旅游规划师，擅长规划合理且有趣的行程。"},
+            {"role": "user", "content": compact_prompt(prompt)}
+        ]
+
+    def build_structured_messages(self, location, interests, dietary_preferences, days):
+        """
+        构建要求以JSON格式输出行程的精简对话消息
+        
+        参数:
+            location (str): 城市名称
+            interests (str): 用户兴趣
+            dietary_preferences (str): 饮食偏好
+            days (int): 行程天数
+            
+        返回:
+            list: 发送给DeepSeek的消息列表
+        """
+        prompt = (
+            f"地点：{location}\n天数：{days}\n兴趣：{interests}\n饮食偏好：{dietary_preferences}\n"
+            "每天上午2个景点、午餐1家餐厅、下午2个景点、晚餐1家餐厅，可加1个晚间景点；"
+            "同一天的地点相对集中，时间考虑交通，推荐当地特色美食和必去景点，不同天不重复。\n"
+            f"只输出如下格式的JSON：{PLAN_SCHEMA}"
+        )
+        return [
+            {"role": "system", "content": "你是专业的旅游规划师，只输出JSON。"},
+            {"role": "user", "content": prompt}
+        ]
+
+    def prepare_request(self, location, interests, dietary_preferences, days=1, structured=False):
+        """
+        规范化行程请求参数并构建提示消息，用于查询和写入行程缓存
+        
+        参数:
+            location (str): 城市名称
+            interests (str): 用户兴趣
+            dietary_preferences (str): 饮食偏好
+            days (int): 行程天数
+            structured (bool): 是否要求以JSON格式输出
+            
+        返回:
+            tuple: (规范化参数, 提示消息列表)
+        """
+        normalized = normalize_request(location, interests, dietary_preferences, days)
+        city, interest_terms, diet_terms, days = normalized
+        if structured:
+            messages = self.build_structured_messages(city, '，'.join(interest_terms), '，'.join(diet_terms), days)
+        elif days > 1:
+            messages = self.build_multi_day_messages(city, '，'.join(interest_terms), '，'.join(diet_terms), days)
+        else:
+            messages = self.build_messages(city, '，'.join(interest_terms), '，'.join(diet_terms))
+        return normalized, messages
+
+    def generate_itinerary(self, location, interests, dietary_preferences, days=1):
+        """
+        使用DeepSeek生成个性化行程，相同或相近的请求直接使用缓存结果
+        
+        参数:
+            location (str): 城市名称
+            interests (str): 用户兴趣
+            dietary_preferences (str): 饮食偏好
+            days (int): 行程天数，多于一天时一次生成按天分节的行程
+            
+        返回:
+            str: 生成的行程，如果生成失败则返回None
+        """
+        try:
+            normalized, messages = self.prepare_request(location, interests, dietary_preferences, days)
+            cached = itinerary_cache.get(Config.DEEPSEEK_MODEL, messages, normalized)
+            if cached is not None:
+                logger.debug("行程缓存命中: %s", location)
+                return cached
+            
+            # 调用DeepSeek API生成行程
+            response = chat_completion(
+                model=Config.DEEPSEEK_MODEL,
+                messages=messages,
+                stream=False
+            )
+            
+            self.record_usage(response, 'markdown')
+            itinerary = response.choices[0].message.content
+            if itinerary:
+                itinerary_cache.set(Config.DEEPSEEK_MODEL, messages, normalized, itinerary)
+            return itinerary
+        except Exception as e:
+            metrics.UPSTREAM_ERRORS.inc(endpoint='chat', reason=type(e).__name__)
+            logger.error("生成行程失败: %s", e)
+            return None
+
+    @staticmethod
+    def record_usage(response, output_format):
+        """记录一次生成消耗的token数"""
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            metrics.LLM_TOKENS.inc(usage.prompt_tokens or 0, type='prompt', format=output_format)
+            metrics.LLM_TOKENS.inc(usage.completion_tokens or 0, type='completion', format=output_format)
+
+    @staticmethod
+    def structured_result(content, location, days):
+        """
+        把JSON行程转换为(Markdown文本, 结构化行程)
+        
+        异常:
+            ValueError: 内容不是约定格式的JSON
+        """
+        plan = json.loads(content)
+        parsed = from_plan(plan, multi_day=days > 1)
+        if not len(parsed):
+            raise ValueError("行程JSON中没有地点")
+        return render_markdown(plan, location, multi_day=days > 1), parsed
+
+    def generate_structured_itinerary(self, location, interests, dietary_preferences, days=1):
+        """
+        使用DeepSeek的JSON输出模式生成行程，相同的请求直接使用缓存结果
+        
+        参数:
+            location (str): 城市名称
+            interests (str): 用户兴趣
+            dietary_preferences (str): 饮食偏好
+            days (int): 行程天数
+            
+        返回:
+            tuple: (本地渲染的Markdown行程, 结构化行程)
+            
+        异常:
+            调用失败或输出不是约定格式的JSON时抛出异常
+        """
+        normalized, messages = self.prepare_request(location, interests, dietary_preferences, days, structured=True)
+        days = normalized[3]
+        cached = itinerary_cache.get(Config.DEEPSEEK_MODEL, messages, normalized)
+        if cached is not None:
+            logger.debug("行程缓存命中: %s", location)
+            return self.structured_result(cached, location, days)
+        
+        response = chat_completion(
+            model=Config.DEEPSEEK_MODEL,
+            messages=messages,
+            response_format={'type': 'json_object'},
+            stream=False
+        )
+        self.record_usage(response, 'json')
+        content = response.choices[0].message.content
+        result = self.structured_result(content, location, days)
+        # 只缓存能正确解析的结果
+        itinerary_cache.set(Config.DEEPSEEK_MODEL, messages, normalized, content)
+        return result
+
+    def plan_itinerary(self, location, interests, dietary_preferences, days=1):
+        """
+        生成行程并得到结构化结果，按ITINERARY_FORMAT选择JSON或Markdown输出
+        
+        JSON输出失败或格式不符时退回Markdown输出并解析。
+        
+        返回:
+            tuple: (行程文本, 结构化行程)，生成失败时行程文本为None
+        """
+        if Config.ITINERARY_FORMAT == 'json':
+            try:
+                return self.generate_structured_itinerary(location, interests, dietary_preferences, days)
+            except Exception as e:
+                metrics.UPSTREAM_ERRORS.inc(endpoint='chat', reason=type(e).__name__)
+                logger.warning("JSON格式行程生成失败，改用Markdown输出: %s", e)
+        itinerary = self.generate_itinerary(location, interests, dietary_preferences, days)
+        return itinerary, self.parse_itinerary(itinerary)
+
+    def generate_itinerary_stream(self, location, interests, dietary_preferences):
+        """
+        使用DeepSeek流式生成个性化行程，缓存命中时一次性产出完整行程
+        
+        参数:
+            location (str): 城市名称
+            interests (str): 用户兴趣
+            dietary_preferences (str): 饮食偏好
+            
+        返回:
+            generator: 逐段产出生成的文本，调用失败时抛出异常
+        """
+        normalized, messages = self.prepare_request(location, interests, dietary_preferences)
+        cached = itinerary_cache.get(Config.DEEPSEEK_MODEL, messages, normalized)
+        if cached is not None:
+            logger.debug("行程缓存命中: %s", location)
+            yield cached
+            return
+        
+        stream = chat_completion(
+            model=Config.DEEPSEEK_MODEL,
+            messages=messages,
+            stream=True
+        )
+        parts = []
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield parts[-1]
+        finally:
+            # 客户端断开时关闭上游连接
+            stream.close()
+        
+        # 只缓存完整生成的行程
+        itinerary_cache.set(Config.DEEPSEEK_MODEL, messages, normalized, ''.join(parts))
+
+    def parse_itinerary(self, itinerary):
+        """
+        把行程文本解析成结构化行程
+        
+        参数:
+            itinerary (str): 行程文本
+            
+        返回:
+            Itinerary: 按出现顺序排列的地点及其时段、时间和类型
+        """
+        parsed = parse_itinerary(itinerary)
+        logger.debug("提取的地点: %s", parsed.locations)
+        return parsed
+
+    def order_stops(self, locations, coordinates, groups=None):
+        """
+        在时段约束下求总距离最短的游览顺序
+        
+        参数:
+            locations (list): 地点名称列表
+            coordinates (dict): 地点名称到坐标的映射
+            groups (list): Itinerary.groups()返回的时段分组
+            
+        返回:
+            tuple: (优化后的地点列表, 优化信息字典)，不需要优化时信息为None
+        """
+        if not Config.ROUTE_OPTIMIZE or len(locations) < 3 or not all(coordinates.get(l) for l in locations):
+            return locations, None
+        
+        points = [coordinates[location] for location in locations]
+        order = route_optimizer.optimize_order(points, groups)
+        matrix = route_optimizer.distance_matrix(points)
+        ordered = [locations[i] for i in order]
+        info = {
+            'original_order': locations,
+            'estimated_distance': round(route_optimizer.path_length(matrix, order)),
+            'original_estimated_distance': round(route_optimizer.path_length(matrix, list(range(len(locations)))))
+        }
+        logger.debug("优化后的游览顺序: %s", ordered)
+        return ordered, info
+
+    def geocode_location(self, location, city=None):
+        """
+        获取单个地点的坐标，优先使用离线索引和本地缓存
+
+        参数:
+            location (str): 地点名称
+            city (str): 行程所在城市，用于限定搜索范围
+
+        返回:
+            str: "经度,纬度"格式的坐标，如果获取失败则返回None
+        """
+        return self.geocoder.geocode(location, city)
+
+    def get_route_planning(self, locations, city=None):
+        """
+        使用高德地图API规划路线
+
+        参数:
+            locations (list): 地点名称列表
+            city (str): 行程所在城市，用于限定搜索范围
+
+        返回:
+            dict: 路线规划结果，包含错误信息或路线详情
+        """
+        try:
+            # 检查地点数量
+            if not locations or len(locations) < 2:
+                return {"error": "需要至少两个地点才能规划路线"}
+
+            # 并发批量获取所有地点的坐标
+            coordinates = self.geocoder.resolve_many(locations, city)
+            return self.plan_route(locations, coordinates)
+        except Exception as e:
+            logger.error("路线规划失败: %s", e)
+            return {
+                "error": f"路线规划失败: {str(e)}",
+                "locations": locations
+            }
+
+    def plan_route(self, locations, coordinates, groups=None):
+        """
+        根据已获取的地点坐标优化游览顺序，再调用高德驾车路线规划API
+
+        参数:
+            locations (list): 地点名称列表
+            coordinates (dict): 地点名称到坐标的映射，获取失败的地点值为None
+            groups (list): 时段分组，优化顺序时不打乱时段先后
+
+        返回:
+            dict: 路线规划结果，包含错误信息或路线详情
+        """
+        locations, optimization = self.order_stops(locations, coordinates, groups)
+        params = self.route_params(locations, coordinates)
+        if 'error' in params:
+            return params
+
+        points = [coordinates[location] for location in locations]
+        if route_cache.enabled():
+            pairs, legs, missing = route_cache.cached_legs(points)
+            if not missing:
+                # 所有路段都有缓存时不请求高德，也不受降级影响
+                return self.annotate_route(route_cache.assemble(points, pairs, legs), locations, optimization)
+
+        reason, probe = local_routing.route_health.degrade_reason()
+        if reason:
+            return self.local_route(locations, coordinates, optimization, reason)
+
+        logger.debug("路线规划参数: %s", params)
+
+        started = time.monotonic()
+        try:
+            if route_cache.enabled():
+                route_data = self.fetch_legs(points, pairs, legs, missing)
+            else:
+                # 发送路线规划请求，自动降级时读取超时为路线SLO，超时后改用本地估算
+                response = self.session.get(ROUTE_URL, params=params, timeout=local_routing.request_timeout())
+                route_data = response.json()
+        except Exception as e:
+            local_routing.route_health.record(time.monotonic() - started, ok=False, probe=probe)
+            logger.error("路线规划请求失败: %s", e)
+            return self.local_route(locations, coordinates, optimization, 'upstream_error')
+
+        ok = route_data.get('status') == '1'
+        local_routing.route_health.record(time.monotonic() - started, ok=ok, probe=probe)
+        if not ok:
+            logger.warning("路线规划返回错误: %s", route_data.get('info'))
+            return self.local_route(locations, coordinates, optimization, 'upstream_error')
+        return self.annotate_route(route_data, locations, optimization)
+
+    def fetch_legs(self, points, pairs, legs, missing):
+        """
+        并发请求缺失的路段，写入路段缓存后拼接整条路线
+
+        参数:
+            points (list): 按途经顺序排列的坐标
+            pairs (list): 全部路段
+            legs (dict): 已有的路段
+            missing (list): 需要请求的路段
+
+        返回:
+            dict: 与高德响应结构相同的路线数据
+
+        异常:
+            任一路段请求失败时抛出该异常，成功的路段仍会写入缓存
+        """
+        futures = {pair: route_cache.executor.submit(self.fetch_leg, *pair) for pair in missing}
+        fetched, errors = {}, []
+        for pair, future in futures.items():
+            try:
+                fetched[pair] = future.result()
+            except Exception as e:
+                errors.append(e)
+        route_cache.get_leg_cache().put_many(fetched, Config.ROUTE_STRATEGY)
+        if errors:
+            raise errors[0]
+        legs.update(fetched)
+        return route_cache.assemble(points, pairs, legs)
+
+    def fetch_leg(self, origin, destination):
+        """请求单个路段，返回路段缓存条目"""
+        response = self.session.get(
+            ROUTE_URL, params=route_cache.leg_params(self.amap_key, origin, destination),
+            timeout=local_routing.request_timeout()
+        )
+        result = response.json()
+        leg = route_cache.parse_leg(result)
+        if leg is None:
+            raise RuntimeError(f"路段规划失败: {result.get('info')}")
+        return leg
+
+    def local_route(self, locations, coordinates, optimization=None, reason=None):
+        """
+        用本地估算的路线代替高德驾车路线规划，格式与正常结果相同
+
+        参数:
+            locations (list): 按途经顺序排列的地点名称列表
+            coordinates (dict): 地点名称到坐标的映射
+            optimization (dict): 顺序优化信息
+            reason (str): 降级原因
+
+        返回:
+            dict: 路线数据，degraded字段说明降级原因和估算方法
+        """
+        logger.info("使用本地估算路线: %s", reason)
+        local_routing.ROUTE_DEGRADED.inc(reason=reason)
+        route_data = self.annotate_route(local_routing.estimate_route(locations, coordinates), locations, optimization)
+        route_data['degraded'] = {'reason': reason, 'method': 'haversine'}
+        return route_data
+
+    def fallback_route(self, locations, coordinates, groups=None, reason='slo_timeout'):
+        """
+        路线阶段等待超时时在调用线程内重新排序并本地估算路线
+
+        参数:
+            locations (list): 地点名称列表
+            coordinates (dict): 地点名称到坐标的映射
+            groups (list): 时段分组
+            reason (str): 降级原因
+
+        返回:
+            dict: 路线数据；坐标不足时返回错误信息
+        """
+        locations, optimization = self.order_stops(locations, coordinates, groups)
+        params = self.route_params(locations, coordinates)
+        if 'error' in params:
+            return params
+        return self.local_route(locations, coordinates, optimization, reason)
+
+    def route_params(self, locations, coordinates):
+        """
+        构建驾车路线规划请求参数
+
+        参数:
+            locations (list): 地点名称列表，决定途经顺序
+            coordinates (dict): 地点名称到坐标的映射，获取失败的地点值为None
+
+        返回:
+            dict: 请求参数；坐标不足时返回包含error的字典
+        """
+        # 检查是否有获取失败的地点
+        failed_locations = [location for location in locations if not coordinates.get(location)]
+        if failed_locations:
+            return {
+                "error": f"无法获取以下地点的坐标: {', '.join(failed_locations)}",
+                "locations": locations
+            }
+
+        coordinates = [coordinates[location] for location in locations]
+
+        # 检查是否获取到足够的坐标
+        if len(coordinates) < 2:
+            return {
+                "error": "无法获取足够的地点坐标来规划路线",
+                "locations": locations
+            }
+
+        return {
+            'key': self.amap_key,
+            'origin': coordinates[0],  # 起点坐标
+            'destination': coordinates[-1],  # 终点坐标
+            'waypoints': '|'.join(coordinates[1:-1]) if len(coordinates) > 2 else '',  # 途经点坐标
+            'strategy': Config.ROUTE_STRATEGY,
+            'extensions': 'all'  # 获取详细信息
+        }
+
+    @staticmethod
+    def annotate_route(route_data, locations, optimization=None):
+        """
+        把地点名称添加到高德返回的路线数据中
+
+        参数:
+            route_data (dict): 高德驾车路线规划的响应
+            locations (list): 按途经顺序排列的地点名称列表
+            optimization (dict): 顺序优化信息
+
+        返回:
+            dict: 添加了地点名称的路线数据；ROUTE_PAYLOAD为slim时只保留页面使用的字段
+        """
+        if Config.ROUTE_PAYLOAD == 'slim':
+            return slim_route(route_data, locations, optimization, Config.ROUTE_POLYLINE_ZOOM)
+        if route_data['status'] == '1':
+            route_data['locations'] = locations
+            if optimization:
+                route_data['optimization'] = optimization
+            # 添加起点和终点名称到路线步骤中
+            if 'route' in route_data and 'paths' in route_data['route']:
+                for path in route_data['route']['paths']:
+                    if 'steps' in path:
+                        for i, step in enumerate(path['steps']):
+                            # 为每个步骤添加起点和终点名称
+                            if i < len(locations) - 1:
+                                step['start_location'] = locations[i]
+                                step['end_location'] = locations[i + 1]
+                            else:
+                                step['start_location'] = locations[-2]
+                                step['end_location'] = locations[-1]
+        return route_data
@@ -0,0 +1,210 @@
+"""
+离线POI索引
+
+把热门景点和餐厅的坐标预先构建成一个按（城市adcode, 规范化名称）排序的二进制文件，
+运行时用mmap只读映射，通过二分查找完成精确查找和前缀搜索，不需要访问网络。
+同一台机器上的多个工作进程共享操作系统的页缓存。
+
+文件格式:
+    b'POI1' | 记录数 uint32 | 每条记录的偏移 uint32 * 记录数 | 记录...
+    每条记录为UTF-8编码的 "adcode\\t规范化名称\\t名称\\t经度,纬度\\n"
+
+构建索引（CSV列为 adcode,name,location，adcode使用城市级编码，如苏州为320500）:
+    python poi_index.py build pois.csv cache/poi.idx
+
+查询:
+    python poi_index.py search cache/poi.idx 320500 拙政
+"""
+import argparse
+import csv
+import mmap
+import os
+import re
+import struct
+import threading
+import unicodedata
+from bisect import bisect_left
+
+from config import Config
+
+MAGIC = b'POI1'
+_HEADER = struct.Struct('<4sI')
+_OFFSET = struct.Struct('<I')
+
+# 括号中的分店、门牌等补充说明不参与匹配
+_BRACKETS = re.compile(r'[(\[【][^)\]】]*[)\]】]')
+_PUNCTUATION = re.compile(r'[\s·•・\-—_\'"“”‘’.,，。、:;!?]+')
+
+
+def normalize_name(name):
+    """
+    规范化地点名称：全角转半角、忽略大小写、去掉括号内容和标点空白
+
+    例如 "拙政园（东北街）" 和 "拙 政 园" 都规范化为 "拙政园"
+    """
+    name = unicodedata.normalize('NFKC', name).casefold()
+    return _PUNCTUATION.sub('', _BRACKETS.sub('', name))
+
+
+class _Keys:
+    """按下标读取记录键，供bisect在mmap上直接二分查找"""
+
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return self.index.count
+
+    def __getitem__(self, i):
+        return self.index.record(i)[:2]
+
+
+class POIIndex:
+    """内存映射的只读POI索引"""
+
+    def __init__(self, path):
+        """
+        参数:
+            path (str): build_index生成的索引文件路径
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"不是有效的POI索引文件: {path}")
+        self._keys = _Keys(self)
+
+    def record(self, i):
+        """读取第i条记录，返回(adcode, 规范化名称, 名称, 坐标)字节串"""
+        start, = _OFFSET.unpack_from(self._mm, _HEADER.size + i * _OFFSET.size)
+        end = self._mm.find(b'\n', start)
+        return self._mm[start:end].split(b'\t')
+
+    def lookup(self, adcode, name):
+        """
+        精确查找
+
+        参数:
+            adcode (str): 城市adcode
+            name (str): 地点名称，查找前会先规范化
+
+        返回:
+            str: "经度,纬度"格式的坐标，未收录时返回None
+        """
+        key = [adcode.encode(), normalize_name(name).encode()]
+        i = bisect_left(self._keys, key)
+        if i < self.count:
+            record = self.record(i)
+            if record[:2] == key:
+                return record[3].decode()
+        return None
+
+    def search(self, adcode, prefix, limit=10):
+        """
+        前缀搜索
+
+        参数:
+            adcode (str): 城市adcode
+            prefix (str): 名称前缀，查找前会先规范化
+            limit (int): 最多返回的条数
+
+        返回:
+            list: (名称, 坐标)元组列表，按规范化名称排序
+        """
+        city = adcode.encode()
+        prefix = normalize_name(prefix).encode()
+        results = []
+        i = bisect_left(self._keys, [city, prefix])
+        while i < self.count and len(results) < limit:
+            record = self.record(i)
+            if record[0] != city or not record[1].startswith(prefix):
+                break
+            results.append((record[2].decode(), record[3].decode()))
+            i += 1
+        return results
+
+    def prefetch(self):
+        """提示操作系统把整个索引读入页缓存，fork前调用时所有工作进程直接命中"""
+        if hasattr(mmap, 'MADV_WILLNEED'):
+            self._mm.madvise(mmap.MADV_WILLNEED)
+
+    def close(self):
+        self._mm.close()
+
+
+def build_index(rows, path):
+    """
+    构建索引文件，同一城市中规范化后重名的地点只保留第一个
+
+    参数:
+        rows (iterable): (adcode, 名称, 坐标)元组
+        path (str): 输出文件路径，先写临时文件再原子替换
+
+    返回:
+        int: 写入的记录数
+    """
+    records = {}
+    for adcode, name, location in rows:
+        key = (adcode.strip().encode(), normalize_name(name).encode())
+        if key[1] and key not in records:
+            records[key] = (name.strip().encode(), location.strip().encode())
+
+    body = bytearray()
+    offsets = []
+    base = _HEADER.size + _OFFSET.size * len(records)
+    for key in sorted(records):
+        offsets.append(base + len(body))
+        body += b'\t'.join(key + records[key]) + b'\n'
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, len(records)))
+        for offset in offsets:
+            f.write(_OFFSET.pack(offset))
+        f.write(body)
+    os.replace(tmp, path)
+    return len(records)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """获取进程内共享的POI索引，未配置或文件不存在时返回None"""
+    global _index
+    if _index is None and Config.POI_INDEX_PATH and os.path.exists(Config.POI_INDEX_PATH):
+        with _index_lock:
+            if _index is None:
+                _index = POIIndex(Config.POI_INDEX_PATH)
+    return _index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='构建或查询离线POI索引')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='从CSV构建索引')
+    build.add_argument('source', help='CSV文件，列为 adcode,name,location')
+    build.add_argument('output', help='输出的索引文件')
+    search = commands.add_parser('search', help='按名称前缀查询')
+    search.add_argument('index', help='索引文件')
+    search.add_argument('adcode', help='城市adcode')
+    search.add_argument('prefix', help='名称前缀')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        with open(args.source, newline='', encoding='utf-8') as f:
+            rows = [row[:3] for row in csv.reader(f) if len(row) >= 3 and row[0] != 'adcode']
+        print(f"写入 {build_index(rows, args.output)} 个地点到 {args.output}")
+    else:
+        for name, location in POIIndex(args.index).search(args.adcode, args.prefix):
+            print(f"{name}\t{location}")
+
+
+if __name__ == '__main__':
+    main()
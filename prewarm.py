@@ -0,0 +1,388 @@
+"""
+热门城市缓存预热
+
+在服务进程内按热门城市和常见的兴趣、饮食偏好组合，提前写入实况天气、行程和地理编码缓存，
+每轮预热发出的上游请求数用完配置的预算后不再开始新的步骤。预热写入的条目之后被线上请求命中时计入
+prewarm_hits_total，report()给出它们服务了多少线上请求。
+
+缓存都在进程内，预热必须在服务进程中执行：服务按PREWARM_INTERVAL定时预热，
+也可以用命令行通过 /prewarm 接口触发一轮预热并查看报告:
+    python prewarm.py
+    python prewarm.py --cities 北京,杭州 --combos "历史:无;美食:无" --budget 50
+    python prewarm.py --report
+"""
+import argparse
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from cache import warm_entries
+from config import Config, AMAP_KEY
+from geocoder import scope_key
+from itinerary_cache import itinerary_cache
+import metrics
+from planner import TripPlanner
+import upstream
+import weather
+
+logger = logging.getLogger(__name__)
+
+WARMED_CACHES = ('itinerary', 'weather', 'geocode')
+
+
+def parse_cities(text):
+    """把逗号分隔的城市解析为列表"""
+    if isinstance(text, (list, tuple)):
+        return [city.strip() for city in text if city and city.strip()]
+    return [city.strip() for city in (text or '').replace('，', ',').split(',') if city.strip()]
+
+
+def parse_combos(text):
+    """
+    解析兴趣和饮食偏好组合
+
+    参数:
+        text (str): 形如 "历史,美食:无;自然风光:素食" 的字符串，组合之间用分号分隔，
+            兴趣和饮食偏好之间用冒号分隔
+
+    返回:
+        list: (兴趣, 饮食偏好)元组列表
+    """
+    combos = []
+    for item in (text or '').replace('；', ';').split(';'):
+        interests, _, diet = item.replace('：', ':').partition(':')
+        if interests.strip():
+            combos.append((interests.strip(), diet.strip() or '无'))
+    return combos
+
+
+class Prewarmer:
+    """在预算内预热天气、行程和地理编码缓存"""
+
+    def __init__(self, planner):
+        """
+        参数:
+            planner (TripPlanner): 同步规划器，预热与线上请求走相同的生成和缓存路径
+        """
+        self.planner = planner
+        self.running = False
+        self.last_run = None
+        self._lock = threading.Lock()
+
+    def itinerary_keys(self, city, interests, diet):
+        """/plan_trip（JSON或Markdown输出）和流式接口使用的行程缓存键"""
+        keys = []
+        for structured in (True, False):
+            _, messages = self.planner.prepare_request(city, interests, diet, structured=structured)
+            keys.append(itinerary_cache.make_key(Config.DEEPSEEK_MODEL, messages))
+        return keys
+
+    def run(self, cities, combos, budget):
+        """
+        执行一轮预热，预算用完后不再开始新的步骤
+
+        预算只计算预热自身发出的上游请求，不包括同时进行的线上请求。每个步骤（一个城市的天气、
+        一份行程、一份行程的地点坐标）开始前检查预算，进行中的步骤不会中断，因此一轮的请求数
+        最多超出预算一个步骤的调用数。
+
+        参数:
+            cities (list): 按热门程度排列的城市
+            combos (list): (兴趣, 饮食偏好)组合
+            budget (int): 最多发出的上游请求数
+
+        返回:
+            dict: 本轮预热的摘要，已有一轮预热在进行时返回None
+        """
+        with self._lock:
+            if self.running:
+                return None
+            self.running = True
+
+        started = time.monotonic()
+        counter = upstream.RequestCounter()
+        summary = {
+            'started_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'cities': cities,
+            'combos': [f"{interests}:{diet}" for interests, diet in combos],
+            'budget': budget,
+            'warmed': dict.fromkeys(WARMED_CACHES, 0),
+            'already_cached': dict.fromkeys(WARMED_CACHES, 0),
+            'errors': 0,
+            'budget_exhausted': False
+        }
+
+        def has_budget():
+            if counter.requests < budget:
+                return True
+            summary['budget_exhausted'] = True
+            return False
+
+        try:
+            # 预热线程发出的请求排在线上请求之后，并单独计数
+            with upstream.background(), upstream.counting() as counter:
+                for city in cities:
+                    if not has_budget():
+                        break
+                    self.warm_weather(city, summary)
+                    for interests, diet in combos:
+                        if not has_budget():
+                            break
+                        self.warm_itinerary(city, interests, diet, summary, has_budget)
+        finally:
+            summary['upstream_requests'] = counter.requests
+            summary['seconds'] = round(time.monotonic() - started, 3)
+            self.last_run = summary
+            self.running = False
+        logger.info("预热完成: %s", json.dumps(summary, ensure_ascii=False))
+        return summary
+
+    def warm_weather(self, city, summary):
+        """实况天气缓存不新鲜时请求一次"""
+        cached = weather.peek_live_weather(city)
+        if cached is not None and not cached[1]:
+            summary['already_cached']['weather'] += 1
+            return
+        try:
+            if weather.refresh_live_weather(AMAP_KEY, city):
+                warm_entries.mark('weather', city)
+                summary['warmed']['weather'] += 1
+        except Exception as e:
+            summary['errors'] += 1
+            logger.warning("预热天气失败: %s, %s", city, e)
+
+    def warm_itinerary(self, city, interests, diet, summary, has_budget):
+        """
+        生成/plan_trip使用的行程，开启PREWARM_STREAM时再生成流式接口使用的Markdown行程，
+        然后解析其中的地点坐标
+        """
+        keys = self.itinerary_keys(city, interests, diet)
+        calls = [lambda: self.planner.plan_itinerary(city, interests, diet)[1]]
+        if Config.PREWARM_STREAM and Config.ITINERARY_FORMAT == 'json':
+            calls.append(lambda: self.planner.parse_itinerary(self.planner.generate_itinerary(city, interests, diet)))
+        elif Config.ITINERARY_FORMAT != 'json':
+            # Markdown输出时两个接口共用同一个缓存键
+            keys = keys[1:]
+
+        for key, call in zip(keys, calls):
+            if key in itinerary_cache.entries:
+                summary['already_cached']['itinerary'] += 1
+                continue
+            if not has_budget():
+                return
+            try:
+                itinerary = call()
+            except Exception as e:
+                summary['errors'] += 1
+                logger.warning("预热行程失败: %s, %s", city, e)
+                continue
+            if key not in itinerary_cache.entries and not itinerary:
+                continue
+            # JSON输出失败时会退回Markdown输出，标记所有已写入的键
+            for warmed in self.itinerary_keys(city, interests, diet):
+                if warmed in itinerary_cache.entries:
+                    warm_entries.mark('itinerary', warmed)
+            summary['warmed']['itinerary'] += 1
+            if itinerary and has_budget():
+                self.warm_geocodes(city, itinerary.locations, summary)
+
+    def warm_geocodes(self, city, names, summary):
+        """解析本地缓存中还没有的地点坐标"""
+        geocoder = self.planner.geocoder
+        try:
+            scope = geocoder.scope(city)
+            key = scope_key(scope)
+            cached = geocoder.cache.get_many(key, names)
+            summary['already_cached']['geocode'] += len(cached)
+            missing = [name for name in names if name not in cached]
+            if not missing:
+                return
+            for name, location in geocoder.resolve_many(missing, city).items():
+                if location:
+                    warm_entries.mark('geocode', (key, name))
+                    summary['warmed']['geocode'] += 1
+        except Exception as e:
+            summary['errors'] += 1
+            logger.warning("预热地点坐标失败: %s, %s", city, e)
+
+
+def report():
+    """
+    统计预热条目服务线上请求的情况
+
+    lookups为进程启动以来该缓存的全部查询次数（包括预热自身的少量查询），
+    share是预热条目命中次数占其中的比例。
+
+    返回:
+        dict: 缓存名 -> {warmed_entries, served, lookups, share}
+    """
+    lookups = dict.fromkeys(WARMED_CACHES, 0)
+    for _, key, value in metrics.CACHE_REQUESTS.samples():
+        cache = dict(key).get('cache')
+        if cache in lookups:
+            lookups[cache] += value
+    served = {}
+    for cache in WARMED_CACHES:
+        hits = metrics.PREWARM_HITS.value(cache=cache)
+        served[cache] = {
+            'warmed_entries': warm_entries.count(cache),
+            'served': hits,
+            'lookups': lookups[cache],
+            'share': round(hits / lookups[cache], 4) if lookups[cache] else 0.0
+        }
+    return served
+
+
+_prewarmer = None
+_prewarmer_lock = threading.Lock()
+
+
+def get_prewarmer(planner=None):
+    """
+    获取进程内共享的预热器
+
+    参数:
+        planner (TripPlanner): 首次调用时使用的同步规划器，未提供时创建一个
+    """
+    global _prewarmer
+    if _prewarmer is None:
+        with _prewarmer_lock:
+            if _prewarmer is None:
+                _prewarmer = Prewarmer(planner or TripPlanner())
+    return _prewarmer
+
+
+def parse_budget(value):
+    """把预算解析为非负整数，格式不对时抛出ValueError"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"预算必须是非负整数: {value!r}")
+    try:
+        budget = int(value)
+    except ValueError:
+        raise ValueError(f"预算必须是非负整数: {value!r}") from None
+    if budget < 0:
+        raise ValueError(f"预算必须是非负整数: {value!r}")
+    return budget
+
+
+def start(cities=None, combos=None, budget=None):
+    """
+    在后台线程中执行一轮预热，参数为None时使用配置
+
+    返回:
+        bool: 是否开始了新的一轮，已有一轮在进行时返回False
+
+    异常:
+        ValueError: 城市、组合或预算的格式不对
+    """
+    if cities is not None and not isinstance(cities, (str, list, tuple)):
+        raise ValueError("cities必须是逗号分隔的字符串或列表")
+    if combos is not None and not isinstance(combos, str):
+        raise ValueError("combos必须是形如 \"历史:无;美食:无\" 的字符串")
+    if isinstance(cities, (list, tuple)) and not all(isinstance(city, str) for city in cities):
+        raise ValueError("cities中的城市必须是字符串")
+    cities = parse_cities(cities if cities is not None else Config.PREWARM_CITIES)
+    combos = parse_combos(combos if combos is not None else Config.PREWARM_COMBOS)
+    budget = parse_budget(budget if budget is not None else Config.PREWARM_BUDGET)
+    prewarmer = get_prewarmer()
+    if prewarmer.running:
+        return False
+    threading.Thread(
+        target=prewarmer.run, args=(cities, combos, budget), name='prewarm', daemon=True
+    ).start()
+    return True
+
+
+def status():
+    """返回预热状态、上一轮摘要和预热条目服务线上请求的情况"""
+    prewarmer = get_prewarmer()
+    return {'running': prewarmer.running, 'last_run': prewarmer.last_run, 'served': report()}
+
+
+def start_scheduler():
+    """PREWARM_INTERVAL大于0时启动定时预热线程，服务启动后立即执行第一轮"""
+    if Config.PREWARM_INTERVAL <= 0 or not parse_cities(Config.PREWARM_CITIES):
+        return None
+
+    def loop():
+        while True:
+            try:
+                start()
+            except Exception as e:
+                logger.error("定时预热失败: %s", e)
+            time.sleep(Config.PREWARM_INTERVAL)
+
+    thread = threading.Thread(target=loop, name='prewarm-scheduler', daemon=True)
+    thread.start()
+    return thread
+
+
+def authorized(token, remote_addr):
+    """配置了ADMIN_TOKEN时校验请求头中的令牌，否则只允许本机访问"""
+    if Config.ADMIN_TOKEN:
+        return hmac.compare_digest(token or '', Config.ADMIN_TOKEN)
+    return remote_addr in ('127.0.0.1', '::1')
+
+
+def print_status(data):
+    """以文本形式输出预热状态"""
+    run = data.get('last_run')
+    if run:
+        print(f"上一轮预热: {run['started_at']}，耗时 {run['seconds']} 秒，"
+              f"上游请求 {run['upstream_requests']}/{run['budget']}"
+              + ("（预算已用完）" if run['budget_exhausted'] else ''))
+        for cache in WARMED_CACHES:
+            print(f"  {cache}: 新预热 {run['warmed'][cache]}，已在缓存中 {run['already_cached'][cache]}")
+        if run['errors']:
+            print(f"  失败 {run['errors']} 次，详见服务日志")
+    print("预热条目服务的线上请求:")
+    for cache, item in data['served'].items():
+        print(f"  {cache}: 预热条目 {item['warmed_entries']}，命中 {item['served']}/{item['lookups']} 次查询"
+              f"（{item['share']:.1%}）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='触发服务预热热门城市的缓存，或查看预热效果')
+    parser.add_argument('--server', default='http://127.0.0.1:5000', help='服务地址')
+    parser.add_argument('--cities', help='逗号分隔的城市，默认使用服务的PREWARM_CITIES')
+    parser.add_argument('--combos', help='兴趣和饮食偏好组合，如 "历史:无;美食:无"')
+    parser.add_argument('--budget', type=int, help='本轮最多发出的上游请求数')
+    parser.add_argument('--report', action='store_true', help='只查看预热效果，不触发预热')
+    parser.add_argument('--no-wait', action='store_true', help='触发后不等待预热完成')
+    parser.add_argument('--token', default=os.getenv('ADMIN_TOKEN'), help='服务配置的ADMIN_TOKEN')
+    args = parser.parse_args()
+
+    import requests
+    url = args.server.rstrip('/') + '/prewarm'
+    headers = {'X-Admin-Token': args.token} if args.token else {}
+
+    if not args.report:
+        body = {key: value for key, value in
+                (('cities', args.cities), ('combos', args.combos), ('budget', args.budget)) if value is not None}
+        response = requests.post(url, json=body, headers=headers)
+        if response.status_code == 409:
+            print("已有一轮预热在进行中")
+        elif response.status_code != 202:
+            print(f"触发预热失败: HTTP {response.status_code} {response.text}")
+            return 1
+        else:
+            print("已开始预热")
+
+    while True:
+        response = requests.get(url, headers=headers)
+        if response.status_code != 200:
+            print(f"查询预热状态失败: HTTP {response.status_code} {response.text}")
+            return 1
+        data = response.json()
+        if args.report or args.no_wait or not data['running']:
+            break
+        time.sleep(2)
+    print_status(data)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
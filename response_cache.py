@@ -0,0 +1,256 @@
+"""
+完整响应缓存
+
+把 /plan_trip 的请求体规范化为缓存键，缓存序列化后的响应字节和对应的ETag，
+命中时不再调用任何上游接口，也不再重复序列化较大的路线数据。
+客户端带上 If-None-Match 重新验证时，未变化的结果直接返回304。
+
+存储后端可替换：
+- memory: 进程内LRU，默认
+- redis: 兼容Redis协议的本地存储，多个工作进程共享，需要安装redis包
+"""
+import hashlib
+import json
+import logging
+import threading
+
+from cache import TTLCache
+from config import Config
+from itinerary_cache import normalize_request
+import metrics
+
+logger = logging.getLogger(__name__)
+
+JSON_MIMETYPE = 'application/json'
+
+
+class MemoryBackend:
+    """进程内LRU存储"""
+
+    def __init__(self, max_entries, ttl):
+        self.entries = TTLCache(max_entries, ttl)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value, ttl):
+        self.entries.set(key, value, ttl)
+
+
+class RedisBackend:
+    """兼容Redis协议的存储，条目由Redis按TTL过期"""
+
+    def __init__(self, url):
+        """
+        参数:
+            url (str): 连接地址，如 redis://127.0.0.1:6379/0
+        """
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("使用redis响应缓存需要先安装redis包: pip install redis") from e
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        try:
+            return self.client.get(key)
+        except Exception as e:
+            # 缓存不可用时按未命中处理，不影响正常请求
+            logger.warning("读取响应缓存失败: %s", e)
+            return None
+
+    def set(self, key, value, ttl):
+        try:
+            self.client.set(key, value, ex=max(1, int(ttl)))
+        except Exception as e:
+            logger.warning("写入响应缓存失败: %s", e)
+
+
+def make_key(data, endpoint='plan'):
+    """
+    把请求体规范化为缓存键
+
+    参数:
+        data (dict): 请求JSON，使用location、interests、dietary_preferences和days
+        endpoint (str): plan为 /plan_trip 等按ITINERARY_FORMAT生成行程的接口，
+            stream为总是生成单日Markdown行程的 /plan_trip_stream，两者的结果格式不同，分开缓存
+
+    返回:
+        str: 缓存键
+    """
+    data = data or {}
+    # 流式接口忽略days，总是规划一天
+    days = 1 if endpoint == 'stream' else data.get('days', 1)
+    normalized = normalize_request(data.get('location'), data.get('interests'), data.get('dietary_preferences'), days)
+    itinerary_format = 'markdown' if endpoint == 'stream' else Config.ITINERARY_FORMAT
+    payload = json.dumps([Config.DEEPSEEK_MODEL, itinerary_format, Config.ROUTE_PAYLOAD, normalized], ensure_ascii=False)
+    return f'{endpoint}:' + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def make_etag(body):
+    """根据响应字节计算ETag（不含引号）"""
+    return hashlib.sha1(body).hexdigest()
+
+
+def etag_matches(if_none_match, etag):
+    """
+    判断If-None-Match请求头是否包含etag
+
+    参数:
+        if_none_match (str): 请求头的值，可以包含多个、带W/前缀或为*
+        etag (str): 不含引号的ETag
+    """
+    if not if_none_match or not etag:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag.strip('"') == etag:
+            return True
+    return False
+
+
+def serialize(result):
+    """把规划结果序列化为响应字节"""
+    return json.dumps(result, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def weather_failed(weather_info):
+    """天气结果是否为失败：没有结果，或(天气信息, 错误信息)中没有信息或带有错误"""
+    return not weather_info or not weather_info[0] or bool(weather_info[1])
+
+
+def is_cacheable(result):
+    """只缓存完整的结果：生成了行程、天气查询成功、没有阶段超时，路线没有出错也不是本地估算的"""
+    routes = [result.get('route')] + [day.get('route') for day in result.get('days') or ()]
+    failed = any(isinstance(route, dict) and (route.get('degraded') or route.get('error')) for route in routes)
+    return bool(result.get('itinerary')) and not result.get('timeouts') and not failed \
+        and not weather_failed(result.get('weather'))
+
+
+def result_from_events(events):
+    """
+    把流式接口产生的事件组合为与 /plan_trip 相同格式的结果
+
+    参数:
+        events (list): (事件名, 数据)元组
+
+    返回:
+        dict: 规划结果，事件不完整时返回None
+    """
+    result = {}
+    for event, payload in events:
+        if event in ('weather', 'route'):
+            result[event] = payload[event]
+        elif event == 'done':
+            result.update(payload)
+    if 'done' not in (event for event, _ in events):
+        return None
+    result.pop('locations', None)
+    return result
+
+
+class ResponseCache:
+    """序列化响应的缓存"""
+
+    def __init__(self, backend, ttl):
+        """
+        参数:
+            backend: 存储后端，需要提供get(key)和set(key, value, ttl)
+            ttl (float): 响应的有效期（秒）
+        """
+        self.backend = backend
+        self.ttl = ttl
+
+    def get(self, key):
+        """
+        查询缓存
+
+        返回:
+            tuple: (响应字节, ETag)，未命中时返回None
+        """
+        value = self.backend.get(key)
+        metrics.CACHE_REQUESTS.inc(cache='response', result='hit' if value is not None else 'miss')
+        if value is None:
+            return None
+        # 值的格式为 "ETag\n响应字节"，一次读取同时得到两者
+        etag, _, body = value.partition(b'\n')
+        return body, etag.decode()
+
+    def set(self, key, body):
+        """
+        写入序列化后的响应
+
+        返回:
+            str: 响应的ETag
+        """
+        etag = make_etag(body)
+        self.backend.set(key, etag.encode() + b'\n' + body, self.ttl)
+        return etag
+
+    def store(self, key, result):
+        """
+        序列化规划结果，完整的结果同时写入缓存
+
+        返回:
+            tuple: (响应字节, ETag)
+        """
+        body = serialize(result)
+        if is_cacheable(result):
+            return body, self.set(key, body)
+        return body, make_etag(body)
+
+
+def lookup(key):
+    """查询共享的响应缓存，未启用时返回None"""
+    cache = get_response_cache()
+    return cache.get(key) if cache is not None else None
+
+
+def respond(key, result):
+    """
+    序列化规划结果，启用缓存时写入完整的结果
+
+    返回:
+        tuple: (响应字节, ETag)
+    """
+    cache = get_response_cache()
+    if cache is None:
+        body = serialize(result)
+        return body, make_etag(body)
+    return cache.store(key, result)
+
+
+def store_events(key, events):
+    """
+    把流式接口的完整结果写入缓存，key应由make_key(data, 'stream')生成，与 /plan_trip 的结果分开；
+    客户端之后带上返回的ETag请求流式接口时，结果未变化则返回304
+
+    返回:
+        str: 结果的ETag，结果不完整时返回None
+    """
+    result = result_from_events(events)
+    if result is None or not is_cacheable(result):
+        return None
+    return respond(key, result)[1]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """获取进程内共享的响应缓存，RESPONSE_CACHE_BACKEND为none时返回None"""
+    global _cache
+    if _cache is None and Config.RESPONSE_CACHE_BACKEND != 'none':
+        with _cache_lock:
+            if _cache is None:
+                if Config.RESPONSE_CACHE_BACKEND == 'redis':
+                    backend = RedisBackend(Config.RESPONSE_CACHE_URL)
+                else:
+                    backend = MemoryBackend(Config.RESPONSE_CACHE_MAX_ENTRIES, Config.RESPONSE_CACHE_TTL)
+                _cache = ResponseCache(backend, Config.RESPONSE_CACHE_TTL)
+    return _cache
@@ -0,0 +1,263 @@
+"""
+分段驾车路线缓存
+
+整条路线按相邻两个地点拆分为路段，每段以量化后的起终点坐标和路线策略为键缓存在SQLite中，
+地点集合或顺序变化时只需请求没有缓存的路段，各段并发请求后在本地拼接为多点路线。
+坐标保留ROUTE_LEG_PRECISION位小数（4位约10米），附近的坐标共用同一段缓存。
+缓存按最近访问时间淘汰，同一台机器上的多个工作进程共用同一个数据库文件。
+
+拼接后的数据与高德驾车路线规划的响应结构相同，每个路段对应一个步骤。
+"""
+import threading
+import time
+
+from config import Config
+import metrics
+from route_payload import parse_polyline, simplify, zoom_tolerance
+from storage import SQLiteStore
+import upstream
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS legs (
+    origin TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    strategy TEXT NOT NULL,
+    distance INTEGER NOT NULL,
+    duration INTEGER NOT NULL,
+    polyline TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (origin, destination, strategy)
+);
+CREATE INDEX IF NOT EXISTS idx_legs_last_access ON legs (last_access);
+"""
+
+# 请求缺失路段的线程池，与规划线程池分开，避免路线任务在规划线程池中等待自己提交的请求
+executor = upstream.ContextExecutor(max_workers=Config.ROUTE_LEG_CONCURRENCY, thread_name_prefix='route-leg')
+
+
+def enabled():
+    """
+    是否按路段请求并缓存路线
+
+    路段只保存距离、时间和简化后的坐标，拼接的路线每段对应一个步骤；ROUTE_PAYLOAD为full时
+    需要高德的完整响应，不使用路段缓存
+    """
+    return Config.ROUTE_LEG_CACHE and Config.ROUTE_PAYLOAD != 'full'
+
+
+def quantize(coordinate, precision=None):
+    """
+    把"经度,纬度"坐标四舍五入到固定的小数位数
+
+    参数:
+        coordinate (str): 高德格式的坐标
+        precision (int): 保留的小数位数，默认为ROUTE_LEG_PRECISION
+
+    返回:
+        str: 量化后的坐标
+    """
+    precision = Config.ROUTE_LEG_PRECISION if precision is None else precision
+    lng, _, lat = coordinate.partition(',')
+    return f"{float(lng):.{precision}f},{float(lat):.{precision}f}"
+
+
+def leg_pairs(points):
+    """按途经顺序把坐标拆分为量化后的(起点, 终点)路段"""
+    points = [quantize(point) for point in points]
+    return list(zip(points, points[1:]))
+
+
+def leg_params(amap_key, origin, destination):
+    """单个路段的驾车路线规划请求参数，只需要距离、时间和坐标，使用base返回"""
+    return {
+        'key': amap_key,
+        'origin': origin,
+        'destination': destination,
+        'strategy': Config.ROUTE_STRATEGY,
+        'extensions': 'base'
+    }
+
+
+def parse_leg(route_data):
+    """
+    从单个路段的高德响应中取出距离、时间和坐标
+
+    返回:
+        dict: {'distance', 'duration', 'polyline'}，请求失败时返回None
+    """
+    if route_data.get('status') != '1':
+        return None
+    paths = (route_data.get('route') or {}).get('paths') or []
+    if not paths:
+        return None
+    path = paths[0]
+    points = []
+    for step in path.get('steps') or ():
+        for point in parse_polyline(step.get('polyline')):
+            if not points or points[-1] != point:
+                points.append(point)
+    # 拼接后的坐标总会按ROUTE_POLYLINE_ZOOM简化，缓存时先简化以减小条目
+    if Config.ROUTE_POLYLINE_ZOOM:
+        points = simplify(points, zoom_tolerance(Config.ROUTE_POLYLINE_ZOOM))
+    return {
+        'distance': int(float(path.get('distance') or 0)),
+        'duration': int(float(path.get('duration') or 0)),
+        'polyline': ';'.join(f"{lng:.6f},{lat:.6f}" for lng, lat in points)
+    }
+
+
+def empty_leg(origin):
+    """起终点量化后相同的路段不需要请求"""
+    return {'distance': 0, 'duration': 0, 'polyline': origin}
+
+
+def assemble(points, pairs, legs):
+    """
+    把各路段拼接为与高德驾车路线规划响应结构相同的多点路线
+
+    参数:
+        points (list): 按途经顺序排列的原始坐标
+        pairs (list): leg_pairs的结果
+        legs (dict): 路段到缓存条目的映射，必须包含所有路段
+
+    返回:
+        dict: 路线数据，每个路段对应一个步骤
+    """
+    steps = [{
+        'instruction': f"第{i + 1}段",
+        'distance': str(legs[pair]['distance']),
+        'duration': str(legs[pair]['duration']),
+        'polyline': legs[pair]['polyline']
+    } for i, pair in enumerate(pairs)]
+    return {
+        'status': '1',
+        'info': 'OK',
+        'route': {
+            'origin': points[0],
+            'destination': points[-1],
+            'paths': [{
+                'distance': str(sum(legs[pair]['distance'] for pair in pairs)),
+                'duration': str(sum(legs[pair]['duration'] for pair in pairs)),
+                'strategy': Config.ROUTE_STRATEGY,
+                'steps': steps
+            }]
+        }
+    }
+
+
+class LegCache:
+    """驾车路段的持久化缓存"""
+
+    def __init__(self, path, ttl, max_entries):
+        """
+        参数:
+            path (str): SQLite数据库路径
+            ttl (float): 路段的有效期（秒）
+            max_entries (int): 最多保留的路段数，超出后按最近访问时间淘汰
+        """
+        self.store = SQLiteStore(path, _SCHEMA)
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def get_many(self, pairs, strategy):
+        """
+        批量查询路段
+
+        参数:
+            pairs (list): (起点, 终点)列表
+            strategy (str): 路线策略
+
+        返回:
+            dict: 命中的路段到{'distance', 'duration', 'polyline'}的映射
+        """
+        pairs = [pair for pair in dict.fromkeys(pairs) if pair[0] != pair[1]]
+        if not pairs:
+            return {}
+        now = time.time()
+        condition = ' OR '.join(['(origin = ? AND destination = ?)'] * len(pairs))
+        rows = self.store.execute(
+            f"SELECT origin, destination, distance, duration, polyline FROM legs "
+            f"WHERE strategy = ? AND expires_at > ? AND ({condition})",
+            (strategy, now, *(value for pair in pairs for value in pair))
+        ).fetchall()
+        if rows:
+            # 更新访问时间，供LRU淘汰使用
+            self.store.executemany(
+                "UPDATE legs SET last_access = ? WHERE origin = ? AND destination = ? AND strategy = ?",
+                [(now, origin, destination, strategy) for origin, destination, *_ in rows]
+            )
+        metrics.CACHE_REQUESTS.inc(len(rows), cache='route_leg', result='hit')
+        metrics.CACHE_REQUESTS.inc(len(pairs) - len(rows), cache='route_leg', result='miss')
+        return {
+            (origin, destination): {'distance': distance, 'duration': duration, 'polyline': polyline}
+            for origin, destination, distance, duration, polyline in rows
+        }
+
+    def put_many(self, legs, strategy):
+        """
+        写入路段
+
+        参数:
+            legs (dict): 路段到{'distance', 'duration', 'polyline'}的映射
+            strategy (str): 路线策略
+        """
+        if not legs:
+            return
+        now = time.time()
+        self.store.executemany(
+            "INSERT OR REPLACE INTO legs (origin, destination, strategy, distance, duration, polyline, "
+            "expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (origin, destination, strategy, leg['distance'], leg['duration'], leg['polyline'], now + self.ttl, now)
+                for (origin, destination), leg in legs.items()
+            ]
+        )
+        self.evict()
+
+    def evict(self):
+        """删除过期条目，并在超出容量时淘汰最久未访问的条目"""
+        self.store.execute("DELETE FROM legs WHERE expires_at <= ?", (time.time(),))
+        self.store.execute(
+            "DELETE FROM legs WHERE rowid IN ("
+            "SELECT rowid FROM legs ORDER BY last_access "
+            "LIMIT max(0, (SELECT COUNT(*) FROM legs) - ?))",
+            (self.max_entries,)
+        )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_leg_cache():
+    """获取进程内共享的路段缓存，首次调用时创建"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LegCache(
+                    Config.ROUTE_LEG_CACHE_PATH,
+                    ttl=Config.ROUTE_LEG_CACHE_TTL,
+                    max_entries=Config.ROUTE_LEG_CACHE_MAX_ENTRIES
+                )
+    return _cache
+
+
+def cached_legs(points):
+    """
+    查询一条路线的所有路段
+
+    参数:
+        points (list): 按途经顺序排列的坐标
+
+    返回:
+        tuple: (路段列表, 已有的路段, 需要请求的路段)
+    """
+    pairs = leg_pairs(points)
+    legs = get_leg_cache().get_many(pairs, Config.ROUTE_STRATEGY)
+    for pair in pairs:
+        if pair[0] == pair[1]:
+            legs[pair] = empty_leg(pair[0])
+    missing = [pair for pair in dict.fromkeys(pairs) if pair not in legs]
+    return pairs, legs, missing
@@ -0,0 +1,200 @@
+"""
+路线顺序优化模块
+
+在调用高德驾车路线规划之前，根据各地点的坐标在本地计算两两之间的球面距离，
+求出总距离尽量短的游览顺序。行程中的时段结构（上午、午餐、下午、晚餐等）
+作为先后约束：只在同一时段内调整顺序，时段之间的先后不变。
+
+- 总地点数不超过EXACT_LIMIT时使用按时段分组的动态规划求精确解
+- 地点更多时使用最近邻构造加2-opt局部优化
+"""
+import math
+from itertools import combinations
+
+# 使用精确动态规划的最大地点数
+EXACT_LIMIT = 10
+
+EARTH_RADIUS = 6371000  # 地球半径（米）
+
+
+def parse_coordinate(coordinate):
+    """把"经度,纬度"字符串解析为(经度, 纬度)浮点数元组"""
+    lng, lat = coordinate.split(',')
+    return float(lng), float(lat)
+
+
+def haversine(a, b):
+    """
+    计算两个坐标之间的球面距离
+
+    参数:
+        a (tuple): (经度, 纬度)
+        b (tuple): (经度, 纬度)
+
+    返回:
+        float: 距离（米）
+    """
+    lng1, lat1 = map(math.radians, a)
+    lng2, lat2 = map(math.radians, b)
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(h))
+
+
+def distance_matrix(coordinates):
+    """
+    计算两两之间的距离矩阵
+
+    参数:
+        coordinates (list): "经度,纬度"字符串列表
+
+    返回:
+        list: n×n的距离矩阵（米）
+    """
+    points = [parse_coordinate(c) for c in coordinates]
+    n = len(points)
+    matrix = [[0.0] * n for _ in range(n)]
+    for i, j in combinations(range(n), 2):
+        matrix[i][j] = matrix[j][i] = haversine(points[i], points[j])
+    return matrix
+
+
+def path_length(matrix, order):
+    """计算按order顺序依次访问的总距离"""
+    return sum(matrix[a][b] for a, b in zip(order, order[1:]))
+
+
+def _held_karp(matrix, nodes, start):
+    """
+    在一组地点内求从start出发、遍历全部地点的最短路径
+
+    参数:
+        matrix (list): 距离矩阵
+        nodes (list): 组内地点下标
+        start (int): 出发点下标，None表示可以从组内任意地点出发
+
+    返回:
+        dict: 结束地点 -> (总距离, 组内访问顺序)
+    """
+    k = len(nodes)
+    # best[(子集掩码, 最后一个地点的组内下标)] = (距离, 前一个地点的组内下标)
+    best = {}
+    for i, node in enumerate(nodes):
+        best[(1 << i, i)] = (matrix[start][node] if start is not None else 0.0, None)
+
+    for mask in range(1, 1 << k):
+        for last in range(k):
+            entry = best.get((mask, last))
+            if entry is None:
+                continue
+            for nxt in range(k):
+                if mask & (1 << nxt):
+                    continue
+                key = (mask | (1 << nxt), nxt)
+                cost = entry[0] + matrix[nodes[last]][nodes[nxt]]
+                if key not in best or cost < best[key][0]:
+                    best[key] = (cost, last)
+
+    full = (1 << k) - 1
+    results = {}
+    for last in range(k):
+        cost, _ = best[(full, last)]
+        # 回溯访问顺序
+        order, mask, cur = [], full, last
+        while cur is not None:
+            order.append(nodes[cur])
+            prev = best[(mask, cur)][1]
+            mask &= ~(1 << cur)
+            cur = prev
+        results[nodes[last]] = (cost, order[::-1])
+    return results
+
+
+def _solve_exact(matrix, groups):
+    """按时段分组做动态规划，得到满足时段先后约束的全局最短路径"""
+    # 已完成的时段中，以各地点结束时的 (总距离, 访问顺序)
+    best = {None: (0.0, [])}
+    for group in groups:
+        new_best = {}
+        for prev, (prev_cost, prev_order) in best.items():
+            for end, (cost, order) in _held_karp(matrix, group, prev).items():
+                total = prev_cost + cost
+                if end not in new_best or total < new_best[end][0]:
+                    new_best[end] = (total, prev_order + order)
+        best = new_best
+    return min(best.values(), key=lambda item: item[0])[1]
+
+
+def _nearest_neighbour(matrix, nodes, start):
+    """从start出发按最近邻依次访问组内地点"""
+    remaining = list(nodes)
+    order = []
+    current = start
+    if current is None:
+        current = remaining.pop(0)
+        order.append(current)
+    while remaining:
+        nxt = min(remaining, key=lambda node: matrix[current][node])
+        remaining.remove(nxt)
+        order.append(nxt)
+        current = nxt
+    return order
+
+
+def _two_opt(matrix, order, segments):
+    """
+    2-opt局部优化：反转某一段路径能缩短总距离时就反转，
+    反转只发生在同一时段内部，保证时段先后不变
+
+    参数:
+        matrix (list): 距离矩阵
+        order (list): 初始访问顺序
+        segments (list): 每个时段在order中的(起始位置, 结束位置)，左闭右开
+    """
+    order = list(order)
+    improved = True
+    while improved:
+        improved = False
+        for seg_start, seg_end in segments:
+            for i in range(seg_start, seg_end - 1):
+                for j in range(i + 1, seg_end):
+                    before = matrix[order[i - 1]][order[i]] if i > 0 else 0.0
+                    after = matrix[order[j]][order[j + 1]] if j + 1 < len(order) else 0.0
+                    new_before = matrix[order[i - 1]][order[j]] if i > 0 else 0.0
+                    new_after = matrix[order[i]][order[j + 1]] if j + 1 < len(order) else 0.0
+                    if new_before + new_after < before + after - 1e-6:
+                        order[i:j + 1] = reversed(order[i:j + 1])
+                        improved = True
+    return order
+
+
+def _solve_heuristic(matrix, groups):
+    """最近邻构造初始路径，再在各时段内做2-opt优化"""
+    order = []
+    segments = []
+    for group in groups:
+        start = len(order)
+        order += _nearest_neighbour(matrix, group, order[-1] if order else None)
+        segments.append((start, len(order)))
+    return _two_opt(matrix, order, segments)
+
+
+def optimize_order(coordinates, groups=None):
+    """
+    求总距离尽量短的访问顺序
+
+    参数:
+        coordinates (list): "经度,纬度"字符串列表
+        groups (list): 按时段先后排列的地点下标列表，每个时段内的顺序可以调整；
+                       None表示所有地点属于同一个时段
+
+    返回:
+        list: 优化后的地点下标顺序
+    """
+    n = len(coordinates)
+    if n < 3:
+        return list(range(n))
+    groups = [list(group) for group in (groups or [range(n)]) if group]
+    matrix = distance_matrix(coordinates)
+    if n <= EXACT_LIMIT:
+        return _solve_exact(matrix, groups)
+    return _solve_heuristic(matrix, groups)
@@ -0,0 +1,225 @@
+"""
+路线数据精简模块
+
+高德驾车路线规划（extensions=all）的响应中每个步骤都带有完整的polyline、tmcs和cities，
+一次规划的JSON可达数百KB，而页面只用到总距离、总时间和每个步骤的距离与时间。
+这里把响应投影为页面需要的字段，并把整条路线的坐标合并、按缩放级别用Douglas-Peucker算法简化后，
+编码为Google Encoded Polyline字符串。
+
+精简后的格式:
+    {
+        "status": "1",
+        "locations": [...],
+        "optimization": {...},  # 可选
+        "route": {
+            "origin": "经度,纬度",
+            "destination": "经度,纬度",
+            "paths": [{
+                "distance": 19100,
+                "duration": 2300,
+                "polyline": "编码后的坐标（纬度在前，精度1e-5）",
+                "steps": [{"start_location": "", "end_location": "", "distance": 0, "duration": 0}]
+            }]
+        }
+    }
+"""
+
+# 每个缩放级别下一个像素对应的经纬度跨度（256像素的瓦片覆盖360度）
+_DEGREES_PER_PIXEL = 360 / 256
+
+
+def parse_polyline(text):
+    """
+    解析高德的坐标串
+
+    参数:
+        text (str): "经度,纬度;经度,纬度"格式的坐标串
+
+    返回:
+        list: (经度, 纬度)元组列表
+    """
+    points = []
+    for pair in (text or '').split(';'):
+        lng, _, lat = pair.partition(',')
+        if lat:
+            points.append((float(lng), float(lat)))
+    return points
+
+
+def path_points(path):
+    """把一条路线所有步骤的坐标按顺序合并，去掉步骤衔接处重复的点"""
+    points = []
+    for step in path.get('steps') or ():
+        for point in parse_polyline(step.get('polyline')):
+            if not points or points[-1] != point:
+                points.append(point)
+    return points
+
+
+def zoom_tolerance(zoom):
+    """地图缩放级别下一个像素对应的经纬度跨度，用作简化的容差"""
+    return _DEGREES_PER_PIXEL / (2 ** zoom)
+
+
+def simplify(points, tolerance):
+    """
+    Douglas-Peucker折线简化
+
+    参数:
+        points (list): (经度, 纬度)元组列表
+        tolerance (float): 允许偏离原折线的最大距离（度）
+
+    返回:
+        list: 保留下来的点，首尾两点总是保留
+    """
+    if len(points) < 3 or tolerance <= 0:
+        return list(points)
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    limit = tolerance * tolerance
+    stack = [(0, len(points) - 1)]
+    # 用栈代替递归，长路线不会超出递归深度
+    while stack:
+        first, last = stack.pop()
+        x1, y1 = points[first]
+        dx, dy = points[last][0] - x1, points[last][1] - y1
+        length = dx * dx + dy * dy
+        farthest, index = -1.0, first
+        for i in range(first + 1, last):
+            x, y = points[i]
+            if length:
+                t = max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length))
+                ex, ey = x - x1 - t * dx, y - y1 - t * dy
+            else:
+                ex, ey = x - x1, y - y1
+            distance = ex * ex + ey * ey
+            if distance > farthest:
+                farthest, index = distance, i
+        if farthest > limit:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def _encode_value(value, out):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode_polyline(points, precision=5):
+    """
+    按Google Encoded Polyline算法编码坐标，相邻点只记录差值
+
+    参数:
+        points (list): (经度, 纬度)元组列表
+        precision (int): 保留的小数位数
+
+    返回:
+        str: 编码后的字符串，坐标按(纬度, 经度)的顺序编码以兼容常见的解码库
+    """
+    factor = 10 ** precision
+    out = []
+    last_lat = last_lng = 0
+    for lng, lat in points:
+        lat, lng = round(lat * factor), round(lng * factor)
+        _encode_value(lat - last_lat, out)
+        _encode_value(lng - last_lng, out)
+        last_lat, last_lng = lat, lng
+    return ''.join(out)
+
+
+def decode_polyline(text, precision=5):
+    """解码encode_polyline的结果，返回(经度, 纬度)元组列表"""
+    factor = 10 ** precision
+    points = []
+    index = lat = lng = 0
+    while index < len(text):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(text[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lng / factor, lat / factor))
+    return points
+
+
+def _number(value):
+    """高德返回的数值是字符串，转换为整数，无法转换时返回0"""
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def slim_path(path, locations, tolerance):
+    """
+    投影一条路线
+
+    参数:
+        path (dict): 高德响应中的一条路线
+        locations (list): 按途经顺序排列的地点名称列表
+        tolerance (float): 简化容差，0表示不简化
+
+    返回:
+        dict: 精简后的路线
+    """
+    steps = []
+    for i, step in enumerate(path.get('steps') or ()):
+        # 与原来的标注方式一致：第i步标注为第i个地点到下一个地点
+        start = min(i, len(locations) - 2)
+        steps.append({
+            'start_location': locations[start],
+            'end_location': locations[start + 1],
+            'distance': _number(step.get('distance')),
+            'duration': _number(step.get('duration'))
+        })
+    return {
+        'distance': _number(path.get('distance')),
+        'duration': _number(path.get('duration')),
+        'polyline': encode_polyline(simplify(path_points(path), tolerance)),
+        'steps': steps
+    }
+
+
+def slim_route(route_data, locations, optimization=None, zoom=None):
+    """
+    把高德驾车路线规划的响应精简为页面使用的字段
+
+    参数:
+        route_data (dict): 高德驾车路线规划的响应
+        locations (list): 按途经顺序排列的地点名称列表
+        optimization (dict): 顺序优化信息
+        zoom (int): 按该地图缩放级别简化路线坐标，None或0表示保留全部坐标
+
+    返回:
+        dict: 精简后的路线数据；请求失败时原样返回高德的响应
+    """
+    if route_data.get('status') != '1':
+        return route_data
+    route = route_data.get('route') or {}
+    tolerance = zoom_tolerance(zoom) if zoom else 0
+    slim = {
+        'status': '1',
+        'locations': locations,
+        'route': {
+            'origin': route.get('origin'),
+            'destination': route.get('destination'),
+            'paths': [slim_path(path, locations, tolerance) for path in route.get('paths') or ()]
+        }
+    }
+    if optimization:
+        slim['optimization'] = optimization
+    return slim
@@ -0,0 +1,205 @@
+"""
+启动与预加载
+
+服务进程启动时只做必要的工作:
+- .env只在导入config时加载一次，其他模块都从Config读取
+- DeepSeek客户端、异步HTTP客户端在首次使用时创建，导入最慢的openai也推迟到那时才导入
+
+多进程部署（gunicorn.conf.py）时先在主进程中导入应用并执行preload()，之后fork出的工作进程
+以写时复制共享这些内存页，不必各自重复:
+- 导入推迟的依赖
+- 用一段示例行程走一遍行程解析器，预编译的正则和解析路径都在主进程中完成初始化
+- 映射离线POI索引，并把索引和本地缓存数据库文件读入页缓存
+- gc.freeze()把已有对象移出垃圾回收，避免工作进程的回收扫描写入这些页
+
+数据库连接和后台线程不能跨fork使用，预加载不打开数据库连接，也不发出网络请求；
+应用通过in_worker()注册的规划器和后台线程（预热调度、任务工作线程）推迟到after_fork()在每个工作进程中创建和启动。
+
+查看导入和启动耗时:
+    python startup.py --profile-startup
+    python startup.py --profile-startup --app asgi --preload
+"""
+import argparse
+import gc
+import importlib
+import os
+import sys
+import time
+
+# 启动时推迟导入、预加载时提前导入的依赖
+DEFERRED_MODULES = ('openai',)
+# 耗时报告中列出是否已导入的较重依赖
+HEAVY_MODULES = ('openai', 'httpx', 'requests', 'urllib3', 'flask', 'starlette', 'pydantic')
+
+# 预加载时走一遍解析器使用的示例行程，覆盖标题、时段、详情和多日行程的写法
+_SAMPLE_ITINERARY = """### 第1天：城市漫步
+#### 上午
+【故宫博物院】
+- 游览时间：09:00-11:30
+- 简介：明清两代的皇家宫殿
+#### 午餐
+【四季民福烤鸭店（故宫店）】
+- 用餐时间：12:00-13:00
+- 推荐菜品：烤鸭、宫保虾球
+**下午**：
+【景山公园】
+- 交通建议：步行10分钟
+## Day 2
+晚间 【什刹海】
+"""
+
+# 在主进程中预加载、尚未fork时为True，此时in_worker()注册的函数推迟执行
+preloading = False
+_worker_hooks = []
+
+
+def in_worker(func, *args):
+    """
+    在工作进程中执行func
+
+    预加载应用时主进程中启动的线程不会进入fork出的工作进程，推迟到after_fork()执行；
+    其他情况下立即执行。
+
+    参数:
+        func (callable): 启动后台线程等只能在工作进程中执行的函数
+        args: 传给func的参数
+    """
+    if preloading:
+        _worker_hooks.append((func, args))
+    else:
+        func(*args)
+
+
+def after_fork():
+    """在fork出的工作进程中执行in_worker()推迟的函数"""
+    global preloading
+    preloading = False
+    hooks = list(_worker_hooks)
+    _worker_hooks.clear()
+    for func, args in hooks:
+        func(*args)
+
+
+def _prefetch_file(path):
+    """把文件读入页缓存，文件不存在时忽略"""
+    if not path or not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        else:
+            while f.read(1 << 20):
+                pass
+
+
+def _import_deferred():
+    for name in DEFERRED_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+
+def _warm_parser():
+    from itinerary_parser import parse_itinerary
+    parse_itinerary(_SAMPLE_ITINERARY)
+
+
+def _load_indexes():
+    import poi_index
+    index = poi_index.get_index()
+    if index is not None:
+        index.prefetch()
+
+
+def _warm_cache_files():
+    from config import Config
+    for path in (Config.GEOCODE_CACHE_PATH, Config.ROUTE_LEG_CACHE_PATH):
+        _prefetch_file(path)
+
+
+_PRELOAD_STEPS = (
+    ('imports', _import_deferred),
+    ('parser', _warm_parser),
+    ('indexes', _load_indexes),
+    ('cache_files', _warm_cache_files),
+)
+
+
+def preload():
+    """
+    fork工作进程之前在主进程中执行的预加载，应在导入应用之后调用
+
+    返回:
+        dict: 各步骤的耗时（秒）
+    """
+    timings = {}
+    for name, step in _PRELOAD_STEPS:
+        started = time.perf_counter()
+        step()
+        timings[name] = round(time.perf_counter() - started, 4)
+    started = time.perf_counter()
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+    timings['gc_freeze'] = round(time.perf_counter() - started, 4)
+    return timings
+
+
+def profile_startup(app='app', run_preload=False):
+    """
+    测量导入配置、导入应用和预加载的耗时
+
+    应用按预加载的方式导入，后台线程不会启动。
+
+    参数:
+        app (str): 应用模块，app或asgi
+        run_preload (bool): 是否同时测量preload()
+
+    返回:
+        dict: {'phases': [(阶段, 秒, 新导入的模块数)], 'total', 'heavy_modules': 已导入的较重依赖}
+    """
+    global preloading
+    preloading = True
+    phases = []
+    started = time.perf_counter()
+    for phase, module in (('config', 'config'), (app, app)):
+        before = len(sys.modules)
+        phase_started = time.perf_counter()
+        importlib.import_module(module)
+        phases.append((phase, time.perf_counter() - phase_started, len(sys.modules) - before))
+    if run_preload:
+        before = len(sys.modules)
+        phase_started = time.perf_counter()
+        timings = preload()
+        phases.append(('preload', time.perf_counter() - phase_started, len(sys.modules) - before))
+        phases += [(f"  {name}", seconds, None) for name, seconds in timings.items()]
+    return {
+        'phases': phases,
+        'total': time.perf_counter() - started,
+        'heavy_modules': [name for name in HEAVY_MODULES if name in sys.modules]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='启动耗时分析')
+    parser.add_argument('--profile-startup', action='store_true', help='输出导入和启动各阶段的耗时')
+    parser.add_argument('--app', choices=('app', 'asgi'), default='app', help='应用模块，默认为app')
+    parser.add_argument('--preload', action='store_true', help='同时测量多进程部署时的预加载')
+    args = parser.parse_args()
+    if not args.profile_startup:
+        parser.print_help()
+        return
+
+    report = profile_startup(args.app, args.preload)
+    for phase, seconds, modules in report['phases']:
+        suffix = f"  (+{modules} 个模块)" if modules is not None else ''
+        print(f"{phase:<16}{seconds * 1000:>9.1f} ms{suffix}")
+    print(f"{'total':<16}{report['total'] * 1000:>9.1f} ms")
+    print(f"已导入的较重依赖: {', '.join(report['heavy_modules']) or '无'}")
+
+
+if __name__ == '__main__':
+    # 应用导入的startup模块与作为脚本运行的__main__不是同一个模块对象
+    import startup
+    startup.main()
@@ -0,0 +1,47 @@
+"""
+本地SQLite存储工具
+
+为各类本地缓存提供按线程复用的SQLite连接。数据库使用WAL模式，
+可以被同一台机器上的多个工作进程同时读写。
+"""
+import os
+import sqlite3
+import threading
+
+
+class SQLiteStore:
+    """按线程持有连接的SQLite数据库封装"""
+
+    def __init__(self, path, schema):
+        """
+        初始化数据库
+
+        参数:
+            path (str): 数据库文件路径，目录不存在时自动创建
+            schema (str): 建表语句，应使用IF NOT EXISTS保证可重复执行
+        """
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection().executescript(schema)
+
+    def connection(self):
+        """获取当前线程的数据库连接，首次调用时创建"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def execute(self, sql, params=()):
+        """执行单条SQL语句并返回游标"""
+        return self.connection().execute(sql, params)
+
+    def executemany(self, sql, rows):
+        """批量执行SQL语句"""
+        return self.connection().executemany(sql, rows)
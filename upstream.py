@@ -0,0 +1,488 @@
+"""
+上游限流与调度
+
+高德和DeepSeek的配额按密钥和接口计算。这里为每个密钥的每个接口（geocode、direction、
+weather、config、chat）维护一个令牌桶，请求发出前先取得令牌：
+- 排队的请求按优先级取令牌。优先级随contextvars按规划传递：规划生成行程之后发出的
+  地理编码和路线请求以HIGH排队，排在新规划（包括流式规划生成过程中的地理编码）前面，
+  预热等后台任务以LOW排队；提交到ContextExecutor的任务沿用提交时的优先级
+- 配置了多个密钥时按轮询或最少负载选择密钥
+- 高德返回配额超限时暂停该密钥的令牌桶，而不是立即重试放大请求量
+- 连续失败达到阈值后熔断，冷却期内直接失败，冷却结束后放行一个探测请求
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+from config import Config
+import metrics
+
+# 优先级，数值越小越先取得令牌
+HIGH, NORMAL, LOW = 0, 1, 2
+
+# 当前上下文的优先级，未设置时为NORMAL
+_priority = contextvars.ContextVar('upstream_priority', default=None)
+# 当前上下文的请求计数器，未设置时不计数
+_counter = contextvars.ContextVar('upstream_counter', default=None)
+
+
+@contextmanager
+def prioritized(priority):
+    """在with块中发出的上游请求以priority排队，块中提交到ContextExecutor的任务同样如此"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def background():
+    """在with块中发出的上游请求以LOW优先级排队，排在线上请求之后"""
+    return prioritized(LOW)
+
+
+def request_priority(priority=None):
+    """决定请求的优先级：显式指定 > 当前上下文 > NORMAL"""
+    if priority is not None:
+        return priority
+    current = _priority.get()
+    return NORMAL if current is None else current
+
+
+class RequestCounter:
+    """统计一段上下文中实际发出的上游请求数"""
+
+    def __init__(self):
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def add(self):
+        with self._lock:
+            self.requests += 1
+
+
+@contextmanager
+def counting():
+    """
+    统计with块中发出的上游请求，块中提交到ContextExecutor的任务同样计入
+
+    返回:
+        RequestCounter: 计数器，其他上下文（如同时进行的线上请求）发出的请求不计入
+    """
+    counter = RequestCounter()
+    token = _counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _counter.reset(token)
+
+
+class ContextExecutor(ThreadPoolExecutor):
+    """提交任务时复制当前上下文的线程池，任务中发出的上游请求沿用提交者的优先级"""
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+# 高德表示超出QPS或日配额的infocode
+AMAP_QUOTA_INFOCODES = {'10003', '10004', '10014', '10015', '10019', '10020', '10021', '10044'}
+QUOTA_PAUSE = 1.0  # 配额超限后暂停该密钥令牌桶的时长（秒）
+
+UPSTREAM_QUEUE_SECONDS = metrics.registry.histogram('upstream_queue_seconds', '上游请求排队等待令牌的时间（秒）')
+UPSTREAM_THROTTLED = metrics.registry.counter('upstream_throttled_total', '因限流、配额或熔断未发出的上游请求数')
+
+
+class UpstreamUnavailable(RuntimeError):
+    """上游暂时不可用（熔断或排队超时），retry_after为建议的重试等待秒数"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """按优先级排队的令牌桶"""
+
+    def __init__(self, rate, burst=None):
+        """
+        参数:
+            rate (float): 每秒补充的令牌数
+            burst (float): 桶容量，默认为一秒的令牌数
+        """
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+        self._waiters = []  # (优先级, 序号)组成的最小堆，堆顶的请求先取令牌
+        self._seq = itertools.count()
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def pause(self, seconds):
+        """暂停发放令牌，用于上游返回配额超限时"""
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+    def _take(self, entry):
+        """
+        尝试为排队的请求取令牌，调用方需持有锁
+
+        返回:
+            float: 0表示已取得令牌；否则为建议等待的秒数，不在队首时为None
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self._waiters[0] is not entry:
+            return None
+        if self.tokens >= 1:
+            self.tokens -= 1
+            heapq.heappop(self._waiters)
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def _leave(self, entry):
+        """放弃排队（超时或已取得令牌）并唤醒其他等待者"""
+        with self._cond:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            self._cond.notify_all()
+
+    def acquire(self, priority=NORMAL, timeout=None):
+        """
+        阻塞直到取得令牌
+
+        参数:
+            priority (int): 优先级
+            timeout (float): 最长等待时间（秒），None表示一直等待
+
+        返回:
+            bool: 是否在超时前取得令牌
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        entry = (priority, next(self._seq))
+        try:
+            with self._cond:
+                heapq.heappush(self._waiters, entry)
+                while True:
+                    wait = self._take(entry)
+                    if wait == 0:
+                        return True
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+        finally:
+            self._leave(entry)
+
+    async def acquire_async(self, priority=NORMAL, timeout=None):
+        """acquire的异步版本，等待时不阻塞事件循环"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        entry = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._take(entry)
+                if wait == 0:
+                    return True
+                # 不在队首时按令牌补充的间隔轮询
+                wait = 1 / self.rate if wait is None else wait
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    wait = min(wait, remaining)
+                await asyncio.sleep(wait)
+        finally:
+            self._leave(entry)
+
+
+class CircuitBreaker:
+    """连续失败计数的熔断器"""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failures, cooldown):
+        """
+        参数:
+            failures (int): 连续失败多少次后熔断，0表示不熔断
+            cooldown (float): 熔断后多久放行一个探测请求（秒）
+        """
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self._count = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        判断请求能否发出
+
+        返回:
+            float: 0表示放行，否则为距离冷却结束的秒数
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0
+            now = time.monotonic()
+            remaining = self._opened_at + self.cooldown - now
+            if remaining <= 0:
+                # 冷却结束放行一个探测请求；探测请求未能发出时，再过一个冷却期放行下一个
+                self.state = self.HALF_OPEN
+                self._opened_at = now
+                return 0
+            return remaining
+
+    def cooling_down(self):
+        """是否处于熔断冷却期，不改变熔断器状态"""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() < self._opened_at + self.cooldown
+
+    def record(self, ok):
+        """记录请求结果"""
+        with self._lock:
+            if ok:
+                self._count = 0
+                self.state = self.CLOSED
+                return
+            self._count += 1
+            if self.state == self.HALF_OPEN or (self.failures and self._count >= self.failures):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class Lease:
+    """一次取得令牌的请求，记录使用的密钥和结果"""
+
+    __slots__ = ('key', 'endpoint', 'failed', 'throttled')
+
+    def __init__(self, key, endpoint):
+        self.key = key
+        self.endpoint = endpoint
+        self.failed = False
+        self.throttled = False
+
+    def fail(self, throttled=False):
+        """标记请求失败，throttled表示上游返回了配额超限"""
+        self.failed = True
+        self.throttled = self.throttled or throttled
+
+
+class Upstream:
+    """一个上游服务的密钥池、令牌桶和熔断器"""
+
+    def __init__(self, name, keys, limits, selection='round_robin', breaker=None, queue_timeout=None):
+        """
+        参数:
+            name (str): 上游名称，用于指标
+            keys (list): 可用的密钥
+            limits (dict): 每个密钥在各接口上的每秒请求数，未列出或为0的接口不限流
+            selection (str): 密钥选择策略，round_robin或least_loaded
+            breaker (CircuitBreaker): 熔断器，None表示不熔断
+            queue_timeout (float): 排队等待令牌的最长时间（秒）
+        """
+        self.name = name
+        self.keys = list(keys) or [None]
+        self.limits = limits
+        self.selection = selection
+        self.breaker = breaker
+        self.queue_timeout = queue_timeout
+        self.in_flight = dict.fromkeys(self.keys, 0)
+        self.requests = 0  # 已发出的请求总数
+        self._buckets = {}
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+    def bucket(self, key, endpoint):
+        """返回密钥在接口上的令牌桶，不限流时返回None"""
+        rate = self.limits.get(endpoint)
+        if not rate:
+            return None
+        with self._lock:
+            bucket = self._buckets.get((key, endpoint))
+            if bucket is None:
+                bucket = self._buckets[key, endpoint] = TokenBucket(rate)
+            return bucket
+
+    def select_key(self, endpoint):
+        """按配置的策略选择密钥"""
+        if len(self.keys) == 1:
+            return self.keys[0]
+        if self.selection == 'least_loaded':
+            def load(key):
+                bucket = self.bucket(key, endpoint)
+                if bucket is None:
+                    return (self.in_flight[key], 0)
+                return (self.in_flight[key] + bucket.queued, -bucket.tokens)
+            return min(self.keys, key=load)
+        return self.keys[next(self._next) % len(self.keys)]
+
+    def _admit(self, endpoint):
+        """熔断时抛出UpstreamUnavailable"""
+        retry_after = self.breaker.allow() if self.breaker else 0
+        if retry_after:
+            UPSTREAM_THROTTLED.inc(upstream=self.name, endpoint=endpoint, reason='circuit_open')
+            raise UpstreamUnavailable(f"{self.name}暂时不可用（熔断中）", retry_after)
+
+    def _queue_timeout(self, endpoint, bucket):
+        UPSTREAM_THROTTLED.inc(upstream=self.name, endpoint=endpoint, reason='queue_timeout')
+        raise UpstreamUnavailable(f"{self.name} {endpoint}请求排队超时", 1 / bucket.rate + (self.queue_timeout or 0))
+
+    def _start(self, key):
+        with self._lock:
+            self.in_flight[key] += 1
+            self.requests += 1
+        counter = _counter.get()
+        if counter is not None:
+            counter.add()
+
+    def _finish(self, lease, ok):
+        with self._lock:
+            self.in_flight[lease.key] -= 1
+        ok = ok and not lease.failed
+        if self.breaker:
+            self.breaker.record(ok)
+        if lease.throttled:
+            UPSTREAM_THROTTLED.inc(upstream=self.name, endpoint=lease.endpoint, reason='quota')
+            bucket = self.bucket(lease.key, lease.endpoint)
+            if bucket is not None:
+                bucket.pause(QUOTA_PAUSE)
+
+    @contextmanager
+    def slot(self, endpoint, priority=None):
+        """
+        取得令牌后发出一个请求
+
+        参数:
+            endpoint (str): 接口名
+            priority (int): 优先级，默认按当前上下文决定
+
+        返回:
+            Lease: 使用的密钥；with块中抛出异常或调用fail()时记为失败
+
+        异常:
+            UpstreamUnavailable: 熔断中或排队超时
+        """
+        self._admit(endpoint)
+        key = self.select_key(endpoint)
+        bucket = self.bucket(key, endpoint)
+        if bucket is not None:
+            started = time.monotonic()
+            priority = request_priority(priority)
+            if not bucket.acquire(priority, self.queue_timeout):
+                self._queue_timeout(endpoint, bucket)
+            UPSTREAM_QUEUE_SECONDS.observe(time.monotonic() - started, upstream=self.name, endpoint=endpoint)
+        lease = Lease(key, endpoint)
+        self._start(key)
+        ok = False
+        try:
+            yield lease
+            ok = True
+        finally:
+            self._finish(lease, ok)
+
+    @asynccontextmanager
+    async def aslot(self, endpoint, priority=None):
+        """slot的异步版本"""
+        self._admit(endpoint)
+        key = self.select_key(endpoint)
+        bucket = self.bucket(key, endpoint)
+        if bucket is not None:
+            started = time.monotonic()
+            priority = request_priority(priority)
+            if not await bucket.acquire_async(priority, self.queue_timeout):
+                self._queue_timeout(endpoint, bucket)
+            UPSTREAM_QUEUE_SECONDS.observe(time.monotonic() - started, upstream=self.name, endpoint=endpoint)
+        lease = Lease(key, endpoint)
+        self._start(key)
+        ok = False
+        try:
+            yield lease
+            ok = True
+        finally:
+            self._finish(lease, ok)
+
+    def stats(self):
+        """各密钥的并发数和排队数，密钥只显示末尾4位"""
+        with self._lock:
+            buckets = list(self._buckets.items())
+        keys = {}
+        for key in self.keys:
+            keys[mask(key)] = {'in_flight': self.in_flight[key], 'queued': {}}
+        for (key, endpoint), bucket in buckets:
+            keys[mask(key)]['queued'][endpoint] = bucket.queued
+        return {
+            'breaker': self.breaker.state if self.breaker else CircuitBreaker.CLOSED,
+            'selection': self.selection,
+            'keys': keys
+        }
+
+
+def mask(key):
+    """隐藏密钥，只保留末尾4位"""
+    return f"***{key[-4:]}" if key else '-'
+
+
+def amap_quota_exceeded(content):
+    """
+    判断高德响应是否为配额超限
+
+    参数:
+        content (bytes): 响应内容，出错的响应很短，只检查前512字节
+
+    返回:
+        bool: 是否超出QPS或日配额
+    """
+    head = content[:512]
+    if b'"status":"0"' not in head:
+        return False
+    return any(f'"infocode":"{code}"'.encode() in head for code in AMAP_QUOTA_INFOCODES)
+
+
+def _breaker():
+    return CircuitBreaker(Config.BREAKER_FAILURES, Config.BREAKER_COOLDOWN)
+
+
+amap = Upstream(
+    'amap', Config.AMAP_KEYS, Config.UPSTREAM_RATE_LIMITS, Config.UPSTREAM_KEY_SELECTION,
+    _breaker(), Config.UPSTREAM_QUEUE_TIMEOUT
+)
+deepseek = Upstream(
+    'deepseek', Config.DEEPSEEK_API_KEYS, Config.UPSTREAM_RATE_LIMITS, Config.UPSTREAM_KEY_SELECTION,
+    _breaker(), Config.UPSTREAM_QUEUE_TIMEOUT
+)
+
+
+def for_url(url):
+    """根据请求地址返回对应的上游，非高德地址返回None"""
+    return amap if url.startswith(Config.AMAP_BASE_URL) else None
+
+
+def _breaker_samples():
+    """为/metrics提供熔断状态，1表示处于该状态"""
+    samples = []
+    for upstream in (amap, deepseek):
+        state = upstream.breaker.state
+        for name in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN):
+            samples.append(({'upstream': upstream.name, 'state': name}, int(state == name)))
+    return samples
+
+
+metrics.registry.gauge('upstream_circuit_state', '上游熔断器状态', _breaker_samples)
@@ -1,216 +1,514 @@
 import requests
+import logging
 import random
-import os
-from dotenv import load_dotenv
+import threading
+import time
+from bisect import bisect_right
+from operator import itemgetter
+from string import Formatter
+import http_client
+from cache import TTLCache, SingleFlight, warm_entries
+from config import Config, AMAP_KEY
+import metrics
 
-# 加载环境变量
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-def get_weather(city):
+# 高德天气API的基础URL
+WEATHER_URL = f"{Config.AMAP_BASE_URL}/weather/weatherInfo"
+
+# 实况天气缓存：条目在WEATHER_CACHE_TTL内视为新鲜，之后的WEATHER_STALE_TTL内仍可返回并在后台刷新
+_live_cache = TTLCache(
+    max_entries=Config.WEATHER_CACHE_MAX_ENTRIES,
+    ttl=Config.WEATHER_CACHE_TTL + Config.WEATHER_STALE_TTL
+)
+# 天气预报缓存，多日行程一次获取未来几天的预报
+_forecast_cache = TTLCache(max_entries=Config.WEATHER_CACHE_MAX_ENTRIES, ttl=Config.WEATHER_CACHE_TTL)
+# 合并同一城市的并发上游请求
+_flight = SingleFlight()
+
+
+def parse_live_weather(result):
     """
-    使用高德天气API获取指定城市的当前天气信息，以猫咪友好的方式展示
-    
+    从高德天气接口的响应中取出实况天气
+
     参数:
-        city (str): 城市名称
-    
+        result (dict): 接口返回的JSON
+
     返回:
-        str: 猫咪友好的天气信息
+        dict: 实况天气数据，接口返回失败时返回None
     """
-    # 获取高德地图API密钥
-    amap_key = os.getenv('AMAP_KEY')
-    if not amap_key:
-        return None, "喵呜！天气API密钥未配置，请检查.env文件喵~"
+    if result['status'] != '1' or not result['lives']:
+        return None
+    return result['lives'][0]
 
-    # 高德天气API的基础URL
-    base_url = "https://restapi.amap.com/v3/weather/weatherInfo"
-    
-    # 猫咪表情和描述
-    cat_emojis = {
-        '晴': '😺',    # 晴天
-        '多云': '😸',  # 多云
-        '阴': '😺',    # 阴天
-        '雨': '😿',    # 雨天
-        '雪': '😹',    # 雪天
-        '雷': '🙀',    # 雷雨
-        '雾': '😺',    # 雾天
+
+def live_weather_params(amap_key, city):
+    """构建实况天气请求参数"""
+    return {
+        'key': amap_key,
+        'city': city,
+        'extensions': 'base',  # 获取实时天气
+        'output': 'JSON'
     }
+
+
+def store_live_weather(city, weather_data):
+    """写入实况天气缓存"""
+    _live_cache.set(city, (time.monotonic(), weather_data))
+
+
+def peek_live_weather(city):
+    """
+    查询实况天气缓存
+
+    参数:
+        city (str): 城市名称或adcode
+
+    返回:
+        tuple: (实况天气数据, 是否已过新鲜期)，未命中时返回None
+    """
+    entry = _live_cache.get(city)
+    if entry is None:
+        return None
+    fetched_at, weather_data = entry
+    return weather_data, time.monotonic() - fetched_at >= Config.WEATHER_CACHE_TTL
+
+
+def _load_live_weather(amap_key, city):
+    """
+    请求高德实况天气并写入缓存
+
+    参数:
+        amap_key (str): 高德地图API密钥
+        city (str): 城市名称或adcode
+
+    返回:
+        dict: 实况天气数据，接口返回失败时返回None
+    """
+    # 发送请求
+    response = http_client.get(WEATHER_URL, params=live_weather_params(amap_key, city))
+    response.raise_for_status()
     
-    # 温度相关的猫咪情绪和表情
-    temperature_moods = {
-        'freezing': {
-            'emoji': '🥶',
-            'mood': '瑟瑟发抖',
-            'reactions': [
-                '喵呜！好冷啊，我要钻被窝了！',
-                '喵呜！冻死喵了，我要开暖气！',
-                '喵呜！这么冷的天，我要穿毛衣了！',
-                '喵呜！我要去壁炉边取暖了！'
-            ]
-        },
-        'cold': {
-            'emoji': '😿',
-            'mood': '有点冷',
-            'reactions': [
-                '喵~ 有点冷，我要找个暖和的地方~',
-                '喵~ 温度有点低，我要去晒太阳了~',
-                '喵~ 好冷啊，我要去喝热牛奶了~',
-                '喵~ 这种天气最适合窝在主人怀里了~'
-            ]
-        },
-        'cool': {
-            'emoji': '😺',
-            'mood': '舒适',
-            'reactions': [
-                '喵~ 温度正好，适合打盹~',
-                '喵~ 这种天气最舒服了~',
-                '喵~ 温度真合适，我要去玩耍了~',
-                '喵~ 天气真好，我要去探险了~'
-            ]
-        },
-        'warm': {
-            'emoji': '😸',
-            'mood': '温暖',
-            'reactions': [
-                '喵~ 温度真舒服，我要去晒太阳了~',
-                '喵~ 暖暖的，我要去花园里打盹了~',
-                '喵~ 这种天气最适合在窗台上睡觉了~',
-                '喵~ 温度正好，我要去追蝴蝶了~'
-            ]
-        },
-        'hot': {
-            'emoji': '😅',
-            'mood': '有点热',
-            'reactions': [
-                '喵呜！好热啊，我要去阴凉处乘凉了！',
-                '喵呜！太热了，我要去吹空调了！',
-                '喵呜！这种天气最适合在风扇下睡觉了！',
-                '喵呜！我要去喝冰水了！'
-            ]
-        },
-        'scorching': {
-            'emoji': '🥵',
-            'mood': '热死了',
-            'reactions': [
-                '喵呜！热死喵了！我要去冰箱里避暑了！',
-                '喵呜！太热了，我要去游泳池了！',
-                '喵呜！这种天气最适合在空调房里睡觉了！',
-                '喵呜！我要去北极避暑了！'
-            ]
-        }
-    }
+    # 检查响应状态
+    weather_data = parse_live_weather(response.json())
+    if weather_data:
+        store_live_weather(city, weather_data)
+    return weather_data
+
+
+def _refresh_in_background(amap_key, city):
+    """在后台线程中刷新过期的天气缓存"""
+    if _flight.in_flight(city):
+        return
     
-    # 猫咪天气描述和性格评论
-    cat_descriptions = {
-        '晴': [
-            '喵~ 今天是个晒太阳的好日子！',
-            '喵~ 阳光正好，适合在窗台上打盹~',
-            '喵~ 太阳公公出来了，我要去晒肚皮了！',
-            '喵~ 这么好的天气，不睡个午觉太可惜了~'
-        ],
-        '多云': [
-            '喵~ 云朵遮住了太阳，但还是很舒服~',
-            '喵~ 多云天气，适合在沙发上打盹~',
-            '喵~ 云朵真漂亮，我要去追它们了~',
-            '喵~ 这种天气最适合睡觉了~'
-        ],
-        '阴': [
-            '喵~ 虽然没有太阳，但还是很舒服~',
-            '喵~ 阴天最适合在窗台上打盹了~',
-            '喵~ 这种天气最适合睡觉了~',
-            '喵~ 阴天也是好天气呢~'
-        ],
-        '雨': [
-            '喵~ 下雨了，还是待在屋里吧~',
-            '喵~ 雨滴打在窗户上的声音真好听~',
-            '喵~ 下雨天最适合窝在主人怀里了~',
-            '喵~ 雨声真催眠，我要去睡觉了~'
-        ],
-        '雪': [
-            '喵~ 下雪了！好想出去玩雪球~',
-            '喵~ 雪花真漂亮，我要去追它们了~',
-            '喵~ 雪地真软，我要去踩脚印了~',
-            '喵~ 下雪天最适合在壁炉边打盹了~'
-        ],
-        '雷': [
-            '喵呜！打雷了，好可怕！',
-            '喵呜！我要躲到床底下了！',
-            '喵呜！闪电好可怕，我要抱抱！',
-            '喵呜！这种天气最适合躲在被窝里了！'
-        ],
-        '雾': [
-            '喵~ 雾蒙蒙的，要小心走路哦~',
-            '喵~ 雾好大，我要去探险了~',
-            '喵~ 雾天最适合玩捉迷藏了~',
-            '喵~ 雾里的世界好神秘啊~'
-        ]
-    }
+    def refresh():
+        try:
+            _flight.do(city, lambda: _load_live_weather(amap_key, city))
+        except Exception as e:
+            logger.warning("后台刷新天气失败: %s, %s", city, e)
     
-    # 获取温度相关的猫咪情绪
-    def get_temperature_mood(temp):
-        if temp < 0:
-            return temperature_moods['freezing']
-        elif temp < 10:
-            return temperature_moods['cold']
-        elif temp < 20:
-            return temperature_moods['cool']
-        elif temp < 30:
-            return temperature_moods['warm']
-        elif temp < 35:
-            return temperature_moods['hot']
-        else:
-            return temperature_moods['scorching']
+    threading.Thread(target=refresh, name=f"weather-refresh-{city}", daemon=True).start()
+
+
+def get_live_weather(amap_key, city):
+    """
+    获取实况天气数据，优先使用缓存
+
+    新鲜的缓存直接返回；过期但仍在容忍期内的缓存立即返回并触发后台刷新；
+    未命中时同一城市的并发请求只会发出一次上游调用。
+
+    参数:
+        amap_key (str): 高德地图API密钥
+        city (str): 城市名称或adcode
+
+    返回:
+        dict: 实况天气数据，接口返回失败时返回None
+    """
+    city = city.strip()
+    cached = peek_live_weather(city)
+    if cached is not None:
+        weather_data, stale = cached
+        if stale:
+            _refresh_in_background(amap_key, city)
+        metrics.CACHE_REQUESTS.inc(cache='weather', result='stale' if stale else 'hit')
+        warm_entries.hit('weather', city)
+        return weather_data
     
-    try:
-        # 构建请求参数
-        params = {
-            'key': amap_key,
-            'city': city,
-            'extensions': 'base',  # 获取实时天气
-            'output': 'JSON'
-        }
-        
-        # 发送请求
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        result = response.json()
-        
-        # 检查响应状态
-        if result['status'] != '1' or not result['lives']:
-            return None, "喵呜！获取天气信息失败，请稍后再试喵~"
-        
-        # 获取天气信息
-        weather_data = result['lives'][0]
-        weather_type = weather_data['weather']
-        temperature = float(weather_data['temperature'])
-        humidity = weather_data['humidity']
-        wind_direction = weather_data['winddirection']
-        wind_power = weather_data['windpower']
-        
-        # 获取温度相关的猫咪情绪
-        temp_mood = get_temperature_mood(temperature)
-        temp_comment = random.choice(temp_mood['reactions'])
-        
-        # 获取天气描述
-        weather_emoji = cat_emojis.get(weather_type, '😺')
-        weather_comment = random.choice(cat_descriptions.get(weather_type, cat_descriptions['晴']))
-        
-        # 构建猫咪友好的天气信息
-        cat_weather = f"""
+    metrics.CACHE_REQUESTS.inc(cache='weather', result='miss')
+    return _flight.do(city, lambda: _load_live_weather(amap_key, city))
+
+
+def refresh_live_weather(amap_key, city):
+    """不经过缓存直接请求实况天气并写入缓存，供预热使用"""
+    city = city.strip()
+    return _flight.do(city, lambda: _load_live_weather(amap_key, city))
+
+
+def forecast_params(amap_key, city):
+    """构建天气预报请求参数"""
+    return {
+        'key': amap_key,
+        'city': city,
+        'extensions': 'all',  # 获取当天和未来几天的预报
+        'output': 'JSON'
+    }
+
+
+def parse_forecast(result):
+    """
+    从高德天气接口的响应中取出逐日预报
+
+    返回:
+        list: 逐日预报，从当天开始；接口返回失败时返回None
+    """
+    if result['status'] != '1' or not result.get('forecasts'):
+        return None
+    return result['forecasts'][0].get('casts') or None
+
+
+def store_forecast(city, casts):
+    """写入天气预报缓存"""
+    _forecast_cache.set(city, casts)
+
+
+def peek_forecast(city):
+    """查询天气预报缓存，未命中时返回None"""
+    return _forecast_cache.get(city)
+
+
+def _load_forecast(amap_key, city):
+    """请求高德天气预报并写入缓存"""
+    response = http_client.get(WEATHER_URL, params=forecast_params(amap_key, city))
+    response.raise_for_status()
+    casts = parse_forecast(response.json())
+    if casts:
+        store_forecast(city, casts)
+    return casts
+
+
+def get_forecast(city):
+    """
+    获取指定城市当天和未来几天的天气预报，优先使用缓存
+
+    参数:
+        city (str): 城市名称
+
+    返回:
+        list: 逐日预报，获取失败时返回None
+    """
+    if not AMAP_KEY:
+        return None
+    city = city.strip()
+    casts = peek_forecast(city)
+    metrics.CACHE_REQUESTS.inc(cache='forecast', result='hit' if casts is not None else 'miss')
+    if casts is None:
+        casts = _flight.do(('forecast', city), lambda: _load_forecast(AMAP_KEY, city))
+    return casts
+
+
+# 猫咪表情和描述
+CAT_EMOJIS = {
+    '晴': '😺',    # 晴天
+    '多云': '😸',  # 多云
+    '阴': '😺',    # 阴天
+    '雨': '😿',    # 雨天
+    '雪': '😹',    # 雪天
+    '雷': '🙀',    # 雷雨
+    '雾': '😺',    # 雾天
+}
+
+# 温度相关的猫咪情绪和表情
+TEMPERATURE_MOODS = {
+    'freezing': {
+        'emoji': '🥶',
+        'mood': '瑟瑟发抖',
+        'reactions': [
+            '喵呜！好冷啊，我要钻被窝了！',
+            '喵呜！冻死喵了，我要开暖气！',
+            '喵呜！这么冷的天，我要穿毛衣了！',
+            '喵呜！我要去壁炉边取暖了！'
+        ]
+    },
+    'cold': {
+        'emoji': '😿',
+        'mood': '有点冷',
+        'reactions': [
+            '喵~ 有点冷，我要找个暖和的地方~',
+            '喵~ 温度有点低，我要去晒太阳了~',
+            '喵~ 好冷啊，我要去喝热牛奶了~',
+            '喵~ 这种天气最适合窝在主人怀里了~'
+        ]
+    },
+    'cool': {
+        'emoji': '😺',
+        'mood': '舒适',
+        'reactions': [
+            '喵~ 温度正好，适合打盹~',
+            '喵~ 这种天气最舒服了~',
+            '喵~ 温度真合适，我要去玩耍了~',
+            '喵~ 天气真好，我要去探险了~'
+        ]
+    },
+    'warm': {
+        'emoji': '😸',
+        'mood': '温暖',
+        'reactions': [
+            '喵~ 温度真舒服，我要去晒太阳了~',
+            '喵~ 暖暖的，我要去花园里打盹了~',
+            '喵~ 这种天气最适合在窗台上睡觉了~',
+            '喵~ 温度正好，我要去追蝴蝶了~'
+        ]
+    },
+    'hot': {
+        'emoji': '😅',
+        'mood': '有点热',
+        'reactions': [
+            '喵呜！好热啊，我要去阴凉处乘凉了！',
+            '喵呜！太热了，我要去吹空调了！',
+            '喵呜！这种天气最适合在风扇下睡觉了！',
+            '喵呜！我要去喝冰水了！'
+        ]
+    },
+    'scorching': {
+        'emoji': '🥵',
+        'mood': '热死了',
+        'reactions': [
+            '喵呜！热死喵了！我要去冰箱里避暑了！',
+            '喵呜！太热了，我要去游泳池了！',
+            '喵呜！这种天气最适合在空调房里睡觉了！',
+            '喵呜！我要去北极避暑了！'
+        ]
+    }
+}
+
+# 猫咪天气描述和性格评论
+CAT_DESCRIPTIONS = {
+    '晴': [
+        '喵~ 今天是个晒太阳的好日子！',
+        '喵~ 阳光正好，适合在窗台上打盹~',
+        '喵~ 太阳公公出来了，我要去晒肚皮了！',
+        '喵~ 这么好的天气，不睡个午觉太可惜了~'
+    ],
+    '多云': [
+        '喵~ 云朵遮住了太阳，但还是很舒服~',
+        '喵~ 多云天气，适合在沙发上打盹~',
+        '喵~ 云朵真漂亮，我要去追它们了~',
+        '喵~ 这种天气最适合睡觉了~'
+    ],
+    '阴': [
+        '喵~ 虽然没有太阳，但还是很舒服~',
+        '喵~ 阴天最适合在窗台上打盹了~',
+        '喵~ 这种天气最适合睡觉了~',
+        '喵~ 阴天也是好天气呢~'
+    ],
+    '雨': [
+        '喵~ 下雨了，还是待在屋里吧~',
+        '喵~ 雨滴打在窗户上的声音真好听~',
+        '喵~ 下雨天最适合窝在主人怀里了~',
+        '喵~ 雨声真催眠，我要去睡觉了~'
+    ],
+    '雪': [
+        '喵~ 下雪了！好想出去玩雪球~',
+        '喵~ 雪花真漂亮，我要去追它们了~',
+        '喵~ 雪地真软，我要去踩脚印了~',
+        '喵~ 下雪天最适合在壁炉边打盹了~'
+    ],
+    '雷': [
+        '喵呜！打雷了，好可怕！',
+        '喵呜！我要躲到床底下了！',
+        '喵呜！闪电好可怕，我要抱抱！',
+        '喵呜！这种天气最适合躲在被窝里了！'
+    ],
+    '雾': [
+        '喵~ 雾蒙蒙的，要小心走路哦~',
+        '喵~ 雾好大，我要去探险了~',
+        '喵~ 雾天最适合玩捉迷藏了~',
+        '喵~ 雾里的世界好神秘啊~'
+    ]
+}
+
+# 温度分段：bisect_right(TEMPERATURE_BOUNDS, 温度)得到的下标对应TEMPERATURE_BANDS中的情绪
+TEMPERATURE_BOUNDS = (0, 10, 20, 30, 35)
+TEMPERATURE_BANDS = tuple(
+    TEMPERATURE_MOODS[name] for name in ('freezing', 'cold', 'cool', 'warm', 'hot', 'scorching')
+)
+
+# 猫咪天气播报模板
+WEATHER_TEMPLATE = """
 喵喵喵~ 这里是{city}的天气播报喵~ {weather_emoji}
 
 {weather_comment}
 {temp_comment}
 
 {city}天气: {weather_type} {weather_emoji}
-温度: {temperature}°C {temp_mood['emoji']}
+温度: {temperature}°C {mood_emoji}
 湿度: {humidity}%
 风向: {wind_direction}
 风力: {wind_power}级
 
-喵~ 当前温度让我{temp_mood['mood']} {temp_mood['emoji']}
+喵~ 当前温度让我{mood} {mood_emoji}
 喵~ 记得多喝水，保持温暖哦！{weather_emoji}
 """
-        return cat_weather, None
+
+
+def compile_template(template):
+    """
+    把str.format风格的模板预编译为%格式串和字段取值器，渲染时无需再解析模板
+
+    参数:
+        template (str): 只包含简单{字段名}占位符的模板
+
+    返回:
+        callable: 接收字段字典并返回渲染结果的函数
+    """
+    literal_parts = []
+    fields = []
+    for literal, field, _, _ in Formatter().parse(template):
+        literal_parts.append(literal.replace('%', '%%'))
+        if field is not None:
+            literal_parts.append('%s')
+            fields.append(field)
+    fmt = ''.join(literal_parts)
+    getter = itemgetter(*fields)
+    return lambda values: fmt % getter(values)
+
+
+class CatWeatherFormatter:
+    """把实况天气数据格式化为猫咪风格的播报文本，所有查找表在构造时预先计算"""
+
+    def __init__(self, rng=None):
+        """
+        参数:
+            rng (random.Random): 随机数生成器，测试时可传入固定种子的实例使输出确定
+        """
+        self.rng = rng or random.Random()
+        self._render = compile_template(WEATHER_TEMPLATE)
+        # 每种天气对应的(表情, 评论元组)，未知天气使用晴天的描述
+        self._weather_types = {
+            weather_type: (CAT_EMOJIS.get(weather_type, '😺'), tuple(comments))
+            for weather_type, comments in CAT_DESCRIPTIONS.items()
+        }
+        self._default_weather = ('😺', tuple(CAT_DESCRIPTIONS['晴']))
+        # 每个温度分段对应的(表情, 情绪, 反应元组)
+        self._bands = tuple(
+            (band['emoji'], band['mood'], tuple(band['reactions'])) for band in TEMPERATURE_BANDS
+        )
+
+    def temperature_band(self, temperature):
+        """返回温度所在分段的(表情, 情绪, 反应元组)"""
+        return self._bands[bisect_right(TEMPERATURE_BOUNDS, temperature)]
+
+    def format(self, city, weather_data):
+        """
+        格式化实况天气
+
+        参数:
+            city (str): 城市名称
+            weather_data (dict): 高德实况天气数据
+
+        返回:
+            str: 猫咪友好的天气信息
+        """
+        weather_type = weather_data['weather']
+        temperature = float(weather_data['temperature'])
+        mood_emoji, mood, reactions = self.temperature_band(temperature)
+        weather_emoji, comments = self._weather_types.get(weather_type, self._default_weather)
+        temp_comment = self.rng.choice(reactions)
+        weather_comment = self.rng.choice(comments)
+        return self._render({
+            'city': city,
+            'weather_type': weather_type,
+            'weather_emoji': weather_emoji,
+            'weather_comment': weather_comment,
+            'temp_comment': temp_comment,
+            'temperature': temperature,
+            'mood': mood,
+            'mood_emoji': mood_emoji,
+            'humidity': weather_data['humidity'],
+            'wind_direction': weather_data['winddirection'],
+            'wind_power': weather_data['windpower']
+        })
+
+
+# 模块级共享的格式化器
+formatter = CatWeatherFormatter()
+
+
+def set_rng(rng):
+    """替换格式化器使用的随机数生成器，用于让测试输出确定"""
+    formatter.rng = rng
+
+
+def format_live_weather(city, weather_data):
+    """
+    把实况天气数据格式化为get_weather的返回值
+
+    返回:
+        tuple: (猫咪友好的天气信息, 错误信息)
+    """
+    # 检查响应状态
+    if not weather_data:
+        return None, "喵呜！获取天气信息失败，请稍后再试喵~"
+    
+    # 构建猫咪友好的天气信息
+    return formatter.format(city, weather_data), None
+
+
+WEEKDAYS = '一二三四五六日'
+
+
+def describe_cast(cast):
+    """
+    把一天的预报格式化为一行猫咪播报
+
+    参数:
+        cast (dict): 高德逐日预报
+
+    返回:
+        str: 例如"2024-06-01 周六 晴转多云 18~27°C 😺"
+    """
+    day_weather, night_weather = cast['dayweather'], cast['nightweather']
+    weather_type = day_weather if day_weather == night_weather else f"{day_weather}转{night_weather}"
+    weather_emoji = CAT_EMOJIS.get(day_weather, '😺')
+    mood_emoji = formatter.temperature_band(float(cast['daytemp']))[0]
+    week = WEEKDAYS[int(cast['week']) - 1] if cast.get('week', '').isdigit() else cast.get('week', '')
+    return (f"{cast['date']} 周{week} {weather_type} {weather_emoji} "
+            f"{cast['nighttemp']}~{cast['daytemp']}°C {mood_emoji}")
+
+
+def format_forecast(city, casts):
+    """
+    把逐日预报格式化为与get_weather相同形式的返回值
+
+    返回:
+        tuple: (猫咪友好的天气预报, 错误信息)
+    """
+    if not casts:
+        return None, "喵呜！获取天气预报失败，请稍后再试喵~"
+    lines = [f"喵喵喵~ 这里是{city}未来{len(casts)}天的天气预报喵~", '']
+    lines += [describe_cast(cast) for cast in casts]
+    lines += ['', '喵~ 出门前记得看看天气，带好雨伞和水哦！']
+    return '\n'.join(lines), None
+
+
+def get_weather(city):
+    """
+    使用高德天气API获取指定城市的当前天气信息，以猫咪友好的方式展示
+    
+    参数:
+        city (str): 城市名称
+    
+    返回:
+        str: 猫咪友好的天气信息
+    """
+    if not AMAP_KEY:
+        return None, "喵呜！天气API密钥未配置，请检查.env文件喵~"
+    
+    try:
+        # 获取实况天气（带缓存）
+        weather_data = get_live_weather(AMAP_KEY, city)
+        
+        return format_live_weather(city, weather_data)
         
     except requests.exceptions.RequestException as e:
         return None, f"喵呜！网络出问题了: {e}"